@@ -0,0 +1,83 @@
+"""
+Microbenchmark du coût de préparation d'une requête RAG (hors appels LLM et recherche).
+
+Compare l'ancienne construction par requête (wrapper Chroma, PromptTemplate et
+ConversationalRetrievalChain.from_llm) aux chaînes et retrievers mis en cache.
+Un client Chroma en mémoire, des embeddings factices et un LLM factice sont utilisés
+pour ne mesurer que la préparation.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_chain_setup --iterations 200
+"""
+import argparse
+import time
+import uuid
+
+import chromadb
+from chromadb.config import Settings
+from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
+from langchain.prompts import PromptTemplate
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.rag import chain, vectorstore
+
+
+def legacy_setup(active_document_uids):
+    """Reproduit la préparation effectuée à chaque message avant la mise en cache."""
+    store = Chroma(
+        client=vectorstore.get_chroma_client(),
+        collection_name=vectorstore.active_collection_name(),
+        embedding_function=vectorstore.get_embedding_function(),
+    )
+    retriever = store.as_retriever(
+        search_kwargs={"k": 7, "filter": {"document_uid": {"$in": active_document_uids}}}
+    )
+    qa_prompt = PromptTemplate(template=chain.template_arabe, input_variables=["context", "question"])
+    return ConversationalRetrievalChain.from_llm(
+        llm=chain.get_llm(),
+        retriever=retriever,
+        return_source_documents=True,
+        combine_docs_chain_kwargs={"prompt": qa_prompt},
+    )
+
+
+def cached_setup(active_document_uids):
+    """Préparation actuelle : composants partagés et retriever issu du cache LRU."""
+    chain.get_condense_question_chain()
+    chain.get_answer_chain()
+    return vectorstore.get_filtered_retriever(active_document_uids, k=7)
+
+
+def measure(setup, document_sets, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        setup(document_sets[i % len(document_sets)])
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--conversations", type=int, default=10, help="Nombre d'ensembles de documents distincts")
+    args = parser.parse_args()
+
+    # Composants factices : seule la préparation est mesurée
+    vectorstore._chroma_client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    vectorstore._embedding_function = DeterministicFakeEmbedding(size=768)
+    chain._llm_instance = FakeListChatModel(responses=["..."])
+
+    document_sets = [[str(uuid.uuid4()) for _ in range(3)] for _ in range(args.conversations)]
+
+    legacy_ms = measure(legacy_setup, document_sets, args.iterations)
+    cached_ms = measure(cached_setup, document_sets, args.iterations)
+
+    print(f"Itérations : {args.iterations} ({args.conversations} ensembles de documents)")
+    print(f"Avant (construction par requête) : {legacy_ms:.3f} ms/requête")
+    print(f"Après (chaînes et retrievers en cache) : {cached_ms:.3f} ms/requête")
+    print(f"Gain : x{legacy_ms / cached_ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
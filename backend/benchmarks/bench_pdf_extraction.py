@@ -0,0 +1,57 @@
+"""
+Benchmark de l'extraction de texte des PDF : PyPDFLoader (séquentiel) contre
+ParallelPyPDFLoader (plages de pages réparties sur un pool de processus).
+
+Le pool est démarré avant la mesure, comme lors d'une indexation de plusieurs
+fichiers où son coût de démarrage n'est payé qu'une fois.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_pdf_extraction --pages 400 --workers 4 --shard 16
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+
+from src.rag.pdf import ParallelPyPDFLoader, extraire_pages, get_pdf_executor, shutdown_pdf_executor
+from tests.helpers import write_text_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard", type=int, default=16, help="Pages par plage")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "synthetique.pdf")
+        write_text_pdf(path, args.pages)
+
+        start = time.perf_counter()
+        sequential = PyPDFLoader(path).load()
+        sequential_seconds = time.perf_counter() - start
+
+        # Démarrage de tous les processus du pool hors mesure
+        executor = get_pdf_executor(args.workers)
+        for future in [executor.submit(extraire_pages, path, 0, 1) for _ in range(args.workers)]:
+            future.result()
+        loader = ParallelPyPDFLoader(path, workers=args.workers, pages_per_shard=args.shard, min_pages=0)
+        start = time.perf_counter()
+        parallel = list(loader.lazy_load())
+        parallel_seconds = time.perf_counter() - start
+        shutdown_pdf_executor()
+
+    assert [page.page_content for page in parallel] == [page.page_content for page in sequential]
+    timings = sorted(loader.page_seconds.values())
+    print(f"PyPDFLoader         : {sequential_seconds:.2f}s ({len(sequential)} pages)")
+    print(f"ParallelPyPDFLoader : {parallel_seconds:.2f}s ({args.workers} processus, plages de {args.shard} pages)")
+    print(f"Extraction par page : médiane {1000 * statistics.median(timings):.1f} ms, "
+          f"p95 {1000 * timings[int(0.95 * (len(timings) - 1))]:.1f} ms, max {1000 * timings[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
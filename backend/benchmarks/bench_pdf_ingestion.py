@@ -0,0 +1,95 @@
+"""
+Benchmark mémoire de l'ingestion d'un long PDF.
+
+Compare le pic de mémoire (tracemalloc) de l'ancienne ingestion, qui charge toutes
+les pages, les découpe, calcule tous les embeddings puis écrit en un seul appel,
+à l'ingestion par fenêtres de pages (iter_split_windows + index_chunks). Des PDF
+synthétiques de tailles croissantes sont générés : le pic de l'ingestion par
+fenêtres doit rester stable quand le nombre de pages augmente.
+
+Les embeddings sont factices (768 dimensions, comme le modèle mpnet) et la
+collection ChromaDB est en mémoire ; tracemalloc ne mesure que les allocations
+Python (pas celles de la partie native de ChromaDB).
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_pdf_ingestion --pages 100 400 900 --window 32
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import chromadb
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.incremental import content_chunk_ids
+from src.rag.loader import charger_fichier, iter_split_windows, split_documents
+from src.rag.pipeline import index_chunks
+from tests.helpers import write_text_pdf
+
+EMBEDDING_SIZE = 768
+
+
+def _collection(name):
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    return client.create_collection(name)
+
+
+def legacy_ingestion(path, collection, embeddings, window):
+    """Ancienne ingestion : toutes les pages, tous les fragments et tous les embeddings en mémoire."""
+    chunks = split_documents(charger_fichier(path))
+    vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks])
+    collection.upsert(
+        ids=content_chunk_ids(path, chunks),
+        embeddings=vectors,
+        documents=[chunk.page_content for chunk in chunks],
+        metadatas=[chunk.metadata for chunk in chunks],
+    )
+    return len(chunks)
+
+
+def windowed_ingestion(path, collection, embeddings, window):
+    """Ingestion par fenêtres de pages : extraction, découpage, embeddings et écriture au fil de l'eau."""
+    def chunks():
+        seen = {}
+        for split_docs in iter_split_windows(path, pages_per_window=window):
+            yield from zip(content_chunk_ids(path, split_docs, seen), split_docs)
+
+    return index_chunks(chunks(), collection=collection, embedding_factory=lambda: embeddings, workers=1).indexed
+
+
+def measure(ingest, path, window):
+    collection = _collection("bench-pdf-ingestion")
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_SIZE)
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = ingest(path, collection, embeddings, window)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chunks, seconds, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 400, 900])
+    parser.add_argument("--window", type=int, default=32, help="Pages par fenêtre")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'pages':>6} {'mode':>10} {'fragments':>10} {'temps (s)':>10} {'pic (Mo)':>10}")
+        for pages in args.pages:
+            path = os.path.join(tmp_dir, f"synthetique_{pages}.pdf")
+            write_text_pdf(path, pages)
+            for name, ingest in (("complet", legacy_ingestion), ("fenêtres", windowed_ingestion)):
+                chunks, seconds, peak = measure(ingest, path, args.window)
+                print(f"{pages:>6} {name:>10} {chunks:>10} {seconds:>10.2f} {peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
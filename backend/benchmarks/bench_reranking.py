@@ -0,0 +1,99 @@
+"""
+Benchmark du reclassement des fragments par cross-encoder.
+
+Pour chaque question (début d'un passage tapé comme par un utilisateur), les
+candidats sont recherchés par similarité d'embeddings, puis :
+
+- sans reclassement : les 7 premiers fragments vont dans le prompt ;
+- avec reclassement : les candidats sont évalués par le cross-encoder et les
+  RAG_RERANK_TOP_N meilleurs sont conservés.
+
+Le benchmark mesure la latence du reclassement (p50, p95, part des requêtes
+au-delà de RAG_RERANK_BUDGET_MS) pour chaque backend, les tokens de contexte
+économisés dans le prompt et le taux de présence du passage attendu.
+
+Le modèle "ngram" (hors ligne) ou "hf" (modèle d'embedding de l'application) sert
+à la recherche ; le cross-encoder (RAG_RERANK_MODEL) doit être téléchargeable ou en cache.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_reranking --candidates 30 --backends onnx-int8 onnx torch
+"""
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from benchmarks.bench_arabic_normalization import NgramEmbeddings, charger_passages, question_utilisateur
+from src.config import Config
+from src.rag.chain import RETRIEVER_K
+from src.rag.embeddings import NormalizedEmbeddings
+from src.rag.reranker import RERANK_BACKENDS, CrossEncoderReranker, load_cross_encoder
+from src.rag.splitter import get_token_counter
+from src.rag.vectorstore import EMBEDDING_MODEL_NAME
+
+
+def rechercher(model, passages, queries, candidates):
+    documents = np.asarray(model.embed_documents(passages), dtype=np.float32)
+    documents /= np.clip(np.linalg.norm(documents, axis=1, keepdims=True), 1e-9, None)
+    results = []
+    for query in queries:
+        vector = np.asarray(model.embed_query(query), dtype=np.float32)
+        results.append(np.argsort(-(documents @ vector))[:candidates].tolist())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=Config.RAG_RERANK_CANDIDATES)
+    parser.add_argument("--top-n", type=int, default=Config.RAG_RERANK_TOP_N)
+    parser.add_argument("--backends", nargs="+", choices=RERANK_BACKENDS, default=["onnx-int8"])
+    parser.add_argument("--model", choices=("ngram", "hf"), default="ngram")
+    parser.add_argument("--corpus", help="Dossier de fichiers .txt (passages séparés par une ligne vide)")
+    args = parser.parse_args()
+
+    passages = charger_passages(args.corpus)
+    queries = [question_utilisateur(passage) for passage in passages]
+    if args.model == "hf":
+        from src.rag.vectorstore import load_embedding_model
+        model = load_embedding_model(Config.EMBEDDING_BACKEND)
+    else:
+        model = NormalizedEmbeddings(NgramEmbeddings())
+    rankings = rechercher(model, passages, queries, args.candidates)
+    count_tokens = get_token_counter(EMBEDDING_MODEL_NAME)
+    passage_tokens = count_tokens(passages)
+
+    def resume(name, kept, latencies=None):
+        tokens = np.mean([sum(passage_tokens[i] for i in ids) for ids in kept])
+        hit = np.mean([expected in ids for expected, ids in enumerate(kept)])
+        line = f"{name:>18} {tokens:>14.0f} {hit:>8.2f}"
+        if latencies is not None:
+            budget = Config.RAG_RERANK_BUDGET_MS
+            over = np.mean([latency > budget for latency in latencies])
+            line += f" {np.percentile(latencies, 50):>9.0f} {np.percentile(latencies, 95):>9.0f} {over:>10.0%}"
+        print(line)
+
+    print(f"{len(queries)} questions, {args.candidates} candidats, recherche {args.model}, "
+          f"budget {Config.RAG_RERANK_BUDGET_MS} ms")
+    print(f"{'':>18} {'tokens contexte':>14} {'présence':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'hors budget':>10}")
+    resume(f"top {RETRIEVER_K} (sans)", [ids[:RETRIEVER_K] for ids in rankings])
+
+    for backend in args.backends:
+        try:
+            reranker = CrossEncoderReranker(load_cross_encoder(backend))
+        except Exception as e:
+            print(f"{backend:>18} cross-encoder indisponible : {e}")
+            continue
+        reranker.rank(queries[0], [Document(page_content=passages[0])], 1)  # Préchauffage
+        kept, latencies = [], []
+        for query, ids in zip(queries, rankings):
+            candidates = [Document(page_content=passages[i], metadata={"index": i}) for i in ids]
+            start = time.perf_counter()
+            ranked = reranker.rank(query, candidates, args.top_n)
+            latencies.append((time.perf_counter() - start) * 1000)
+            kept.append([doc.metadata["index"] for doc in ranked])
+        resume(f"{backend} top {args.top_n}", kept, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark du découpage des documents : ancien découpage en caractères
+(RecursiveCharacterTextSplitter, 1000 caractères, chevauchement 100) contre le
+découpage en tokens du modèle d'embedding (ArabicTokenSplitter).
+
+Pour chaque découpeur : durée, nombre de fragments, taux de fragments tronqués
+au calcul des embeddings (plus de MAX_SEQ_LENGTH tokens, tokens spéciaux compris)
+et part des tokens que le modèle ne voit jamais.
+
+Le corpus par défaut est data/fiqh_docs ; s'il est absent, les passages du
+benchmark de normalisation sont répétés. Sans accès au tokenizer du modèle,
+les tokens sont estimés (voir estimer_tokens) et les résultats le signalent.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_text_splitter --corpus data/fiqh_docs
+"""
+import argparse
+import os
+import time
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from benchmarks.bench_arabic_normalization import PASSAGES
+from src.config import Config
+from src.rag.loader import charger_fichier, lister_fichiers
+from src.rag.onnx_embeddings import MAX_SEQ_LENGTH
+from src.rag.splitter import ArabicTokenSplitter, compteur_estime, get_token_counter
+from src.rag.vectorstore import EMBEDDING_MODEL_NAME
+
+# <s> et </s> ajoutés par le tokenizer au calcul des embeddings
+SPECIAL_TOKENS = 2
+
+
+def charger_corpus(corpus_dir):
+    if os.path.isdir(corpus_dir):
+        documents = [doc for path in lister_fichiers(corpus_dir) for doc in charger_fichier(path)]
+        if documents:
+            return documents, corpus_dir
+    text = "\n\n".join(PASSAGES * 20)
+    return [Document(page_content=text, metadata={"source": "synthetique"})] * 50, "passages synthétiques"
+
+
+def mesurer(splitter, documents, count_tokens):
+    start = time.perf_counter()
+    chunks = splitter.split_documents(documents)
+    seconds = time.perf_counter() - start
+    tokens = count_tokens([chunk.page_content for chunk in chunks])
+    budget = MAX_SEQ_LENGTH - SPECIAL_TOKENS
+    truncated = sum(1 for n in tokens if n > budget)
+    unseen = sum(max(0, n - budget) for n in tokens)
+    return seconds, len(chunks), truncated / max(1, len(chunks)), unseen / max(1, sum(tokens))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join("data", "fiqh_docs"))
+    args = parser.parse_args()
+
+    documents, origin = charger_corpus(args.corpus)
+    count_tokens = get_token_counter(EMBEDDING_MODEL_NAME)
+    tokenizer = "estimation" if count_tokens is compteur_estime else EMBEDDING_MODEL_NAME
+    print(f"Corpus : {origin} ({len(documents)} documents) ; tokens : {tokenizer}")
+
+    splitters = {
+        "caractères (1000/100)": RecursiveCharacterTextSplitter(
+            chunk_size=1000, chunk_overlap=100, length_function=len, is_separator_regex=False,
+            separators=["\n\n", "\n", ". ", "، ", "؛ ", " ", ""],
+        ),
+        f"tokens ({Config.SPLITTER_CHUNK_TOKENS}/{Config.SPLITTER_OVERLAP_TOKENS})": ArabicTokenSplitter(
+            count_tokens, chunk_size=Config.SPLITTER_CHUNK_TOKENS, chunk_overlap=Config.SPLITTER_OVERLAP_TOKENS,
+        ),
+    }
+    print(f"{'découpeur':>24} {'temps (s)':>10} {'fragments':>10} {'tronqués':>9} {'tokens perdus':>14}")
+    for name, splitter in splitters.items():
+        seconds, count, truncated, unseen = mesurer(splitter, documents, count_tokens)
+        print(f"{name:>24} {seconds:>10.2f} {count:>10} {truncated:>9.1%} {unseen:>14.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark de la recherche vectorielle partagée (une collection, filtre "document_uid")
+contre les partitions par document (VECTOR_PARTITION_MODE="document").
+
+Pour chaque taille totale de base, N fragments sont répartis en documents de
+--chunks-per-document fragments, écrits à la fois dans une collection partagée et
+dans une collection par document. Chaque requête simule une conversation ayant
+--active documents actifs : la collection partagée est interrogée avec le filtre
+"$in", les partitions sans filtre (PartitionedRetriever), en séquence puis en
+parallèle (--workers threads, VECTOR_PARTITION_SEARCH_WORKERS).
+
+Le benchmark mesure la latence (p50, p95, après un passage de préchauffage) et le
+rappel des k fragments retournés par rapport à la recherche exacte (numpy) parmi
+les fragments des documents actifs. Les embeddings sont aléatoires (normalisés) :
+aucun modèle n'est chargé.
+
+La base est écrite dans un dossier temporaire (--path pour le choisir) ; à 1M de
+fragments en dimension 768, prévoir plusieurs Go de disque et de mémoire.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_vector_partitions --sizes 10000 100000 1000000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag.partitions import PartitionedRetriever, ecrire_partition
+from src.rag.vectorstore import COLLECTION_NAME
+
+WRITE_BATCH_SIZE = 5000
+
+
+class VecteurFixe:
+    """Embeddings de requête préparés à l'avance (aucun modèle)."""
+
+    def __init__(self):
+        self.vector = None
+
+    def embed_query(self, text):
+        return self.vector
+
+
+def vecteurs_document(document_index, count, dim):
+    """Embeddings déterministes des fragments d'un document (recalculables pour la vérité terrain)."""
+    vectors = np.random.default_rng(document_index).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def remplir(client, documents, per_document, dim):
+    """
+    Écrit chaque document dans la collection partagée et dans sa partition.
+
+    Returns:
+        (collection partagée, durée d'écriture partagée, durée d'écriture des partitions)
+    """
+    shared = client.create_collection(COLLECTION_NAME)
+    pending_ids, pending_vectors, pending_metadatas = [], [], []
+    seconds = {"partagé": 0.0, "partitions": 0.0}
+
+    def flush():
+        if pending_ids:
+            start = time.perf_counter()
+            shared.add(ids=pending_ids, embeddings=np.concatenate(pending_vectors), metadatas=pending_metadatas)
+            seconds["partagé"] += time.perf_counter() - start
+            pending_ids.clear(), pending_vectors.clear(), pending_metadatas.clear()
+
+    for index in range(documents):
+        document_uid = f"doc{index}"
+        ids = [f"{document_uid}_{i}" for i in range(per_document)]
+        vectors = vecteurs_document(index, per_document, dim)
+        chunks = [Document(page_content="", metadata={"document_uid": document_uid})] * per_document
+        start = time.perf_counter()
+        ecrire_partition(client, document_uid, ids, vectors, chunks)
+        seconds["partitions"] += time.perf_counter() - start
+        pending_ids.extend(ids)
+        pending_vectors.append(vectors)
+        pending_metadatas.extend([{"document_uid": document_uid}] * per_document)
+        if len(pending_ids) >= WRITE_BATCH_SIZE:
+            flush()
+    flush()
+    return shared, seconds
+
+
+def mesurer(search, conversations, queries, truth):
+    latencies, recalls = [], []
+    for passe in range(2):  # Préchauffage (chargement des segments HNSW), puis mesure
+        for conversation, query in zip(conversations, queries):
+            start = time.perf_counter()
+            ids = search(conversation, query)
+            if passe:
+                latencies.append((time.perf_counter() - start) * 1000)
+                expected = truth[(conversation, query.tobytes())]
+                recalls.append(len(set(ids) & expected) / len(expected))
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), np.mean(recalls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--chunks-per-document", type=int, default=50)
+    parser.add_argument("--active", type=int, default=3, help="Documents actifs par conversation")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=Config.VECTOR_PARTITION_SEARCH_WORKERS,
+                        help="Partitions interrogées en parallèle")
+    parser.add_argument("--path", help="Dossier de la base de test (temporaire par défaut)")
+    args = parser.parse_args()
+
+    print(f"dimension {args.dim}, {args.chunks_per_document} fragments/document, "
+          f"{args.active} documents actifs, k={args.k}, {args.queries} requêtes")
+    print(f"{'fragments':>10} {'mode':>18} {'écriture (s)':>12} {'p50 (ms)':>9} {'p95 (ms)':>9} {'rappel':>7}")
+    for size in args.sizes:
+        path = args.path or tempfile.mkdtemp(prefix="bench_partitions_")
+        client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        documents = max(args.active, size // args.chunks_per_document)
+        try:
+            shared, write_seconds = remplir(client, documents, args.chunks_per_document, args.dim)
+
+            rng = np.random.default_rng(0)
+            conversations = [tuple(f"doc{i}" for i in sorted(rng.choice(documents, args.active, replace=False)))
+                             for _ in range(args.queries)]
+            queries = [vecteurs_document(10**9 + i, 1, args.dim)[0] for i in range(args.queries)]
+            truth = {}
+            for conversation, query in zip(conversations, queries):
+                candidates = {f"{uid}_{i}": vector for uid in conversation for i, vector in
+                              enumerate(vecteurs_document(int(uid[3:]), args.chunks_per_document, args.dim))}
+                ids = list(candidates)
+                distances = np.linalg.norm(np.stack(list(candidates.values())) - query, axis=1)
+                truth[(conversation, query.tobytes())] = {ids[i] for i in np.argsort(distances)[:args.k]}
+
+            def shared_search(conversation, query):
+                result = shared.query(query_embeddings=[query], n_results=args.k,
+                                      where={"document_uid": {"$in": list(conversation)}}, include=[])
+                return result["ids"][0]
+
+            embeddings = VecteurFixe()
+            retrievers = {}  # Un retriever par ensemble de documents, comme le cache de get_filtered_retriever
+
+            def partitioned_search(conversation, query):
+                embeddings.vector = query.tolist()
+                if conversation not in retrievers:
+                    retrievers[conversation] = PartitionedRetriever(
+                        client=client, embeddings=embeddings, document_uids=conversation, k=args.k
+                    )
+                return [doc.id for doc in retrievers[conversation].invoke("")]
+
+            for mode, search, workers in (
+                ("partagé", shared_search, None),
+                ("partitions", partitioned_search, 1),
+                (f"partitions ({args.workers} th)", partitioned_search, args.workers),
+            ):
+                if workers is not None:
+                    Config.VECTOR_PARTITION_SEARCH_WORKERS = workers
+                p50, p95, recall = mesurer(search, conversations, queries, truth)
+                written = write_seconds["partagé" if workers is None else "partitions"]
+                print(f"{size:>10} {mode:>18} {written:>12.1f} {p50:>9.2f} {p95:>9.2f} {recall:>7.2f}")
+        finally:
+            del client
+            if not args.path:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
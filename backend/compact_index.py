@@ -0,0 +1,28 @@
+import argparse
+import logging
+
+# Compaction de l'index vectoriel (segment HNSW reconstruit à partir des fragments vivants)
+# et vacuum des bases SQLite ; planifiée par Celery beat (VECTOR_COMPACTION_INTERVAL_HOURS)
+from src.rag.maintenance import compacter_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compaction de l'index vectoriel ChromaDB et vacuum SQLite")
+    parser.add_argument("--grace", type=float, help="Délai (s) avant la suppression de l'ancienne collection")
+    parser.add_argument("--no-vacuum", action="store_true", help="Ne pas récupérer les pages libres des fichiers SQLite")
+    args = parser.parse_args()
+
+    report = compacter_index(grace_seconds=args.grace, vacuum=not args.no_vacuum)
+    logger.info(f"Collection : {report.collection_before} -> {report.collection_after} "
+                f"(bascule {report.swap_ms:.1f} ms, {report.replicated_chunks} écriture(s) reprise(s), {report.seconds:.1f} s)")
+    for label, attribute, unit, scale in (
+        ("fragments", "chunks", "", 1),
+        ("dossier ChromaDB", "disk_bytes", " Mo", 1024 * 1024),
+        ("pages libres SQLite", "sqlite_free_bytes", " Mo", 1024 * 1024),
+        ("index lexical", "lexical_bytes", " Mo", 1024 * 1024),
+        (f"recherche p50 ({len(report.sample)} requêtes perturbées)", "query_p50_ms", " ms", 1),
+    ):
+        before, after = getattr(report.before, attribute) / scale, getattr(report.after, attribute) / scale
+        logger.info(f"{label} : {before:.2f}{unit} avant, {after:.2f}{unit} après")
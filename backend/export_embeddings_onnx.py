@@ -0,0 +1,15 @@
+# export_embeddings_onnx.py
+import logging
+
+# Export du modèle d'embedding au format ONNX (fp32 et int8) pour EMBEDDING_BACKEND="onnx" / "onnx-int8"
+from src.config import Config
+from src.rag.onnx_embeddings import export_onnx_model, onnx_model_dir
+from src.rag.vectorstore import EMBEDDING_MODEL_NAME
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    output_dir = onnx_model_dir(Config.EMBEDDING_ONNX_DIR, EMBEDDING_MODEL_NAME)
+    export_onnx_model(EMBEDDING_MODEL_NAME, output_dir, quantize=True)
+    logger.info(f"Modèles ONNX disponibles dans {output_dir}")
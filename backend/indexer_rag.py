@@ -1,24 +1,42 @@
 # indexer_rag.py
 import os
+import argparse
 import logging
 import time
 
 # Importation des modules RAG pour le traitement des documents
-from src.rag.loader import charger_documents, split_documents
-from src.rag.vectorstore import add_documents_to_vectorstore, CHROMA_DB_PATH, COLLECTION_NAME
+from src.rag.incremental import IndexManifest, indexer_incremental, marquer_corpus
+from src.rag.lexical import get_lexical_index, reconstruire_index_lexical
+from src.rag.maintenance import verrou_index
+from src.rag.partitions import migrer_vers_partitions
+from src.rag.pdf import shutdown_pdf_executor
+from src.rag.vectorstore import (
+    CHROMA_DB_PATH, CORPUS_METADATA_KEY, MANIFEST_FILE, active_collection_name, get_chroma_client, get_collection,
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Chemin vers le dossier contenant les documents sources à indexer
 SOURCE_DOCS_PATH = os.path.join("data", "fiqh_docs")
+# Manifeste de l'indexation (fichier -> empreinte -> IDs des fragments), stocké avec la base qu'il décrit
+MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, MANIFEST_FILE)
 
-def indexer():
+def indexer(full: bool = False, rebuild_lexical: bool = False, migrate_partitions: bool = False):
     """
-    Processus complet d'indexation des documents :
-    1. Charge les documents depuis le dossier source
-    2. Découpe les documents en fragments pour optimiser la recherche
-    3. Indexe les fragments dans la base de données vectorielle ChromaDB
+    Processus d'indexation incrémentale des documents :
+    1. Remplit l'index lexical (BM25) depuis ChromaDB s'il est vide ou si demandé,
+       et marque les fragments du corpus déjà indexés pour la recherche fédérée
+    2. Compare le dossier source au manifeste (empreintes des fichiers)
+    3. Charge et découpe uniquement les fichiers nouveaux ou modifiés
+    4. Indexe les nouveaux fragments et supprime les vecteurs des fragments et fichiers disparus
+       (sans manifeste, ou après un changement de INDEX_VERSION : tous les vecteurs du corpus
+       absents du nouveau manifeste, dont les anciens IDs "unknown_<i>")
+
+    Args:
+        full: Retraiter tous les fichiers, même inchangés
+        rebuild_lexical: Reconstruire l'index lexical à partir de ChromaDB
+        migrate_partitions: Déplacer les documents uploadés vers leurs partitions (VECTOR_PARTITION_MODE="document")
     """
     logger.info("--- Démarrage du processus d'indexation RAG ---")
 
@@ -27,52 +45,36 @@ def indexer():
         logger.error(f"Le dossier source '{SOURCE_DOCS_PATH}' n'existe pas. Veuillez créer ce dossier et y ajouter vos documents.")
         return
 
-    # Étape 1 : Chargement des documents depuis le système de fichiers
-    start_time = time.time()
-    logger.info(f"Étape 1/3 : Chargement des documents depuis '{SOURCE_DOCS_PATH}'...")
-    try:
-        documents = charger_documents(SOURCE_DOCS_PATH)
-    except Exception as e:
-        logger.error(f"Erreur lors du chargement des documents: {e}", exc_info=True)
-        return
-    
-    # Vérification que des documents ont été trouvés
-    if not documents:
-        logger.warning("Aucun document n'a été chargé. Vérifiez le contenu du dossier source et les types de fichiers supportés.")
-        return
-    logger.info(f"Chargement terminé en {time.time() - start_time:.2f} secondes. {len(documents)} document(s) trouvé(s).")
-
-    # Étape 2 : Découpage des documents en fragments plus petits
     start_time = time.time()
-    logger.info("Étape 2/3 : Découpage des documents...")
+    logger.info(f"Indexation de '{SOURCE_DOCS_PATH}' dans ChromaDB (Collection: {active_collection_name()}, Path: {CHROMA_DB_PATH})...")
     try:
-        split_docs = split_documents(documents)
+        # Attend la fin d'une compaction en cours ; la compaction n'est pas lancée pendant l'indexation
+        with verrou_index():
+            collection = get_collection()
+            lexical_index = get_lexical_index()
+            # Base vectorielle antérieure à la recherche hybride : l'index lexical est rempli sans recalcul
+            if rebuild_lexical or (lexical_index.count() == 0 and collection.count() > 0):
+                reconstruire_index_lexical(collection, lexical_index)
+            # Fragments du corpus indexés avant la recherche fédérée : marqués sans recalcul
+            vectors_unmarked = not collection.get(where={CORPUS_METADATA_KEY: True}, limit=1, include=[])["ids"]
+            if collection.count() > 0 and (vectors_unmarked or lexical_index.count(corpus_only=True) == 0):
+                marquer_corpus(collection, IndexManifest(MANIFEST_PATH), lexical_index)
+            if migrate_partitions:
+                migrer_vers_partitions(get_chroma_client(), collection)
+            report = indexer_incremental(SOURCE_DOCS_PATH, MANIFEST_PATH, full=full)
     except Exception as e:
-        logger.error(f"Erreur lors du découpage des documents: {e}", exc_info=True)
+        logger.error(f"Erreur lors de l'indexation des documents: {e}", exc_info=True)
         return
+    finally:
+        # Arrêt des processus d'extraction des PDF
+        shutdown_pdf_executor()
 
-    logger.info(f"Nombre de fragments après découpage: {len(split_docs)}")
-
-    # Vérification que le découpage a produit des résultats
-    if not split_docs:
-         logger.warning("Aucun fragment n'a été généré après découpage.")
-         return
-    logger.info(f"Découpage terminé en {time.time() - start_time:.2f} secondes. {len(split_docs)} fragment(s) créé(s).")
-
-    # Étape 3 : Indexation dans la base de données vectorielle
-    start_time = time.time()
-    logger.info(f"Étape 3/3 : Ajout des documents au Vector Store ChromaDB (Collection: {COLLECTION_NAME}, Path: {CHROMA_DB_PATH})...")
-    logger.warning("Cette étape peut prendre plusieurs minutes en fonction du volume de documents et de la puissance de votre machine...")
-
-    try:
-        # Ajout des fragments au vectorstore avec génération automatique des embeddings
-        add_documents_to_vectorstore(split_docs)
-    except Exception as e:
-         logger.error(f"Erreur lors de l'ajout des documents au vectorstore: {e}", exc_info=True)
-         return
-    
-    logger.info(f"Ajout au vectorstore terminé en {time.time() - start_time:.2f} secondes.")
-
+    logger.info(
+        f"Indexation terminée en {time.time() - start_time:.2f} secondes : "
+        f"{report.changed_files} fichier(s) traité(s), {report.unchanged_files} inchangé(s), "
+        f"{report.removed_files} supprimé(s), {report.duplicate_chunks} quasi-doublon(s) écarté(s) "
+        f"({report.duplicate_bytes / 1024:.1f} Ko de texte non indexé)."
+    )
     logger.info("--- Processus d'indexation RAG terminé avec succès ! ---")
     logger.info(f"La base de données vectorielle se trouve dans : {os.path.abspath(CHROMA_DB_PATH)}")
 
@@ -83,5 +85,19 @@ if __name__ == "__main__":
     # Pour charger un fichier .env, décommentez les lignes suivantes :
     # from dotenv import load_dotenv
     # load_dotenv()
-    
-    indexer()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Indexation des documents de fiqh dans ChromaDB")
+    parser.add_argument("--full", action="store_true", help="Retraiter tous les fichiers, même inchangés")
+    parser.add_argument("--rebuild-lexical", action="store_true", help="Reconstruire l'index lexical (BM25) depuis ChromaDB")
+    parser.add_argument("--migrate-partitions", action="store_true",
+                        help="Déplacer les documents uploadés de la collection partagée vers leurs partitions")
+    parser.add_argument("--reindex-uploads", action="store_true",
+                        help="Envoyer aux workers Celery la réindexation des documents uploadés "
+                             "indexés par une version antérieure du traitement des textes")
+    args = parser.parse_args()
+
+    if args.reindex_uploads:
+        from src.celery_tasks import reindex_outdated_uploads
+        reindex_outdated_uploads.delay()
+        logger.info("Réindexation des documents uploadés envoyée à la file Celery")
+
+    indexer(full=args.full, rebuild_lexical=args.rebuild_lexical, migrate_partitions=args.migrate_partitions)
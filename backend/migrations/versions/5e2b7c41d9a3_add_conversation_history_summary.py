@@ -0,0 +1,29 @@
+"""Add conversation history summary
+
+Revision ID: 5e2b7c41d9a3
+Revises: 1a768c03688b
+Create Date: 2026-10-18 09:12:41.522310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b7c41d9a3'
+down_revision: Union[str, None] = '1a768c03688b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('history_summary', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'history_summary')
@@ -0,0 +1,35 @@
+"""Add document index status
+
+Revision ID: 8c1f4a6e2b7d
+Revises: 5e2b7c41d9a3
+Create Date: 2026-10-18 14:03:27.184392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1f4a6e2b7d'
+down_revision: Union[str, None] = '5e2b7c41d9a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Les documents existants ont été indexés pendant l'upload : ils sont prêts
+    op.add_column('documents', sa.Column('status', sa.VARCHAR(), server_default='ready', nullable=False))
+    op.alter_column('documents', 'status', server_default='pending')
+    op.add_column('documents', sa.Column('index_error', sa.Text(), nullable=True))
+    op.create_index(op.f('ix_documents_status'), 'documents', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_documents_status'), table_name='documents')
+    op.drop_column('documents', 'index_error')
+    op.drop_column('documents', 'status')
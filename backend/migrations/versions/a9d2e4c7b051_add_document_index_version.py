@@ -0,0 +1,30 @@
+"""Add document index version
+
+Revision ID: a9d2e4c7b051
+Revises: e7b3f0a94c12
+Create Date: 2026-10-18 22:31:54.208617
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d2e4c7b051'
+down_revision: Union[str, None] = 'e7b3f0a94c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Documents existants : version inconnue, réindexés par la tâche rag.reindex_outdated_uploads
+    op.add_column('documents', sa.Column('index_version', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'index_version')
@@ -0,0 +1,31 @@
+"""Add document indexing start time
+
+Revision ID: c5e1a7d3f208
+Revises: a9d2e4c7b051
+Create Date: 2026-10-19 10:12:37.514203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e1a7d3f208'
+down_revision: Union[str, None] = 'a9d2e4c7b051'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('indexing_started_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    # Documents en cours d'indexation : considérés comme abandonnés après INDEXING_STALE_SECONDS
+    op.execute("UPDATE documents SET indexing_started_at = now() WHERE status = 'indexing'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'indexing_started_at')
@@ -0,0 +1,34 @@
+"""Content-addressed document storage
+
+Revision ID: d4a8c2e6f913
+Revises: b3d9e5f17a2c
+Create Date: 2026-10-18 18:02:37.115482
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8c2e6f913'
+down_revision: Union[str, None] = 'b3d9e5f17a2c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('index_key', sa.VARCHAR(length=64), nullable=True))
+    op.create_index(op.f('ix_documents_index_key'), 'documents', ['index_key'], unique=False)
+    # Plusieurs documents peuvent désormais partager le même fichier (blob)
+    op.drop_constraint('documents_file_path_key', 'documents', type_='unique')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_unique_constraint('documents_file_path_key', 'documents', ['file_path'])
+    op.drop_index(op.f('ix_documents_index_key'), table_name='documents')
+    op.drop_column('documents', 'index_key')
@@ -0,0 +1,31 @@
+"""Add conversation history summary coverage
+
+Revision ID: e7b3f0a94c12
+Revises: d4a8c2e6f913
+Create Date: 2026-10-18 21:40:08.611204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3f0a94c12'
+down_revision: Union[str, None] = 'd4a8c2e6f913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('history_summary_until', sa.TIMESTAMP(timezone=True), nullable=True))
+    # Couverture des résumés existants inconnue : ils seront reconstruits
+    op.execute("UPDATE conversations SET history_summary = NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'history_summary_until')
@@ -7,6 +7,7 @@ from src.conversations.routes import conversation_router
 from .errors import register_all_errors
 from .middleware import register_middleware
 from src.rag.chain import initialize_rag_chain
+from src.rag.executors import shutdown_executors
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -45,6 +46,7 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("Arrêt de l'application FastAPI...")
+    shutdown_executors()
     print("INFO:     Application shutdown.")
 
 # Création de l'instance FastAPI
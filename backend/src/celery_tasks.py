@@ -0,0 +1,409 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from celery import Celery
+from celery.signals import worker_process_shutdown
+from sqlalchemy import false, text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import desc, or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config import Config
+from src.db.models import (
+    Conversation, Document, Message, DOCUMENT_STATUS_FAILED, DOCUMENT_STATUS_INDEXING, DOCUMENT_STATUS_PENDING,
+    DOCUMENT_STATUS_READY,
+)
+from src.rag.chain import summarize_history
+from src.rag.executors import run_ingestion
+from src.rag.ingestion import UPLOAD_INDEX_VERSION, indexer_fichier_uploade
+from src.rag.maintenance import CompactionBusyError, basculer_index, finaliser_compaction
+from src.rag.pdf import shutdown_pdf_executor
+from src.rag.vectorstore import delete_documents_from_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Attente d'une indexation en cours du même contenu (tâche relancée) avant de l'indexer soi-même
+INDEXING_WAIT_SECONDS = 30
+INDEXING_WAIT_RETRIES = 20
+
+c_app = Celery()
+c_app.config_from_object("src.config")
+
+
+@worker_process_shutdown.connect
+def _arreter_pool_pdf(**kwargs):
+    # Processus d'extraction PDF créés par ce worker (uploads volumineux)
+    shutdown_pdf_executor()
+
+
+def get_task_engine():
+    """
+    Moteur de base de données des tâches. Chaque tâche exécute sa propre boucle
+    asyncio : NullPool évite de réutiliser des connexions liées à une boucle terminée.
+    """
+    return create_async_engine(Config.DATABASE_URL, poolclass=NullPool)
+
+
+async def _set_document_status(session: AsyncSession, document: Document, status: str, error: str = None) -> None:
+    document.status = status
+    document.index_error = error
+    if status == DOCUMENT_STATUS_INDEXING:
+        document.indexing_started_at = datetime.utcnow()
+    session.add(document)
+    await session.commit()
+
+
+async def find_indexed_copy(
+    session: AsyncSession, index_key: str, exclude_uid: uuid.UUID = None, status: str = DOCUMENT_STATUS_READY
+):
+    """
+    Document de même contenu à l'état `status` : par défaut un document déjà indexé ("ready"),
+    dont les vecteurs peuvent être partagés. Une indexation ("indexing") commencée depuis plus
+    de INDEXING_STALE_SECONDS est abandonnée (worker arrêté) : elle n'est pas retournée.
+    """
+    statement = select(Document).where(Document.index_key == index_key, Document.status == status)
+    if status == DOCUMENT_STATUS_INDEXING:
+        statement = statement.where(~_indexing_abandoned())
+    if exclude_uid is not None:
+        statement = statement.where(Document.uid != exclude_uid)
+    result = await session.exec(statement.limit(1))
+    return result.first()
+
+
+async def _verrou_transaction(session: AsyncSession, key: str) -> None:
+    """
+    Verrou applicatif jusqu'à la fin de la transaction en cours (pg_advisory_xact_lock).
+    Sans effet sur une autre base que PostgreSQL (SQLite des tests).
+    """
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"), {"key": key})
+
+
+async def verrou_contenu(session: AsyncSession, index_key: str) -> None:
+    """
+    Verrou d'un contenu (clé d'index) jusqu'à la fin de la transaction en cours :
+    sérialise la réutilisation de ses vecteurs par un upload, la prise en charge
+    de son indexation et la suppression de son fichier et de ses vecteurs.
+    """
+    await _verrou_transaction(session, index_key)
+
+
+def _indexing_abandoned():
+    """
+    Condition des indexations abandonnées : commencées depuis plus de INDEXING_STALE_SECONDS,
+    ou sans date de début (0 : jamais abandonnées).
+    """
+    if Config.INDEXING_STALE_SECONDS <= 0:
+        return false()
+    cutoff = datetime.utcnow() - timedelta(seconds=Config.INDEXING_STALE_SECONDS)
+    return or_(Document.indexing_started_at.is_(None), Document.indexing_started_at < cutoff)
+
+
+class IndexingInProgress(Exception):
+    """Un document de même contenu est en cours d'indexation : ses vecteurs seront partagés."""
+
+
+async def index_uploaded_document(document_uid: str, wait_for_copy: bool = True) -> None:
+    """
+    Indexe un document uploadé et enregistre son état (indexing -> ready / failed).
+    Si un document de même contenu est déjà indexé, ses vecteurs sont réutilisés ; s'il est
+    en cours d'indexation, IndexingInProgress est levée (sauf `wait_for_copy` faux) : un
+    contenu n'est indexé que par une tâche à la fois.
+    """
+    engine = get_task_engine()
+    try:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            document = await session.get(Document, uuid.UUID(document_uid))
+            if document is None:
+                logger.warning(f"Document {document_uid} introuvable, indexation ignorée")
+                return
+
+            index_key = document.index_key
+            if index_key:
+                # Vérification et prise en charge sous verrou : libéré par le commit de l'état
+                await verrou_contenu(session, index_key)
+                copy = await find_indexed_copy(session, index_key, document.uid)
+                if copy:
+                    document.index_version = copy.index_version
+                    await _set_document_status(session, document, DOCUMENT_STATUS_READY)
+                    logger.info(f"Document {document_uid} prêt (contenu {index_key} déjà indexé)")
+                    return
+                if wait_for_copy and await find_indexed_copy(
+                    session, index_key, document.uid, status=DOCUMENT_STATUS_INDEXING
+                ):
+                    await session.rollback()
+                    raise IndexingInProgress(f"Contenu {index_key} en cours d'indexation")
+
+            await _set_document_status(session, document, DOCUMENT_STATUS_INDEXING)
+            try:
+                chunk_count = indexer_fichier_uploade(
+                    os.path.join(Config.UPLOAD_DIR, document.file_path),
+                    document.vector_key,
+                    document.filename,
+                )
+            except Exception as e:
+                logger.error(f"Échec de l'indexation du document {document_uid}: {e}", exc_info=True)
+                await _set_document_status(session, document, DOCUMENT_STATUS_FAILED, str(e))
+                return
+
+            document.index_version = UPLOAD_INDEX_VERSION
+            await _set_document_status(session, document, DOCUMENT_STATUS_READY)
+            logger.info(f"Document {document_uid} prêt ({chunk_count} fragments)")
+    finally:
+        await engine.dispose()
+
+
+def _outdated_index():
+    """Condition des documents indexés par une version antérieure du traitement des textes."""
+    return or_(Document.index_version.is_(None), Document.index_version < UPLOAD_INDEX_VERSION)
+
+
+async def reindex_uploaded_content(document_uid: str) -> None:
+    """
+    Réindexe le contenu d'un document prêt dont l'index date d'une version antérieure du
+    traitement des textes (UPLOAD_INDEX_VERSION), pour tous les documents qui le partagent.
+    Les anciens vecteurs sont supprimés avant la réindexation : pendant l'opération, ces
+    documents sont "indexing" (absents du RAG) et un upload du même contenu attend.
+    """
+    engine = get_task_engine()
+    try:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            document = await session.get(Document, uuid.UUID(document_uid))
+            if document is None:
+                return
+            vector_key = document.vector_key
+            if document.index_key:
+                await verrou_contenu(session, document.index_key)
+                statement = select(Document).where(Document.index_key == document.index_key)
+            else:
+                statement = select(Document).where(Document.uid == document.uid)
+            result = await session.exec(statement.where(Document.status == DOCUMENT_STATUS_READY, _outdated_index()))
+            copies = result.all()
+            if not copies:
+                return
+            for copy in copies:
+                copy.status = DOCUMENT_STATUS_INDEXING
+                copy.indexing_started_at = datetime.utcnow()
+                session.add(copy)
+            await session.commit()
+
+            try:
+                delete_documents_from_vectorstore([vector_key])
+                chunk_count = indexer_fichier_uploade(
+                    os.path.join(Config.UPLOAD_DIR, document.file_path), vector_key, document.filename,
+                )
+            except Exception as e:
+                logger.error(f"Échec de la réindexation du contenu {vector_key}: {e}", exc_info=True)
+                for copy in copies:
+                    copy.status = DOCUMENT_STATUS_FAILED
+                    copy.index_error = str(e)
+                    session.add(copy)
+                await session.commit()
+                return
+
+            for copy in copies:
+                copy.status = DOCUMENT_STATUS_READY
+                copy.index_version = UPLOAD_INDEX_VERSION
+                session.add(copy)
+            await session.commit()
+            logger.info(f"Contenu {vector_key} réindexé ({chunk_count} fragments, {len(copies)} document(s))")
+    finally:
+        await engine.dispose()
+
+
+async def outdated_upload_documents() -> list:
+    """
+    Documents prêts indexés par une version antérieure du traitement des textes :
+    un document par contenu (les copies sont réindexées avec lui).
+    """
+    engine = get_task_engine()
+    try:
+        async with AsyncSession(engine) as session:
+            result = await session.exec(
+                select(Document).where(Document.status == DOCUMENT_STATUS_READY, _outdated_index())
+            )
+            document_uids = {}
+            for document in result.all():
+                document_uids.setdefault(document.vector_key, str(document.uid))
+        return list(document_uids.values())
+    finally:
+        await engine.dispose()
+
+
+@c_app.task(name="rag.index_document", bind=True, max_retries=None)
+def index_document(self, document_uid: str):
+    # Après INDEXING_WAIT_RETRIES attentes, la copie en cours est considérée comme abandonnée
+    # (worker arrêté) : le document est indexé lui-même. En mode eager, self.retry relance
+    # la tâche sans délai : l'attente n'a pas de sens et le document est indexé directement.
+    wait_for_copy = not c_app.conf.task_always_eager and self.request.retries < INDEXING_WAIT_RETRIES
+    try:
+        asyncio.run(index_uploaded_document(document_uid, wait_for_copy=wait_for_copy))
+    except IndexingInProgress as e:
+        logger.info(f"Document {document_uid} : {e}, nouvelle tentative dans {INDEXING_WAIT_SECONDS} s")
+        raise self.retry(countdown=INDEXING_WAIT_SECONDS)
+
+
+async def reset_stale_indexing_documents() -> list:
+    """
+    Remet à l'état "pending" les documents restés "indexing" au-delà de INDEXING_STALE_SECONDS
+    (worker arrêté pendant l'indexation), pour qu'ils soient de nouveau envoyés à la file.
+
+    Returns:
+        UIDs des documents remis en attente
+    """
+    engine = get_task_engine()
+    try:
+        async with AsyncSession(engine) as session:
+            result = await session.exec(
+                select(Document).where(Document.status == DOCUMENT_STATUS_INDEXING, _indexing_abandoned())
+            )
+            documents = result.all()
+            for document in documents:
+                logger.warning(f"Indexation du document {document.uid} abandonnée, remise en attente")
+                document.status = DOCUMENT_STATUS_PENDING
+                session.add(document)
+            document_uids = [str(document.uid) for document in documents]
+            await session.commit()
+        return document_uids
+    finally:
+        await engine.dispose()
+
+
+@c_app.task(name="rag.reindex_document")
+def reindex_document(document_uid: str):
+    asyncio.run(reindex_uploaded_content(document_uid))
+
+
+@c_app.task(name="rag.reset_stale_indexing")
+def reset_stale_indexing():
+    """Réindexation des documents dont l'indexation a été abandonnée (Celery beat, INDEXING_STALE_SECONDS)."""
+    for document_uid in asyncio.run(reset_stale_indexing_documents()):
+        index_document.delay(document_uid)
+
+
+@c_app.task(name="rag.reindex_outdated_uploads")
+def reindex_outdated_uploads():
+    """
+    Envoie à la file la réindexation des contenus uploadés indexés avant UPLOAD_INDEX_VERSION
+    (indexer_rag.py --reindex-uploads).
+    """
+    document_uids = asyncio.run(outdated_upload_documents())
+    logger.info(f"{len(document_uids)} contenu(s) uploadé(s) à réindexer (version {UPLOAD_INDEX_VERSION})")
+    for document_uid in document_uids:
+        reindex_document.delay(document_uid)
+
+
+@c_app.task(name="rag.compact_vector_index")
+def compact_vector_index():
+    """
+    Compaction planifiée de l'index vectoriel (Celery beat, VECTOR_COMPACTION_INTERVAL_HOURS).
+    La suppression de l'ancienne collection est planifiée après le délai de grâce :
+    le worker et le verrou d'index sont libérés dès la bascule.
+    """
+    try:
+        report = basculer_index()
+    except CompactionBusyError:
+        logger.info("Compaction reportée : indexation ou compaction en cours")
+        return
+    finalize_vector_compaction.apply_async(
+        args=[report.collection_before], countdown=Config.VECTOR_COMPACTION_GRACE_SECONDS,
+    )
+
+
+@c_app.task(name="rag.finalize_vector_compaction")
+def finalize_vector_compaction(old_collection_name: str):
+    """Suppression de la collection remplacée par une compaction, et vacuum des bases SQLite."""
+    finaliser_compaction(old_collection_name)
+
+
+async def update_conversation_summary(conversation_uid: str) -> None:
+    """
+    Politique "summary" : intègre au résumé glissant d'une conversation les échanges sortis de la
+    fenêtre des RAG_HISTORY_MAX_TURNS derniers échanges depuis sa dernière mise à jour (tous, après
+    une réinitialisation). Les appels au LLM ont lieu hors de toute transaction ; le résumé est
+    ensuite enregistré dans une transaction courte, sous verrou, si sa couverture n'a pas changé
+    et que les échanges résumés n'ont été ni modifiés ni supprimés entre-temps (édition d'un
+    message, ou mise à jour concurrente).
+    """
+    engine = get_task_engine()
+    uid = uuid.UUID(conversation_uid)
+    try:
+        # Lecture des échanges à résumer (connexion rendue avant les appels au LLM)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            result = await session.exec(
+                select(Conversation.history_summary, Conversation.history_summary_until).where(Conversation.uid == uid)
+            )
+            row = result.first()
+            if row is None:
+                return
+            summary, summary_until = row
+
+            statement = select(Message).where(
+                Message.conversation_uid == uid, Message.prompt != "", Message.response != ""
+            )
+            if summary_until is not None:
+                statement = statement.where(Message.created_at > summary_until)
+            result = await session.exec(
+                statement.order_by(desc(Message.created_at)).offset(Config.RAG_HISTORY_MAX_TURNS)
+            )
+            dropped_messages = list(reversed(result.all()))
+        if not dropped_messages:
+            return
+
+        turns = [(message.prompt, message.response) for message in dropped_messages]
+        for start in range(0, len(turns), Config.RAG_HISTORY_MAX_TURNS):
+            summary = await summarize_history(summary, turns[start:start + Config.RAG_HISTORY_MAX_TURNS])
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            # Une écriture à la fois par conversation ; vérification et écriture sous verrou de la
+            # ligne : une édition concurrente l'attend, puis efface le résumé s'il couvre le message modifié
+            await _verrou_transaction(session, f"resume:{conversation_uid}")
+            result = await session.exec(
+                select(Conversation.history_summary_until).where(Conversation.uid == uid).with_for_update()
+            )
+            current = result.all()
+            result = await session.exec(
+                select(Message.uid, Message.prompt, Message.response)
+                .where(Message.uid.in_([message.uid for message in dropped_messages]))
+            )
+            unchanged = {tuple(message) for message in result.all()} == {
+                (message.uid, message.prompt, message.response) for message in dropped_messages
+            }
+            if current != [summary_until] or not unchanged:
+                logger.info(f"Résumé de la conversation {conversation_uid} abandonné : historique modifié entre-temps")
+                return
+
+            await session.exec(
+                update(Conversation).where(Conversation.uid == uid).values(
+                    history_summary=summary, history_summary_until=dropped_messages[-1].created_at,
+                )
+            )
+            await session.commit()
+            logger.info(f"Résumé de l'historique mis à jour pour la conversation {conversation_uid} "
+                        f"({len(turns)} échanges intégrés)")
+    finally:
+        await engine.dispose()
+
+
+@c_app.task(name="rag.update_history_summary")
+def update_history_summary(conversation_uid: str):
+    asyncio.run(update_conversation_summary(conversation_uid))
+
+
+async def enqueue_history_summary(conversation_uid) -> None:
+    """Envoie la mise à jour du résumé glissant d'une conversation à la file Celery (pool d'ingestion)."""
+    await run_ingestion(update_history_summary.delay, str(conversation_uid))
+
+
+async def enqueue_document_indexing(document_uids) -> None:
+    """
+    Envoie l'indexation des documents à la file Celery.
+    L'envoi au broker (ou l'exécution complète en mode eager) est bloquant : il est fait
+    dans le pool d'ingestion, hors de la boucle et sans occuper le pool interactif.
+    """
+    for document_uid in document_uids:
+        await run_ingestion(index_document.delay, str(document_uid))
@@ -1,4 +1,6 @@
 import os
+from typing import Dict
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -13,6 +15,11 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     
+    # File de tâches Celery (indexation des documents uploadés)
+    CELERY_BROKER_URL: str = "redis://localhost:6379/2"
+    CELERY_TASK_ALWAYS_EAGER: bool = False  # Exécute les tâches dans le processus appelant (tests)
+    INDEXING_STALE_SECONDS: int = 1800  # Au-delà, une indexation en cours est considérée comme abandonnée
+    
     # Configuration email
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
@@ -32,6 +39,85 @@ class Settings(BaseSettings):
     # API externes
     GEMINI_API_KEY: str
 
+    # Streaming des réponses RAG : "tokens" (flux réel du LLM) ou "simulated" (réponse complète découpée)
+    RAG_STREAMING_MODE: str = "tokens"
+    RAG_STREAM_CHUNK_SIZE: int = 20
+    # Reformulation de la question avec l'historique : "never", "always" ou "heuristic"
+    RAG_QUESTION_REWRITE_POLICY: str = "heuristic"
+    # Historique transmis au RAG : "last_n", "token_budget" ou "summary"
+    RAG_HISTORY_POLICY: str = "last_n"
+    RAG_HISTORY_MAX_TURNS: int = 6
+    RAG_HISTORY_TOKEN_BUDGET: int = 1500
+    # Cache sémantique des réponses (similarité cosinus des questions normalisées)
+    RAG_ANSWER_CACHE_ENABLED: bool = True
+    RAG_ANSWER_CACHE_SIZE: int = 512
+    RAG_ANSWER_CACHE_TTL: int = 3600
+    RAG_ANSWER_CACHE_THRESHOLD: float = 0.95
+    RAG_ANSWER_CACHE_STATS_INTERVAL: int = 100  # Journalisation des compteurs toutes les N recherches (0 = jamais)
+    # Cache des embeddings de requêtes (LRU en mémoire, niveau Redis optionnel)
+    RAG_EMBEDDING_CACHE_SIZE: int = 2048
+    RAG_EMBEDDING_CACHE_REDIS: bool = False
+    RAG_EMBEDDING_CACHE_TTL: int = 86400
+    # Backend du modèle d'embedding : "torch" (fp32), "onnx" (fp32) ou "onnx-int8" (quantifié)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "onnx_models")
+    EMBEDDING_ONNX_THREADS: int = 0  # 0 = choix automatique d'ONNX Runtime
+    # Pipeline d'indexation (indexer_rag.py)
+    INDEX_EMBED_BATCH_SIZE: int = 64
+    INDEX_WRITE_BATCH_SIZE: int = 512
+    INDEX_WORKERS: int = 0  # 0 = nombre de cœurs, 1 = sans pool de processus
+    INGESTION_PAGE_WINDOW: int = 32  # Pages chargées, découpées et indexées ensemble
+    # Taille des fragments en tokens du modèle d'embedding (128 tokens au plus, dont 2 spéciaux)
+    SPLITTER_CHUNK_TOKENS: int = 120
+    SPLITTER_OVERLAP_TOKENS: int = 16
+    # Élimination des quasi-doublons à l'indexation (MinHash/LSH, voir src/rag/dedup.py)
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.9  # Similarité de Jaccard (n-grammes de mots) à partir de laquelle un fragment est écarté
+    DEDUP_NUM_PERM: int = 128
+    # Extraction parallèle du texte des PDF (voir src/rag/pdf.py)
+    PDF_EXTRACTION_WORKERS: int = 0  # 0 = nombre de cœurs, 1 = dans le processus courant
+    PDF_PAGES_PER_SHARD: int = 16
+    PDF_PARALLEL_MIN_PAGES: int = 64  # En dessous, le coût du pool dépasse le gain
+    # Recherche hybride : BM25 (index lexical SQLite FTS5, voir src/rag/lexical.py) et recherche vectorielle,
+    # lancées en parallèle puis fusionnées par Reciprocal Rank Fusion
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_CANDIDATES: int = 20  # Fragments retenus par chaque recherche avant la fusion
+    HYBRID_RRF_K: int = 60
+    LEXICAL_INDEX_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lexical_index_fiqh.sqlite3")
+    # Recherche fédérée : documents actifs de la conversation et corpus de base interrogés en parallèle,
+    # part maximale de chaque source parmi les fragments retenus (0 = source non interrogée)
+    RAG_SOURCE_QUOTAS: Dict[str, float] = {"uploads": 0.6, "corpus": 0.4}
+    # Reclassement des fragments par un cross-encoder sur CPU (voir src/rag/reranker.py)
+    RAG_RERANK_ENABLED: bool = False
+    RAG_RERANK_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Multilingue (arabe compris)
+    RAG_RERANK_BACKEND: str = "onnx-int8"  # "torch", "onnx" ou "onnx-int8"
+    RAG_RERANK_CANDIDATES: int = 30  # Fragments recherchés avant le reclassement
+    RAG_RERANK_TOP_N: int = 4  # Fragments conservés dans le prompt
+    RAG_RERANK_BATCH_SIZE: int = 8
+    RAG_RERANK_BUDGET_MS: int = 400  # Au-delà, l'ordre de la recherche est conservé
+    # Partitionnement des vecteurs : "shared" (une collection filtrée par "document_uid") ou
+    # "document" (une collection par document uploadé, voir src/rag/partitions.py)
+    VECTOR_PARTITION_MODE: str = "shared"
+    VECTOR_PARTITION_SEARCH_WORKERS: int = 4  # Partitions interrogées en parallèle par requête (1 = en séquence)
+    # Compaction périodique de l'index vectoriel et vacuum des bases SQLite (voir src/rag/maintenance.py)
+    VECTOR_COMPACTION_INTERVAL_HOURS: int = 168  # 0 = pas de compaction planifiée (Celery beat)
+    VECTOR_COMPACTION_GRACE_SECONDS: int = 60  # Délai avant la suppression de l'ancienne collection
+    ACTIVE_COLLECTION_CHECK_SECONDS: float = 5  # Intervalle de relecture de la collection active (< délai de grâce)
+    # Serveur ChromaDB partagé par l'API et les workers (vide = base embarquée dans CHROMA_DB_PATH,
+    # rechargée par chaque processus après les écritures des autres, voir src/rag/vectorstore.py)
+    CHROMA_SERVER_HOST: str = ""
+    CHROMA_SERVER_PORT: int = 8000
+    SQLITE_VACUUM_STEP_PAGES: int = 2000  # Pages rendues par transaction de vacuum incrémental
+    # Pools de threads du travail RAG bloquant (voir src/rag/executors.py)
+    RAG_INTERACTIVE_WORKERS: int = 8
+    RAG_INGESTION_WORKERS: int = 2
+    RAG_MAX_LOOP_LAG_MS: int = 100  # Retard maximal toléré de la boucle asyncio pendant une ingestion
+
+    # Limites des uploads (en octets) et taille des blocs écrits sur le disque
+    UPLOAD_MAX_FILE_SIZE: int = 50 * 1024 * 1024
+    UPLOAD_MAX_REQUEST_SIZE: int = 200 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
     # Répertoire de stockage des fichiers
     UPLOAD_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploaded_files")
 
@@ -40,6 +126,25 @@ class Settings(BaseSettings):
 # Instance globale de configuration
 Config = Settings()
 
+# Configuration Celery, lue par c_app.config_from_object("src.config")
+broker_url = Config.CELERY_BROKER_URL
+broker_connection_retry_on_startup = True
+task_always_eager = Config.CELERY_TASK_ALWAYS_EAGER
+task_ignore_result = True  # L'état de l'indexation est suivi dans la table documents
+task_acks_late = True  # Une tâche interrompue (arrêt du worker) est relivrée
+worker_prefetch_multiplier = 1  # Les indexations sont longues : pas de préchargement
+beat_schedule = {}
+if Config.VECTOR_COMPACTION_INTERVAL_HOURS > 0:
+    beat_schedule["compaction-index-vectoriel"] = {
+        "task": "rag.compact_vector_index",
+        "schedule": Config.VECTOR_COMPACTION_INTERVAL_HOURS * 3600,
+    }
+if Config.INDEXING_STALE_SECONDS > 0:
+    beat_schedule["reprise-indexations-abandonnees"] = {
+        "task": "rag.reset_stale_indexing",
+        "schedule": Config.INDEXING_STALE_SECONDS,
+    }
+
 # Création du répertoire d'upload s'il n'existe pas
 if not os.path.exists(Config.UPLOAD_DIR):
     os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
\ No newline at end of file
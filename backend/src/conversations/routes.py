@@ -21,6 +21,7 @@ from .schemas import (
     MessageEditModel,
     ConversationRenameModel,
     DocumentModel,
+    DocumentStatusModel,
 )
 from .service import ConversationService
 
@@ -295,7 +296,7 @@ async def rename_conversation_title(
 
 @conversation_router.post(
     "/{conversation_uid}/upload", 
-    status_code=status.HTTP_200_OK, 
+    status_code=status.HTTP_202_ACCEPTED, 
     dependencies=[user_role_checker], 
     summary="Télécharger des documents pour le RAG"
 )
@@ -306,7 +307,11 @@ async def upload_files_to_conversation(
     session: AsyncSession = Depends(get_session),
     conv_service: ConversationService = Depends(),  # SIMPLIFIÉ
 ):
-    """Télécharge et indexe des documents pour enrichir le contexte RAG."""
+    """
+    Télécharge des documents pour enrichir le contexte RAG.
+    La réponse est immédiate : l'indexation est faite en arrière-plan et son état
+    est consultable via /documents/{document_id}/status.
+    """
     logger.info(f"Téléchargement de fichiers pour la conversation {conversation_uid} par l'utilisateur {current_user.uid}")
     
     if not files:
@@ -344,7 +349,7 @@ async def upload_files_to_conversation(
             logger.warning(f"Aucun document traité pour la conversation {conversation_uid}")
             response_content["message"] = "Aucun fichier traité."
         
-        return JSONResponse(status_code=status.HTTP_200_OK, content=response_content)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=response_content)
         
     except (ConversationNotFound, ForbiddenAccess) as e:
         status_code = status.HTTP_404_NOT_FOUND if isinstance(e, ConversationNotFound) else status.HTTP_403_FORBIDDEN
@@ -384,6 +389,33 @@ async def get_conversation_documents(
         raise HTTPException(status_code=status_code, detail=str(e))
 
 
+@conversation_router.get(
+    "/{conversation_uid}/documents/{document_id}/status",
+    response_model=DocumentStatusModel,
+    dependencies=[user_role_checker],
+    summary="Consulter l'état de l'indexation d'un document"
+)
+async def get_document_status(
+    conversation_uid: uuid.UUID,
+    document_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    conv_service: ConversationService = Depends(),
+):
+    """Retourne l'état de l'indexation d'un document (pending, indexing, ready ou failed)."""
+    try:
+        return await conv_service.get_document_status(
+            document_id=document_id,
+            conversation_uid=conversation_uid,
+            user_uid=current_user.uid,
+            session=session
+        )
+    except (ConversationNotFound, DocumentNotFound) as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ForbiddenAccess as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+
+
 @conversation_router.delete(
     "/{conversation_uid}/documents/{document_id}", 
     status_code=status.HTTP_204_NO_CONTENT, 
@@ -71,6 +71,16 @@ class DocumentModel(BaseModel):
     size: int
     mime_type: str = Field(..., max_length=100)
     is_active: bool = Field(default=True)
+    status: str = "ready"
+    index_error: Optional[str] = None
+
+class DocumentStatusModel(BaseModel):
+    """État de l'indexation RAG d'un document (pending, indexing, ready ou failed)."""
+    model_config = ConfigDict(from_attributes=True)
+
+    uid: uuid.UUID
+    status: str
+    index_error: Optional[str] = None
 
 class DocumentUploadResponse(BaseModel):
     """Réponse pour l'upload de documents avec gestion d'erreurs."""
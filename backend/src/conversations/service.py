@@ -1,11 +1,10 @@
 import os
-import tempfile
-import shutil
+import hashlib
 import logging
 import uuid
 from datetime import datetime
 import traceback
-from typing import List, Optional, Tuple
+from typing import List, Optional, Set, Tuple
 
 from fastapi import HTTPException, status, UploadFile
 from sqlalchemy.orm import selectinload
@@ -13,22 +12,39 @@ from sqlmodel import desc, select, delete
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
-from src.db.models import Conversation, Message, User, Document
+from src.db.models import Conversation, Message, User, Document, DOCUMENT_STATUS_FAILED, DOCUMENT_STATUS_PENDING, DOCUMENT_STATUS_READY
+from src.celery_tasks import enqueue_document_indexing, enqueue_history_summary, find_indexed_copy, verrou_contenu
 
-from src.errors import ConversationNotFound, ForbiddenAccess, MessageNotFound, DocumentNotFound
+from src.errors import ConversationNotFound, ForbiddenAccess, MessageNotFound, DocumentNotFound, FileTooLarge
 from .schemas import ConversationRenameModel, DocumentModel
 
-from src.rag.chain import generate_contextual_rag_response, stream_contextual_rag_response
+from src.rag.chain import (
+    generate_contextual_rag_response,
+    stream_contextual_rag_response,
+    trim_history_to_token_budget,
+    SUMMARY_TURN_PROMPT,
+)
 from langchain_core.documents import Document as LangchainDocument
 from src.rag import vectorstore
+from src.rag.cache import get_answer_cache
+from src.rag.executors import run_ingestion
 
-from src.rag.loader import charger_documents, split_documents
-from src.rag.vectorstore import add_documents_to_vectorstore
 import aiofiles
 from src.config import Config
 
 logger = logging.getLogger(__name__)
 
+# Dossiers de UPLOAD_DIR : fichiers stockés par empreinte de contenu, et uploads en cours d'écriture
+BLOBS_DIR = "blobs"
+UPLOAD_TMP_DIR = "tmp"
+
+
+def blob_relative_path(content_hash: str, filename: str) -> str:
+    """Chemin (relatif à UPLOAD_DIR) du fichier partagé par tous les uploads de ce contenu."""
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(BLOBS_DIR, content_hash[:2], f"{content_hash}{extension}")
+
+
 class ConversationService:
     """
     Service de gestion des conversations avec intÃ©gration RAG sÃ©curisÃ©e.
@@ -84,53 +100,158 @@ class ConversationService:
         logger.info(f"Created conversation {new_conversation.uid} for user {user.uid}")
         return new_conversation
     
-    async def get_formatted_history(self, conversation_uid: uuid.UUID, session: AsyncSession) -> List[Tuple[str, str]]:
+    async def get_formatted_history(
+        self,
+        conversation_uid: uuid.UUID,
+        session: AsyncSession,
+        before: Optional[datetime] = None
+    ) -> List[Tuple[str, str]]:
         """
-        RÃ©cupÃ¨re l'historique formatÃ© d'une conversation pour le contexte RAG.
-        Retourne une liste de tuples (prompt, rÃ©ponse).
+        Récupère l'historique formaté d'une conversation pour le contexte RAG.
+        Retourne une liste de tuples (prompt, réponse), du plus ancien au plus récent.
+        
+        Seuls les RAG_HISTORY_MAX_TURNS derniers échanges sont lus en base (LIMIT),
+        puis la politique RAG_HISTORY_POLICY est appliquée :
+        - "last_n" : les derniers échanges tels quels
+        - "token_budget" : les derniers échanges tenant dans RAG_HISTORY_TOKEN_BUDGET
+        - "summary" : les derniers échanges précédés du résumé glissant de la conversation ;
+          seuls les échanges postérieurs au résumé sont repris (pas d'échange en double)
         """
-        stmt = select(Message).where(Message.conversation_uid == conversation_uid).order_by(Message.created_at)
+        # La comparaison à "" exclut aussi les valeurs NULL
+        stmt = select(Message).where(
+            Message.conversation_uid == conversation_uid,
+            Message.prompt != "",
+            Message.response != ""
+        )
+        if before is not None:
+            stmt = stmt.where(Message.created_at < before)
+
+        summary = None
+        if Config.RAG_HISTORY_POLICY == "summary":
+            conversation = await self.get_conversation_by_uid(conversation_uid, session)
+            # Un résumé couvrant des messages postérieurs à `before` (édition) est ignoré
+            if conversation and conversation.history_summary and (
+                before is None or conversation.history_summary_until < before
+            ):
+                summary = conversation.history_summary
+                stmt = stmt.where(Message.created_at > conversation.history_summary_until)
+        stmt = stmt.order_by(desc(Message.created_at)).limit(Config.RAG_HISTORY_MAX_TURNS)
+
         results = await session.exec(stmt)
-        messages = results.all()
-        history = []
-        for msg in messages:
-             if msg.prompt and msg.response:
-                   history.append((msg.prompt, msg.response))
+        history = [(msg.prompt, msg.response) for msg in reversed(results.all())]
+
+        if Config.RAG_HISTORY_POLICY == "token_budget":
+            history = trim_history_to_token_budget(history, Config.RAG_HISTORY_TOKEN_BUDGET)
+        elif summary:
+            history.insert(0, (SUMMARY_TURN_PROMPT, summary))
         return history
-    
-    async def get_active_document_uids(
+
+    async def schedule_history_summary(self, conversation_uid: uuid.UUID) -> None:
+        """
+        Politique "summary" : la mise à jour du résumé glissant (appel au LLM) est confiée
+        à la file Celery, hors du chemin de la réponse.
+        Une erreur ici n'empêche pas la conversation de continuer.
+        """
+        if Config.RAG_HISTORY_POLICY != "summary":
+            return
+        try:
+            await enqueue_history_summary(conversation_uid)
+        except Exception as e:
+            logger.error(f"Mise à jour du résumé de la conversation {conversation_uid} non planifiée: {e}", exc_info=True)
+
+    async def invalidate_history_summary(
+        self, conversation: Conversation, edited_at: datetime, session: AsyncSession
+    ) -> bool:
+        """
+        Un message modifié (et les suivants, supprimés) déjà intégré au résumé glissant le rend
+        caduc : le résumé est effacé, pour être reconstruit après l'enregistrement de la modification.
+        Sa couverture est relue sous verrou de la ligne : une mise à jour du résumé en cours
+        attend l'enregistrement de la modification, ou a déjà été enregistrée.
+        Retourne True si le résumé a été effacé.
+        """
+        await session.refresh(
+            conversation, attribute_names=["history_summary", "history_summary_until"], with_for_update=True
+        )
+        if conversation.history_summary_until is None or edited_at > conversation.history_summary_until:
+            return False
+        conversation.history_summary = None
+        conversation.history_summary_until = None
+        return True
+
+    async def get_active_index_keys(
         self, 
         conversation_uid: uuid.UUID, 
         session: AsyncSession
     ) -> List[str]:
         """
-        RÃ©cupÃ¨re les UIDs des documents actifs pour une conversation.
-        CRITIQUE pour la sÃ©curitÃ© : seuls les documents actifs de cette conversation sont utilisÃ©s dans le RAG.
+        Récupère les clés d'index (métadonnée "document_uid" des vecteurs) des documents actifs d'une conversation.
+        CRITIQUE pour la sécurité : seuls les documents actifs de cette conversation sont utilisés dans le RAG.
+        Les vecteurs d'un même contenu sont partagés entre conversations : une conversation
+        n'y accède que si elle possède elle-même un document de ce contenu.
+        """
+        active_keys, _ = await self.get_active_index(conversation_uid, session)
+        return active_keys
+
+    async def get_active_index(
+        self,
+        conversation_uid: uuid.UUID,
+        session: AsyncSession
+    ) -> Tuple[List[str], str]:
+        """
+        Clés d'index des documents actifs (voir get_active_index_keys) et empreinte de leurs
+        versions d'index. Une réindexation (par un worker) garde la clé mais change la version :
+        l'empreinte, ajoutée à la version du corpus, écarte les réponses en cache de tous les
+        processus construites sur les anciens fragments.
         """
         logger.info(f"RÃ©cupÃ©ration des documents actifs pour la conversation {conversation_uid}")
         
         try:
+            # Les documents en cours d'indexation ne sont pas encore interrogeables
             statement = select(Document).where(
                 Document.conversation_uid == conversation_uid,
-                Document.is_active == True
+                Document.is_active == True,
+                Document.status == DOCUMENT_STATUS_READY
             )
             result = await session.exec(statement)
             active_documents = result.all()
             
-            active_uids = [str(doc.uid) for doc in active_documents]
-            logger.info(f"TrouvÃ© {len(active_uids)} documents actifs pour la conversation {conversation_uid}")
+            # Deux documents identiques de la conversation partagent la même clé (et sont réindexés ensemble)
+            versions = {doc.vector_key: doc.index_version for doc in active_documents}
+            active_keys = sorted(versions)
+            logger.info(f"TrouvÃ© {len(active_documents)} documents actifs pour la conversation {conversation_uid}")
             
-            return active_uids
+            return active_keys, ",".join(str(versions[key]) for key in active_keys)
             
         except Exception as e:
             logger.error(f"Erreur lors de la rÃ©cupÃ©ration des documents actifs: {e}", exc_info=True)
-            return []
+            return [], ""
     
+    async def with_display_names(
+        self, source_documents: List[LangchainDocument], conversation_uid: uuid.UUID, session: AsyncSession
+    ) -> List[LangchainDocument]:
+        """
+        Les vecteurs d'un contenu sont partagés entre conversations : la métadonnée "source"
+        des fragments garde le nom du fichier indexé en premier. Le nom affiché est celui du
+        document de cette conversation (copies des fragments, partagés avec le cache de réponses).
+        """
+        result = await session.exec(select(Document).where(Document.conversation_uid == conversation_uid))
+        filenames = {doc.vector_key: doc.filename for doc in result.all()}
+        return [
+            LangchainDocument(
+                page_content=doc.page_content,
+                metadata={**doc.metadata, "source": filenames[doc.metadata.get("document_uid")]},
+                id=doc.id,
+            )
+            if doc.metadata.get("document_uid") in filenames else doc
+            for doc in source_documents
+        ]
+
     async def generate_rag_response(
         self, 
         prompt: str, 
         conversation_uid: uuid.UUID, 
-        session: AsyncSession
+        session: AsyncSession,
+        chat_history: Optional[List[Tuple[str, str]]] = None
     ) -> Tuple[str, Optional[List[LangchainDocument]]]:
         """
         GÃ©nÃ¨re une rÃ©ponse contextuelle sÃ©curisÃ©e utilisant uniquement les documents actifs.
@@ -139,22 +260,25 @@ class ConversationService:
         logger.info(f"GÃ©nÃ©ration de rÃ©ponse RAG sÃ©curisÃ©e pour la conversation {conversation_uid}")
         try:
             # RÃ©cupÃ©ration de l'historique de conversation
-            chat_history = await self.get_formatted_history(conversation_uid, session)
+            if chat_history is None:
+                chat_history = await self.get_formatted_history(conversation_uid, session)
             
             # SÃ©curitÃ© : uniquement les documents actifs de cette conversation
-            active_document_uids = await self.get_active_document_uids(conversation_uid, session)
+            active_document_uids, index_stamp = await self.get_active_index(conversation_uid, session)
             
             # GÃ©nÃ©ration de la rÃ©ponse avec contexte sÃ©curisÃ©
             ai_response_text, source_documents, doc_count = await generate_contextual_rag_response(
                 question=prompt,
                 active_document_uids=active_document_uids,
-                chat_history=chat_history
+                chat_history=chat_history,
+                index_stamp=index_stamp
             )
             
             logger.info(f"RÃ©ponse gÃ©nÃ©rÃ©e avec {doc_count} documents actifs")
             
             if source_documents:
                 logger.info(f"Sources utilisÃ©es dans la rÃ©ponse: {len(source_documents)} documents")
+                source_documents = await self.with_display_names(source_documents, conversation_uid, session)
             
             return ai_response_text, source_documents
             
@@ -187,6 +311,7 @@ class ConversationService:
          await session.commit()
          await session.refresh(db_message)
          logger.info(f"Paire message/rÃ©ponse (ID: {db_message.uid}) sauvegardÃ©e pour la conversation {conversation_uid}")
+         await self.schedule_history_summary(conversation_uid)
          return db_message
 
     async def add_message_to_conversation(
@@ -220,6 +345,7 @@ class ConversationService:
         await session.commit()
         await session.refresh(new_message)
         logger.info(f"Added message {new_message.uid} to conversation {conversation_uid}")
+        await self.schedule_history_summary(conversation_uid)
         return new_message
 
     async def get_conversation_messages(
@@ -238,13 +364,19 @@ class ConversationService:
     async def delete_conversation(
         self, conversation_uid: uuid.UUID, user_uid: uuid.UUID, session: AsyncSession
     ) -> None:
-        """Supprime une conversation et tous ses messages associÃ©s."""
+        """
+        Supprime une conversation, ses messages et ses documents, ainsi que les fichiers
+        et vecteurs de ces documents qui ne sont pas partagés avec d'autres conversations.
+        """
         conversation = await self.get_user_conversation(user_uid, conversation_uid, session)
         if not conversation:
-            raise ConversationNotFound("Conversation non trouvÃ©e ou accÃ¨s interdit pour suppression.")
+            raise ConversationNotFound("Conversation non trouvée ou accès interdit pour suppression.")
+        file_paths = {doc.file_path for doc in conversation.documents}
+        vector_keys = {doc.vector_key for doc in conversation.documents}
         await session.delete(conversation)
         await session.commit()
         logger.info(f"Deleted conversation {conversation_uid} for user {user_uid}")
+        await self.purge_unreferenced_storage(file_paths, vector_keys, session)
         return None
     
     async def get_message_by_uid(self, message_uid: uuid.UUID, session: AsyncSession) -> Optional[Message]:
@@ -275,22 +407,25 @@ class ConversationService:
             await session.exec(delete(Message).where(
                 Message.conversation_uid == conversation_uid, Message.created_at > edit_message_timestamp
             ))
-            history_messages_result = await session.exec(
-                select(Message).where(Message.conversation_uid == conversation_uid, Message.created_at < edit_message_timestamp).order_by(Message.created_at)
+            # Collection déjà chargée : session.add(conversation) échouerait sur les messages supprimés
+            session.expire(conversation, ["messages"])
+            formatted_history = await self.get_formatted_history(
+                conversation_uid, session, before=edit_message_timestamp
             )
-            formatted_history = [(msg.prompt, msg.response) for msg in history_messages_result.all() if msg.prompt and msg.response]
             
             # RÃ©gÃ©nÃ©ration avec le nouveau prompt
             new_ai_response_text, _ = await self.generate_rag_response(
                 prompt=new_prompt_text, 
                 conversation_uid=conversation_uid, 
-                session=session
+                session=session,
+                chat_history=formatted_history
             )
             
             message_to_edit.prompt = new_prompt_text
             message_to_edit.response = new_ai_response_text
             message_to_edit.update_at = datetime.utcnow()
             session.add(message_to_edit)
+            summary_invalidated = await self.invalidate_history_summary(conversation, edit_message_timestamp, session)
             conversation.update_at = datetime.utcnow()
             session.add(conversation)
             await session.commit()
@@ -300,6 +435,8 @@ class ConversationService:
             detail_message = f"Erreur modification/regÃ©nÃ©ration: {e}"
             status_code_err = status.HTTP_503_SERVICE_UNAVAILABLE if "generate_rag_response" in traceback.format_exc() else status.HTTP_500_INTERNAL_SERVER_ERROR
             raise HTTPException(status_code=status_code_err, detail=detail_message)
+        if summary_invalidated:
+            await self.schedule_history_summary(conversation_uid)
         return await self.get_conversation_messages(conversation_uid, user_uid, session)
     
     async def rename_conversation(
@@ -334,6 +471,20 @@ class ConversationService:
             logger.error(f"Error retrieving documents for conversation {conversation_uid}: {e}", exc_info=True)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve documents")
 
+    async def get_document_status(
+        self, document_id: uuid.UUID, conversation_uid: uuid.UUID, user_uid: uuid.UUID, session: AsyncSession
+    ) -> Document:
+        """
+        Récupère un document pour consulter l'état de son indexation.
+        """
+        if not await self.get_user_conversation(user_uid, conversation_uid, session):
+            raise ForbiddenAccess("Accès interdit à cette conversation.")
+
+        document = await session.get(Document, document_id)
+        if not document or document.conversation_uid != conversation_uid:
+            raise DocumentNotFound("Document non trouvé ou n'appartient pas à la conversation.")
+        return document
+
     async def get_active_documents_for_conversation(
         self, conversation_uid: uuid.UUID, user_uid: uuid.UUID, session: AsyncSession
     ) -> List[Document]:
@@ -360,6 +511,8 @@ class ConversationService:
     ) -> None:
         """
         Supprime un document de manière sécurisée : BDD, fichier physique et base vectorielle.
+        Le fichier et les vecteurs étant partagés par les documents de même contenu, ils ne
+        sont supprimés qu'avec le dernier document qui les référence.
         """
         logger.info(f"Début de la suppression du document {document_id} pour la conversation {conversation_uid}")
         
@@ -373,33 +526,121 @@ class ConversationService:
         if not doc_to_delete or doc_to_delete.conversation_uid != conversation_uid:
             raise DocumentNotFound("Document non trouvé ou n'appartient pas à la conversation.")
 
-        # 3. Supprimer le fichier physique
-        try:
-            full_file_path = os.path.join(Config.UPLOAD_DIR, doc_to_delete.file_path)
-            if os.path.exists(full_file_path):
-                os.remove(full_file_path)
-                logger.info(f"Fichier physique supprimé : {full_file_path}")
-            else:
-                logger.warning(f"Le fichier physique n'a pas été trouvé pour le document {document_id} au chemin : {full_file_path}")
-        except Exception as e:
-            logger.error(f"Erreur lors de la suppression du fichier physique {doc_to_delete.file_path}: {e}", exc_info=True)
-            # On continue pour au moins nettoyer la BDD, mais on log l'erreur.
-
-        # 4. Supprimer les vecteurs associés (CRUCIAL pour le RAG)
-        try:
-            vectorstore.delete_documents_from_vectorstore(document_uid=str(doc_to_delete.uid))
-            logger.info(f"Vecteurs supprimés pour le document {doc_to_delete.uid}")
-        except Exception as e:
-            logger.error(f"Erreur lors de la suppression des vecteurs pour le document {doc_to_delete.uid}: {e}", exc_info=True)
-            # Log l'erreur mais continuer pour que l'utilisateur voit le document disparaître
-        
-        # 5. Supprimer l'enregistrement de la base de données
+        # 3. Supprimer l'enregistrement de la base de données
+        file_path = doc_to_delete.file_path
+        vector_key = doc_to_delete.vector_key
         await session.delete(doc_to_delete)
         await session.commit()
-        
         logger.info(f"Document {document_id} supprimé avec succès de la base de données.")
+
+        # 4. Supprimer le fichier physique et les vecteurs s'ils ne sont plus référencés (CRUCIAL pour le RAG)
+        await self.purge_unreferenced_storage({file_path}, {vector_key}, session)
         return None
+
+    async def _still_referenced(self, column, values: Set[str], session: AsyncSession) -> Set[str]:
+        """Valeurs de `column` (fichier ou clé d'index) encore utilisées par un document."""
+        if not values:
+            return set()
+        result = await session.exec(select(column).where(column.in_(values)).distinct())
+        return set(result.all())
+
+    async def purge_unreferenced_storage(self, file_paths: Set[str], vector_keys: Set[str], session: AsyncSession) -> None:
+        """
+        Supprime les fichiers et les vecteurs de documents supprimés de la base, sauf ceux
+        encore partagés avec d'autres documents (même contenu dans une autre conversation).
+        Les erreurs sont journalisées : les documents ont déjà disparu de la base.
+        Les contenus sont verrouillés (verrou_contenu) de la vérification des références à la
+        suppression : un upload concurrent du même contenu attend, puis le réindexe.
+        """
+        for vector_key in sorted(vector_keys):
+            await verrou_contenu(session, vector_key)
+        try:
+            await self._purge_unreferenced_storage(file_paths, vector_keys, session)
+        finally:
+            # Fin de la transaction : libère les verrous
+            await session.commit()
+
+    async def _purge_unreferenced_storage(self, file_paths: Set[str], vector_keys: Set[str], session: AsyncSession) -> None:
+        orphan_files = file_paths - await self._still_referenced(Document.file_path, file_paths, session)
+        orphan_keys = vector_keys - await self._still_referenced(Document.index_key, vector_keys, session)
+        if len(orphan_files) < len(file_paths) or len(orphan_keys) < len(vector_keys):
+            logger.info(
+                f"{len(file_paths) - len(orphan_files)} fichier(s) et {len(vector_keys) - len(orphan_keys)} "
+                f"jeu(x) de vecteurs conservés : partagés avec d'autres documents"
+            )
+
+        for file_path in sorted(orphan_files):
+            try:
+                full_file_path = os.path.join(Config.UPLOAD_DIR, file_path)
+                if os.path.exists(full_file_path):
+                    os.remove(full_file_path)
+                    logger.info(f"Fichier physique supprimé : {full_file_path}")
+                else:
+                    logger.warning(f"Le fichier physique n'a pas été trouvé au chemin : {full_file_path}")
+            except Exception as e:
+                logger.error(f"Erreur lors de la suppression du fichier physique {file_path}: {e}", exc_info=True)
+
+        if not orphan_keys:
+            return
+        try:
+            deleted = await run_ingestion(vectorstore.delete_documents_from_vectorstore, orphan_keys)
+            logger.info(f"Vecteurs supprimés pour {len(orphan_keys)} document(s) ({deleted} fragments)")
+        except Exception as e:
+            logger.error(f"Erreur lors de la suppression des vecteurs {sorted(orphan_keys)}: {e}", exc_info=True)
+        # Cache propre à ce processus : les autres workers de l'API gardent leurs réponses
+        # jusqu'à RAG_ANSWER_CACHE_TTL (les vecteurs supprimés ne sont plus jamais retrouvés)
+        get_answer_cache().invalidate_documents(orphan_keys)
     
+    async def save_upload_file(self, file: UploadFile, destination: str) -> Tuple[int, str]:
+        """
+        Écrit un fichier uploadé à son emplacement définitif par blocs de taille fixe,
+        en calculant son empreinte SHA-256 et en vérifiant sa taille au fil de l'eau.
+        Le fichier est écrit sous un nom temporaire puis renommé : un fichier refusé
+        ou interrompu ne laisse rien à l'emplacement définitif.
+        
+        Returns:
+            Tuple contenant (taille_en_octets, empreinte_sha256)
+        """
+        max_size = Config.UPLOAD_MAX_FILE_SIZE
+        if file.size is not None and file.size > max_size:
+            raise FileTooLarge(f"Le fichier dépasse la taille maximale autorisée ({max_size} octets)")
+
+        digest = hashlib.sha256()
+        size = 0
+        partial_path = f"{destination}.part"
+        try:
+            async with aiofiles.open(partial_path, 'wb') as out_file:
+                while chunk := await file.read(Config.UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLarge(f"Le fichier dépasse la taille maximale autorisée ({max_size} octets)")
+                    digest.update(chunk)
+                    await out_file.write(chunk)
+            os.replace(partial_path, destination)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        return size, digest.hexdigest()
+
+    def store_blob(self, temporary_path: str, content_hash: str, filename: str) -> str:
+        """
+        Range un fichier uploadé à l'emplacement partagé de son contenu.
+        Si ce contenu est déjà stocké, la copie temporaire est simplement supprimée.
+
+        Returns:
+            Chemin du fichier relatif à UPLOAD_DIR
+        """
+        relative_path = blob_relative_path(content_hash, filename)
+        blob_path = os.path.join(Config.UPLOAD_DIR, relative_path)
+        if os.path.exists(blob_path):
+            os.remove(temporary_path)
+            logger.info(f"Contenu {content_hash} déjà stocké, fichier partagé : {relative_path}")
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temporary_path, blob_path)
+        return relative_path
+
     async def process_and_index_files(
         self,
         files: List[UploadFile],
@@ -408,8 +649,10 @@ class ConversationService:
         session: AsyncSession
     ) -> dict:
         """
-        Traite et indexe les fichiers uploadÃ©s pour une conversation.
-        Traite chaque fichier individuellement pour Ã©viter les conflits de mÃ©tadonnÃ©es.
+        Traite et indexe les fichiers uploadés pour une conversation.
+        Les fichiers sont stockés une seule fois par contenu (UPLOAD_DIR/blobs, nommés par
+        empreinte SHA-256) et indexés une seule fois : un fichier déjà indexé dans une autre
+        conversation est immédiatement prêt, sans nouveau calcul d'embeddings.
         """
         conversation = await self.get_user_conversation(user_uid, conversation_uid, session)
         if not conversation:
@@ -417,91 +660,78 @@ class ConversationService:
 
         saved_db_documents_info = []
         errors = []
-        conversation_upload_path = os.path.join(Config.UPLOAD_DIR, str(conversation_uid))
-        os.makedirs(conversation_upload_path, exist_ok=True)
+        upload_tmp_path = os.path.join(Config.UPLOAD_DIR, UPLOAD_TMP_DIR)
+        os.makedirs(upload_tmp_path, exist_ok=True)
 
-        logger.info(f"Processing files for conversation {conversation_uid}. Saving to: {conversation_upload_path}")
+        logger.info(f"Processing files for conversation {conversation_uid}")
 
         for file in files:
-            temp_dir_for_rag = None
             try:
                 # Nettoyage du nom de fichier pour la sÃ©curitÃ©
                 safe_filename = "".join(c if c.isalnum() or c in ['.', '_', '-'] else '_' for c in file.filename)
                 if not safe_filename:
                     safe_filename = f"upload_{uuid.uuid4().hex[:8]}{os.path.splitext(file.filename)[1]}"
 
-                persistent_file_path = os.path.join(conversation_upload_path, safe_filename)
-                
-                # Lecture et sauvegarde du contenu
-                file_content = await file.read()
-                await file.seek(0)
-
-                async with aiofiles.open(persistent_file_path, 'wb') as out_file:
-                    await out_file.write(file_content)
+                # Écriture par blocs (empreinte et taille vérifiées au fil de l'eau), puis rangement par contenu
+                temporary_file_path = os.path.join(upload_tmp_path, f"{uuid.uuid4().hex}{os.path.splitext(safe_filename)[1]}")
+                file_size, content_hash = await self.save_upload_file(file, temporary_file_path)
+                # Verrou du contenu jusqu'au commit du document : une suppression concurrente
+                # ne peut pas retirer le fichier ni les vecteurs réutilisés ici
+                await verrou_contenu(session, content_hash)
+                relative_file_path = self.store_blob(temporary_file_path, content_hash, safe_filename)
+                indexed_copy = await find_indexed_copy(session, content_hash)
 
                 # Enregistrement des mÃ©tadonnÃ©es en base
                 new_db_document = Document(
                     filename=safe_filename,
                     conversation_uid=conversation_uid,
-                    file_path=os.path.relpath(persistent_file_path, Config.UPLOAD_DIR),
-                    size=len(file_content),
+                    file_path=relative_file_path,
+                    size=file_size,
                     mime_type=file.content_type or "application/octet-stream",
+                    content_hash=content_hash,
+                    index_key=content_hash,
                     upload_date=datetime.utcnow(),
-                    is_active=True
+                    is_active=True,
+                    # Contenu déjà indexé : les vecteurs existants sont partagés
+                    status=DOCUMENT_STATUS_READY if indexed_copy else DOCUMENT_STATUS_PENDING
                 )
                 session.add(new_db_document)
                 await session.flush()
                 await session.refresh(new_db_document)
+                document_info = DocumentModel.from_orm(new_db_document).model_dump(mode='json')
+                # Un commit par fichier : le verrou du contenu est libéré aussitôt
+                await session.commit()
 
-                temp_dir_for_rag = tempfile.mkdtemp()
-                temp_file_path = os.path.join(temp_dir_for_rag, safe_filename)
-                async with aiofiles.open(temp_file_path, 'wb') as temp_out_file:
-                    await temp_out_file.write(file_content)
-
-                # Traitement RAG du fichier individuel
-                logger.info(f"Loading document for RAG from {temp_dir_for_rag}")
-                rag_docs_loaded = charger_documents(temp_dir_for_rag)
-                if rag_docs_loaded:
-                    split_docs = split_documents(rag_docs_loaded)
-                    if split_docs:
-                        for doc in split_docs:
-                            if not doc.metadata:
-                                doc.metadata = {}
-                            doc.metadata.update({
-                                "document_uid": str(new_db_document.uid),
-                                "conversation_uid": str(conversation_uid),
-                                "source": new_db_document.filename
-                            })
-                        add_documents_to_vectorstore(split_docs, document_uid=str(new_db_document.uid))
-                        logger.info(f"Document '{safe_filename}' (UID: {new_db_document.uid}) indexÃ© avec {len(split_docs)} chunks")
-
-                saved_db_documents_info.append(DocumentModel.from_orm(new_db_document).model_dump(mode='json'))
-                logger.info(f"Document '{new_db_document.filename}' processed (UID: {new_db_document.uid})")
+                saved_db_documents_info.append(document_info)
+                logger.info(f"Document '{document_info['filename']}' processed (UID: {document_info['uid']})")
 
             except Exception as e_file:
+                await session.rollback()
                 errors.append({"filename": file.filename, "error": str(e_file)})
                 logger.error(f"Error processing file {file.filename}: {e_file}", exc_info=True)
             finally:
-                if temp_dir_for_rag:
-                    try:
-                        shutil.rmtree(temp_dir_for_rag)
-                    except Exception as e_clean:
-                        logger.error(f"Error cleaning temp dir for {file.filename}: {e_clean}")
                 await file.close()
 
-        try:
-            await session.commit()
-            logger.info(f"Committed {len(saved_db_documents_info)} documents to database")
-        except Exception as e_commit:
-            await session.rollback()
-            logger.error(f"Error committing documents to database: {e_commit}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Server error during file processing"
-            )
+        # L'indexation RAG est faite par les workers Celery une fois les documents enregistrés.
+        # Un document qui n'a pas pu être envoyé à la file passe à "failed" : resté "pending",
+        # il ne serait jamais indexé.
+        for doc_info in saved_db_documents_info:
+            if doc_info["status"] != DOCUMENT_STATUS_PENDING:
+                continue
+            try:
+                await enqueue_document_indexing([doc_info["uid"]])
+            except Exception as e_enqueue:
+                logger.error(f"Error enqueuing document {doc_info['uid']} for indexing: {e_enqueue}", exc_info=True)
+                document = await session.get(Document, uuid.UUID(doc_info["uid"]))
+                document.status = DOCUMENT_STATUS_FAILED
+                document.index_error = f"Envoi à la file d'indexation impossible : {e_enqueue}"
+                session.add(document)
+                await session.commit()
+                doc_info.update(status=DOCUMENT_STATUS_FAILED, index_error=document.index_error)
+                errors.append({"filename": doc_info["filename"], "error": document.index_error})
 
         return {
-            "message": f"Processed {len(saved_db_documents_info)} document(s) successfully",
+            "message": f"{len(saved_db_documents_info)} document(s) reçu(s), indexation en cours",
             "documents": saved_db_documents_info,
             "errors": errors
         }
@@ -586,7 +816,7 @@ class ConversationService:
         # Prepare data for RAG processing
         try:
             chat_history = await self.get_formatted_history(conversation_uid, session)
-            active_document_uids = await self.get_active_document_uids(conversation_uid, session)
+            active_document_uids, index_stamp = await self.get_active_index(conversation_uid, session)
         except Exception as e:
             logger.error(f"Error preparing RAG data: {e}", exc_info=True)
             yield "data: [ERROR] Error preparing conversation data.\n\n"
@@ -600,7 +830,8 @@ class ConversationService:
             async for chunk in stream_contextual_rag_response(
                 question=prompt,
                 active_document_uids=active_document_uids,
-                chat_history=chat_history
+                chat_history=chat_history,
+                index_stamp=index_stamp
             ):
                 full_response_text += chunk
                 # Format for Server-Sent Events (SSE)
@@ -674,22 +905,16 @@ class ConversationService:
                 Message.conversation_uid == conversation_uid, 
                 Message.created_at > edit_message_timestamp
             ))
+            # Collection déjà chargée : session.add(conversation) échouerait sur les messages supprimés
+            session.expire(conversation, ["messages"])
             
             # Récupération de l'historique antérieur au message édité
-            history_messages_result = await session.exec(
-                select(Message).where(
-                    Message.conversation_uid == conversation_uid, 
-                    Message.created_at < edit_message_timestamp
-                ).order_by(Message.created_at)
+            formatted_history = await self.get_formatted_history(
+                conversation_uid, session, before=edit_message_timestamp
             )
-            formatted_history = [
-                (msg.prompt, msg.response) 
-                for msg in history_messages_result.all() 
-                if msg.prompt and msg.response
-            ]
             
             # Récupération des documents actifs
-            active_document_uids = await self.get_active_document_uids(conversation_uid, session)
+            active_document_uids, index_stamp = await self.get_active_index(conversation_uid, session)
             
         except Exception as e:
             logger.error(f"Erreur lors de la préparation de l'édition: {e}", exc_info=True)
@@ -704,7 +929,8 @@ class ConversationService:
             async for chunk in stream_contextual_rag_response(
                 question=new_prompt,
                 active_document_uids=active_document_uids,
-                chat_history=formatted_history
+                chat_history=formatted_history,
+                index_stamp=index_stamp
             ):
                 full_response_text += chunk
                 yield f"data: {chunk}\n\n"
@@ -728,11 +954,16 @@ class ConversationService:
                 session.add(message_to_edit)
                 
                 # Mise à jour de la conversation
+                summary_invalidated = await self.invalidate_history_summary(
+                    conversation, edit_message_timestamp, session
+                )
                 conversation.update_at = datetime.utcnow()
                 session.add(conversation)
                 
                 await session.commit()
                 logger.info(f"Message modifié sauvegardé avec succès pour la conversation {conversation_uid}")
+                if summary_invalidated:
+                    await self.schedule_history_summary(conversation_uid)
                     
             except Exception as save_error:
                 logger.error(f"Erreur lors de la sauvegarde après streaming d'édition: {save_error}", exc_info=True)
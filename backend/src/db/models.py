@@ -84,6 +84,12 @@ class Conversation(SQLModel, table=True):
         default_factory=datetime.utcnow,
         sa_column=Column(pg.TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     )
+    # Résumé glissant des échanges sortis de la fenêtre d'historique (politique "summary")
+    history_summary: Optional[str] = Field(default=None, sa_column=Column(pg.TEXT, nullable=True))
+    # Date de création du dernier message intégré au résumé (None : aucun)
+    history_summary_until: Optional[datetime] = Field(
+        default=None, sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=True)
+    )
 
     # Relation avec l'utilisateur
     user: User = Relationship(back_populates="conversations")
@@ -152,6 +158,13 @@ class Message(SQLModel, table=True):
         return f"<{content_type} {self.uid} in Conv {self.conversation_uid}>"
     
 
+# États d'indexation d'un document uploadé
+DOCUMENT_STATUS_PENDING = "pending"    # En attente d'un worker d'indexation
+DOCUMENT_STATUS_INDEXING = "indexing"  # Indexation en cours
+DOCUMENT_STATUS_READY = "ready"        # Indexé, utilisable par le RAG
+DOCUMENT_STATUS_FAILED = "failed"      # Échec de l'indexation (voir index_error)
+
+
 class Document(SQLModel, table=True):
     """Modèle représentant un document uploadé dans une conversation"""
     __tablename__ = "documents"
@@ -163,8 +176,8 @@ class Document(SQLModel, table=True):
     filename: str = Field(sa_column=Column(VARCHAR, nullable=False))
     # Référence vers la conversation
     conversation_uid: uuid.UUID = Field(foreign_key="conversations.uid", index=True, nullable=False)
-    # Chemin de stockage du fichier (unique)
-    file_path: str = Field(sa_column=Column(VARCHAR, nullable=False, unique=True))
+    # Chemin de stockage du fichier, relatif à UPLOAD_DIR (blob partagé par les documents de même contenu)
+    file_path: str = Field(sa_column=Column(VARCHAR, nullable=False))
     
     # Indicateur si le document est actif/disponible
     is_active: bool = Field(default=True, sa_column=Column(Boolean, nullable=False, server_default=text("true")))
@@ -177,10 +190,36 @@ class Document(SQLModel, table=True):
     size: int = Field(sa_column=Column(Integer, nullable=False))
     # Type MIME du fichier
     mime_type: str = Field(sa_column=Column(VARCHAR, nullable=False))
+    # Empreinte SHA-256 du contenu, calculée pendant l'écriture du fichier
+    content_hash: Optional[str] = Field(default=None, sa_column=Column(VARCHAR(64), nullable=True, index=True))
+    # Clé de l'ensemble de vecteurs du document dans ChromaDB (métadonnée "document_uid") :
+    # l'empreinte du contenu, partagée par tous les documents identiques. Vide pour les
+    # documents indexés avant le stockage par contenu, dont les vecteurs portent leur UID.
+    index_key: Optional[str] = Field(default=None, sa_column=Column(VARCHAR(64), nullable=True, index=True))
+    # État de l'indexation RAG (traitée en arrière-plan par Celery)
+    status: str = Field(
+        default=DOCUMENT_STATUS_PENDING,
+        sa_column=Column(VARCHAR, nullable=False, server_default=DOCUMENT_STATUS_PENDING, index=True)
+    )
+    # Message d'erreur si l'indexation a échoué
+    index_error: Optional[str] = Field(default=None, sa_column=Column(pg.TEXT, nullable=True))
+    # Version du traitement des textes de l'index du document (voir UPLOAD_INDEX_VERSION) ;
+    # vide pour les documents indexés avant le suivi des versions
+    index_version: Optional[int] = Field(default=None, sa_column=Column(Integer, nullable=True))
+    # Début de la dernière indexation : un document "indexing" depuis plus de
+    # INDEXING_STALE_SECONDS est considéré comme abandonné (worker arrêté)
+    indexing_started_at: Optional[datetime] = Field(
+        default=None, sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=True)
+    )
 
     # Relation avec la conversation
     conversation: "Conversation" = Relationship(back_populates="documents")
 
+    @property
+    def vector_key(self) -> str:
+        """Valeur de la métadonnée "document_uid" des vecteurs de ce document."""
+        return self.index_key or str(self.uid)
+
 
 # --- Index pour optimiser les performances des requêtes ---
 Index("idx_conversation_user", Conversation.user_uid)
@@ -1,3 +1,4 @@
+from redis import Redis
 from redis import asyncio as aioredis
 
 from src.config import Config
@@ -10,6 +11,14 @@ token_blocklist = aioredis.StrictRedis(
     host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=0
 )
 
+# Connexion Redis synchrone pour le cache d'embeddings : les embeddings sont
+# calculés dans des threads (recherche Chroma), hors de la boucle asyncio.
+# Les timeouts courts évitent qu'un Redis indisponible ralentisse la recherche.
+embedding_cache = Redis(
+    host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=1,
+    socket_connect_timeout=0.2, socket_timeout=0.2
+)
+
 async def add_jti_to_blocklist(jti: str) -> None:
     """
     Ajoute un JTI (JWT ID) à la liste noire des tokens
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, status
+from fastapi import FastAPI, HTTPException, status
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,6 +7,8 @@ import time
 import logging
 import os
 
+from src.config import Config
+
 # Origines autorisées pour CORS
 origins = [
     "http://localhost:3000",  # Frontend en développement
@@ -18,6 +20,48 @@ logger = logging.getLogger("uvicorn.access")
 logger.disabled = True
 
 
+class UploadSizeLimitMiddleware:
+    """
+    Refuse (413) les corps de requête d'upload trop volumineux avant qu'ils ne soient
+    entièrement lus par le parseur multipart : d'abord d'après l'en-tête Content-Length,
+    puis en comptant les octets reçus (requêtes sans Content-Length ou en-tête erroné).
+    """
+
+    def __init__(self, app, max_body_size: int, path_suffix: str = "/upload"):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_suffix = path_suffix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].endswith(self.path_suffix):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"La requête dépasse la taille maximale autorisée ({self.max_body_size} octets)"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"message": detail, "error_code": "REQUEST_TOO_LARGE"},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Relevée telle quelle par FastAPI pendant la lecture du formulaire
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
 def register_middleware(app: FastAPI):
 
     # Middleware de logging personnalisé
@@ -33,6 +77,9 @@ def register_middleware(app: FastAPI):
         print(message)
         return response
 
+    # Limite de taille des uploads (avant lecture complète du corps)
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_size=Config.UPLOAD_MAX_REQUEST_SIZE)
+
     # Middleware CORS
     app.add_middleware(
         CORSMiddleware,
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document as LangchainDocument
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    """Réponse mise en cache pour une question, un ensemble de documents actifs et une version du corpus."""
+    question: str
+    document_set: FrozenSet[str]
+    corpus_version: Optional[str]
+    embedding: np.ndarray
+    answer: str
+    source_documents: List[LangchainDocument] = field(default_factory=list)
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticAnswerCache:
+    """
+    Cache LRU de réponses RAG indexé par l'embedding normalisé de la question
+    et par l'ensemble des documents actifs.
+
+    Une entrée est réutilisée si la similarité cosinus avec la question dépasse
+    le seuil, si son TTL n'est pas écoulé, si elle porte sur le même ensemble
+    de documents et sur la même version du corpus (collection active et manifeste
+    d'indexation, voir vectorstore.corpus_version). Les entrées sont invalidées quand
+    un document de leur ensemble change.
+
+    Le cache est propre à chaque processus : une invalidation (invalidate_documents, clear)
+    ne concerne pas les autres workers de l'API. Les changements faits ailleurs passent par
+    la version : celle du corpus est relue par chaque processus, et les versions d'index des
+    documents actifs (lues en base à chaque requête) y sont ajoutées, de sorte qu'un document
+    réindexé par un worker n'est plus servi depuis les anciennes réponses.
+    Les compteurs sont journalisés toutes les `stats_log_interval` recherches.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        stats_log_interval: int = 0
+    ):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.stats_log_interval = stats_log_interval
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: Iterable[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _is_expired(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def lookup(
+        self, embedding: Iterable[float], document_uids: Iterable[str], corpus_version: Optional[str] = None
+    ) -> Optional[CachedAnswer]:
+        """Retourne la réponse la plus proche au-dessus du seuil, ou None."""
+        query = self._normalize(embedding)
+        document_set = frozenset(document_uids)
+        now = time.monotonic()
+
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, entry in list(self._entries.items()):
+                if self._is_expired(entry, now):
+                    del self._entries[key]
+                    continue
+                if entry.document_set != document_set or entry.corpus_version != corpus_version:
+                    continue
+                score = float(np.dot(query, entry.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                logger.info(f"Cache de réponses : succès (similarité {best_score:.3f})")
+            if self.stats_log_interval and (self.hits + self.misses) % self.stats_log_interval == 0:
+                logger.info(f"Cache de réponses : {self._format_stats(self._stats())}")
+            return self._entries[best_key] if best_key is not None else None
+
+    def store(
+        self,
+        question: str,
+        embedding: Iterable[float],
+        document_uids: Iterable[str],
+        answer: str,
+        source_documents: Optional[List[LangchainDocument]] = None,
+        corpus_version: Optional[str] = None
+    ) -> None:
+        """
+        Ajoute une réponse au cache en évinçant la moins récemment utilisée si nécessaire.
+        `corpus_version` est la version du corpus lue avant la recherche des fragments.
+        """
+        entry = CachedAnswer(
+            question=question,
+            document_set=frozenset(document_uids),
+            corpus_version=corpus_version,
+            embedding=self._normalize(embedding),
+            answer=answer,
+            source_documents=list(source_documents or []),
+        )
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_documents(self, document_uids: Iterable[str]) -> int:
+        """Supprime les entrées dont l'ensemble de documents contient l'un des UIDs donnés."""
+        changed = set(document_uids)
+        with self._lock:
+            stale_keys = [key for key, entry in self._entries.items() if entry.document_set & changed]
+            for key in stale_keys:
+                del self._entries[key]
+            self.invalidations += len(stale_keys)
+        if stale_keys:
+            logger.info(f"Cache de réponses : {len(stale_keys)} entrée(s) invalidée(s)")
+        return len(stale_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def _stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    @staticmethod
+    def _format_stats(stats: Dict[str, float]) -> str:
+        return (
+            f"{stats['entries']} entrée(s), {stats['hits']} succès / {stats['misses']} échec(s) "
+            f"(taux {stats['hit_rate']:.1%}), {stats['evictions']} éviction(s), "
+            f"{stats['invalidations']} invalidation(s)"
+        )
+
+    def stats(self) -> Dict[str, float]:
+        """Compteurs du cache, dont le taux de succès."""
+        with self._lock:
+            return self._stats()
+
+
+# Instance globale du cache de réponses (pattern singleton)
+_answer_cache = None
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Initialise et retourne le cache de réponses partagé."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = SemanticAnswerCache(
+            max_entries=Config.RAG_ANSWER_CACHE_SIZE,
+            similarity_threshold=Config.RAG_ANSWER_CACHE_THRESHOLD,
+            ttl_seconds=Config.RAG_ANSWER_CACHE_TTL,
+            stats_log_interval=Config.RAG_ANSWER_CACHE_STATS_INTERVAL,
+        )
+    return _answer_cache
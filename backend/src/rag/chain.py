@@ -1,16 +1,31 @@
 import logging
-from typing import List, Optional, Tuple
+import time
+from typing import AsyncIterator, List, Optional, Tuple
 import asyncio
 
-from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.prompts import PromptTemplate
 from langchain_core.documents import Document as LangchainDocument
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 from src.config import Config
-from .vectorstore import get_filtered_retriever
+from .cache import get_answer_cache
+from .executors import run_interactive
+from .federation import SOURCE_CORPUS, SOURCE_UPLOADS, fusion_sources, quotas_sources
+from .lexical import get_lexical_index
+from .metrics import RagRequestMetrics
+from .reranker import get_reranker, reranker_fragments
+from .splitter import get_token_counter
+from .utils import estimer_tokens
+from .vectorstore import (
+    EMBEDDING_MODEL_NAME, corpus_version, get_corpus_retriever, get_embedding_function, get_filtered_retriever,
+    get_vectorstore,
+)
 
-import re 
+import re
 
 # Configuration du système de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -38,6 +53,54 @@ template_arabe = """أنت خبير في الفقه المالكي.
 
 الإجابة:"""
 
+QA_PROMPT = PromptTemplate(template=template_arabe, input_variables=["context", "question"])
+
+# Frontières de phrase utilisées pour découper les réponses sans casser le Markdown :
+# ponctuation finale latine ou arabe (؟ ۔) suivie d'espaces, ou fin de ligne
+SENTENCE_SPLIT_PATTERN = re.compile(r'([.!?؟۔]+\s+|\n\s*)')
+# Frontière de phrase confirmée par un caractère non blanc (utilisée sur un flux incomplet)
+COMPLETE_SENTENCE_PATTERN = re.compile(r'(?:[.!?؟۔]+\s+|\n\s*)(?=\S)')
+
+# Template de mise à jour du résumé glissant de l'historique
+template_resume = """لخص المحادثة التالية بين مستخدم وخبير في الفقه المالكي في فقرة قصيرة باللغة العربية،
+مع الاحتفاظ بالمسائل المطروحة والأحكام المذكورة.
+
+الملخص السابق:
+{summary}
+
+التبادلات الجديدة:
+{turns}
+
+الملخص المحدث:"""
+
+SUMMARY_PROMPT = PromptTemplate(template=template_resume, input_variables=["summary", "turns"])
+
+# Question fictive utilisée pour injecter le résumé dans l'historique
+SUMMARY_TURN_PROMPT = "[ملخص المحادثة السابقة]"
+
+# Politiques de reformulation de la question avant la recherche
+REWRITE_NEVER = "never"
+REWRITE_ALWAYS = "always"
+REWRITE_HEURISTIC = "heuristic"
+
+# Mots indiquant qu'une question fait référence aux échanges précédents
+# (pronoms, démonstratifs et formules de relance en arabe, français et anglais).
+# Les pronoms des tournures interrogatives ("ما هو", "faut-il", "is it") sont exclus.
+REFERENCE_WORDS = {
+    "هذا", "هذه", "ذلك", "تلك", "هؤلاء", "أولئك",
+    "عنه", "عنها", "عنهم", "منه", "منها", "منهم", "فيه", "فيها", "فيهم", "له", "لها", "لهم",
+    "به", "بها", "بهم", "عليه", "عليها", "عليهم", "إليه", "إليها", "حكمه", "حكمها",
+    "السابق", "السابقة", "المذكور", "المذكورة", "أيضا", "أيضاً", "كذلك", "نفس", "وماذا", "ولماذا", "وكيف",
+    "elle", "ils", "elles", "cela", "ça", "celui", "celle", "ceci", "lui", "leur", "aussi",
+    "précédent", "précédente", "this", "they", "them", "he", "she", "also", "previous",
+}
+# En dessous de ce nombre de mots, une question est considérée comme une relance
+MIN_SELF_CONTAINED_WORDS = 3
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Nombre de fragments transmis au LLM
+RETRIEVER_K = 7
+
 # Instance globale du modèle LLM (pattern singleton)
 _llm_instance = None
 
@@ -62,46 +125,277 @@ def get_llm():
             raise
     return _llm_instance
 
-def initialize_rag_chain():
-    """Initialise le LLM au démarrage de l'application."""
-    logger.info("Pré-initialisation du LLM...")
-    get_llm()
+# Chaînes LCEL partagées entre toutes les requêtes (construites une seule fois)
+_condense_question_chain = None
+_answer_chain = None
+_summary_chain = None
+
+def get_condense_question_chain() -> Runnable:
+    """Retourne la chaîne de reformulation de la question (pattern singleton)."""
+    global _condense_question_chain
+    if _condense_question_chain is None:
+        _condense_question_chain = CONDENSE_QUESTION_PROMPT | get_llm() | StrOutputParser()
+    return _condense_question_chain
+
+def get_answer_chain() -> Runnable:
+    """Retourne la chaîne de génération de la réponse (pattern singleton)."""
+    global _answer_chain
+    if _answer_chain is None:
+        _answer_chain = QA_PROMPT | get_llm() | StrOutputParser()
+    return _answer_chain
+
+def get_summary_chain() -> Runnable:
+    """Retourne la chaîne de résumé de l'historique (pattern singleton)."""
+    global _summary_chain
+    if _summary_chain is None:
+        _summary_chain = SUMMARY_PROMPT | get_llm() | StrOutputParser()
+    return _summary_chain
 
-def create_contextual_rag_chain(
-    active_document_uids: List[str]
-) -> Tuple[ConversationalRetrievalChain, int]:
+async def summarize_history(previous_summary: Optional[str], turns: List[Tuple[str, str]]) -> str:
     """
-    Crée une chaîne RAG contextualisée pour une conversation spécifique.
+    Intègre des échanges sortis de la fenêtre d'historique dans le résumé glissant.
     
     Args:
-        active_document_uids: Liste des identifiants uniques des documents à utiliser
+        previous_summary: Résumé existant de la conversation (ou None)
+        turns: Échanges (prompt, réponse) à intégrer, du plus ancien au plus récent
+    
+    Returns:
+        Le résumé mis à jour
+    """
+    summary = await get_summary_chain().ainvoke({
+        "summary": previous_summary or "-",
+        "turns": _get_chat_history(turns)
+    })
+    return summary.strip()
+
+def trim_history_to_token_budget(
+    chat_history: List[Tuple[str, str]],
+    token_budget: int
+) -> List[Tuple[str, str]]:
+    """
+    Conserve les échanges les plus récents dont la taille cumulée tient dans le budget.
+    
+    Args:
+        chat_history: Historique ordonné du plus ancien au plus récent
+        token_budget: Nombre maximal de tokens (estimés) à conserver
+    
+    Returns:
+        Suffixe de l'historique respectant le budget
+    """
+    kept = 0
+    used_tokens = 0
+    for prompt, response in reversed(chat_history):
+        turn_tokens = estimer_tokens(prompt) + estimer_tokens(response)
+        if used_tokens + turn_tokens > token_budget:
+            break
+        used_tokens += turn_tokens
+        kept += 1
+    return chat_history[len(chat_history) - kept:]
+
+def initialize_rag_chain():
+    """Initialise le LLM, les chaînes RAG, le vectorstore et le tokenizer du découpage au démarrage de l'application."""
+    logger.info("Pré-initialisation du LLM et des chaînes RAG...")
+    get_condense_question_chain()
+    get_answer_chain()
+    get_vectorstore()
+    get_token_counter(EMBEDDING_MODEL_NAME)
+    if Config.RAG_RERANK_ENABLED:
+        get_reranker()
+
+def needs_question_rewrite(
+    question: str,
+    chat_history: List[Tuple[str, str]],
+    policy: Optional[str] = None
+) -> bool:
+    """
+    Indique si la question doit être reformulée par le LLM avant la recherche.
+    
+    Politiques :
+    - "never" : la question est toujours utilisée telle quelle
+    - "always" : reformulation dès qu'un historique existe (comportement de ConversationalRetrievalChain)
+    - "heuristic" : reformulation seulement si la question semble faire référence
+      aux échanges précédents (pronoms, démonstratifs, relance très courte)
+    """
+    policy = policy or Config.RAG_QUESTION_REWRITE_POLICY
+    if not chat_history or policy == REWRITE_NEVER:
+        return False
+    if policy == REWRITE_ALWAYS:
+        return True
+
+    words = [word.lower() for word in WORD_PATTERN.findall(question)]
+    if len(words) < MIN_SELF_CONTAINED_WORDS:
+        return True
+    return any(word in REFERENCE_WORDS for word in words)
+
+async def _resolve_question(
+    question: str,
+    chat_history: List[Tuple[str, str]],
+    metrics: RagRequestMetrics
+) -> str:
+    """
+    Reformule la question en question autonome si la politique l'exige,
+    comme le faisait ConversationalRetrievalChain.
+    """
+    if needs_question_rewrite(question, chat_history):
+        with metrics.timer("reformulation"):
+            condensed = await get_condense_question_chain().ainvoke(
+                {"question": question, "chat_history": _get_chat_history(chat_history)},
+                config={"callbacks": metrics.callbacks()}
+            )
+        standalone_question = condensed.strip() or question
+        metrics.question_rewritten = True
+        logger.info(f"Question reformulée: {standalone_question[:100]}...")
+        return standalone_question
+    if chat_history:
+        logger.info("Reformulation ignorée : question autonome")
+    return question
+
+async def _vector_search(
+    question: str, active_document_uids: List[str], k: int, metrics: RagRequestMetrics
+) -> List[LangchainDocument]:
+    with metrics.timer("recherche_vecteurs"):
+        retriever = get_filtered_retriever(active_document_uids, k=k)
+        # Recherche Chroma et embedding de la question sont bloquants : pool interactif borné
+        return await run_interactive(retriever.invoke, question)
+
+async def _lexical_search(
+    question: str, active_document_uids: List[str], k: int, metrics: RagRequestMetrics
+) -> List[LangchainDocument]:
+    """Recherche BM25 ; en cas d'erreur (index absent ou corrompu), seule la recherche vectorielle est utilisée."""
+    with metrics.timer("recherche_bm25"):
+        try:
+            return await run_interactive(get_lexical_index().search, question, active_document_uids, k)
+        except Exception as e:
+            logger.warning(f"Recherche BM25 ignorée : {e}")
+            return []
+
+async def _corpus_vector_search(question: str, k: int, metrics: RagRequestMetrics) -> List[LangchainDocument]:
+    """Recherche vectorielle dans le corpus de base ; en cas d'erreur, seuls les documents de la conversation sont utilisés."""
+    with metrics.timer("recherche_corpus_vecteurs"):
+        try:
+            return await run_interactive(get_corpus_retriever(k).invoke, question)
+        except Exception as e:
+            logger.warning(f"Recherche vectorielle dans le corpus ignorée : {e}")
+            return []
+
+async def _corpus_lexical_search(question: str, k: int, metrics: RagRequestMetrics) -> List[LangchainDocument]:
+    with metrics.timer("recherche_corpus_bm25"):
+        try:
+            return await run_interactive(get_lexical_index().search_corpus, question, k)
+        except Exception as e:
+            logger.warning(f"Recherche BM25 dans le corpus ignorée : {e}")
+            return []
+
+async def _source_rankings(
+    source: str, question: str, active_document_uids: List[str], k: int, metrics: RagRequestMetrics
+) -> List[List[LangchainDocument]]:
+    """Classements d'une source : vectoriel, et BM25 en parallèle en recherche hybride."""
+    if source == SOURCE_CORPUS:
+        searches = [_corpus_vector_search(question, k, metrics)]
+        if Config.HYBRID_SEARCH_ENABLED:
+            searches.append(_corpus_lexical_search(question, k, metrics))
+    else:
+        searches = [_vector_search(question, active_document_uids, k, metrics)]
+        if Config.HYBRID_SEARCH_ENABLED:
+            searches.append(_lexical_search(question, active_document_uids, k, metrics))
+    return list(await asyncio.gather(*searches))
+
+async def _rerank(
+    question: str, documents: List[LangchainDocument], metrics: RagRequestMetrics
+) -> List[LangchainDocument]:
+    """
+    Reclasse les candidats avec le cross-encoder dans la limite de RAG_RERANK_BUDGET_MS.
+    Budget dépassé (y compris au chargement du modèle) ou erreur : les RETRIEVER_K premiers
+    candidats sont conservés dans l'ordre de la recherche.
+    """
+    budget = Config.RAG_RERANK_BUDGET_MS / 1000
+    ranked = None
+    with metrics.timer("reclassement"):
+        try:
+            # Le calcul s'interrompt aussi de lui-même à l'échéance, entre deux lots dimensionnés
+            # pour tenir dans le temps restant (le thread n'est pas arrêté par wait_for)
+            ranked = await asyncio.wait_for(
+                run_interactive(reranker_fragments, question, documents, Config.RAG_RERANK_TOP_N,
+                                time.monotonic() + budget),
+                timeout=budget,
+            )
+        except asyncio.TimeoutError:
+            pass
+        except Exception as e:
+            logger.warning(f"Reclassement ignoré : {e}")
+    metrics.reranked = ranked is not None
+    if ranked is None:
+        logger.info(f"Reclassement abandonné (budget de {Config.RAG_RERANK_BUDGET_MS} ms), ordre de la recherche conservé")
+        return documents[:RETRIEVER_K]
+    return ranked
+
+async def _retrieve_context(
+    standalone_question: str,
+    active_document_uids: List[str],
+    metrics: RagRequestMetrics
+) -> Tuple[dict, List[LangchainDocument]]:
+    """
+    Recherche les documents filtrés et prépare les entrées de la chaîne de réponse.
+    Le filtre par documents actifs est appliqué au moment de l'appel.
+    Les documents actifs de la conversation et le corpus de base sont interrogés en
+    parallèle, puis fusionnés par score normalisé selon les quotas de Config.RAG_SOURCE_QUOTAS ;
+    chaque fragment est marqué de sa source (voir fusion_sources).
+    En recherche hybride, chaque source combine recherches vectorielle et BM25, elles
+    aussi lancées en parallèle (durées propres dans les métriques).
+    Avec le reclassement, davantage de candidats sont recherchés puis les meilleurs
+    sont retenus par le cross-encoder.
     
     Returns:
-        Tuple contenant la chaîne RAG configurée et le nombre de documents actifs
+        Tuple contenant (entrées_de_la_chaîne_de_réponse, documents_sources)
+    """
+    k = Config.RAG_RERANK_CANDIDATES if Config.RAG_RERANK_ENABLED else RETRIEVER_K
+    candidates = max(Config.HYBRID_CANDIDATES, k) if Config.HYBRID_SEARCH_ENABLED else k
+    quotas = quotas_sources(k)
+    # Sans document actif, seul le corpus est interrogé
+    sources = [
+        source for source in (SOURCE_UPLOADS, SOURCE_CORPUS)
+        if quotas.get(source) and (source != SOURCE_UPLOADS or active_document_uids)
+    ]
+    with metrics.timer("recherche"):
+        rankings = await asyncio.gather(*(
+            _source_rankings(source, standalone_question, active_document_uids, candidates, metrics)
+            for source in sources
+        ))
+        source_documents = fusion_sources(dict(zip(sources, rankings)), k=k)
+    logger.info(
+        "Recherche : " + ", ".join(
+            f"{source} {'/'.join(str(len(ranking)) for ranking in source_rankings)}"
+            for source, source_rankings in zip(sources, rankings)
+        ) + f" ; {len(source_documents)} fragment(s) après fusion"
+    )
+    if Config.RAG_RERANK_ENABLED and source_documents:
+        source_documents = await _rerank(standalone_question, source_documents, metrics)
+    metrics.retrieved_documents = len(source_documents)
+
+    context = "\n\n".join(doc.page_content for doc in source_documents)
+    return {"context": context, "question": standalone_question}, source_documents
+
+async def _embed_question_for_cache(standalone_question: str, metrics: RagRequestMetrics) -> Optional[List[float]]:
     """
-    logger.info(f"Création d'une chaîne RAG avec {len(active_document_uids)} documents actifs")
+    Calcule l'embedding de la question utilisé comme clé du cache de réponses (le cache
+    d'embeddings le range sous la question normalisée, que la recherche retrouve ensuite).
+    Retourne None si le cache est désactivé ou si l'embedding échoue.
+    """
+    if not Config.RAG_ANSWER_CACHE_ENABLED:
+        return None
     try:
-        llm = get_llm()
-        retriever = get_filtered_retriever(active_document_uids, k=7)
-        QA_PROMPT = PromptTemplate(template=template_arabe, input_variables=["context", "question"])
-
-        rag_chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            retriever=retriever,
-            return_source_documents=True,
-            combine_docs_chain_kwargs={"prompt": QA_PROMPT},
-        )
-        
-        logger.info("Chaîne RAG contextualisée créée avec succès")
-        return rag_chain, len(active_document_uids)
+        with metrics.timer("cache"):
+            return await run_interactive(get_embedding_function().embed_query, standalone_question)
     except Exception as e:
-        logger.error(f"Erreur lors de la création de la chaîne RAG: {e}", exc_info=True)
-        raise
+        logger.warning(f"Cache de réponses ignoré (embedding impossible): {e}")
+        return None
 
 async def generate_contextual_rag_response(
     question: str,
     active_document_uids: List[str],
-    chat_history: List[Tuple[str, str]]
+    chat_history: List[Tuple[str, str]],
+    metrics: Optional[RagRequestMetrics] = None,
+    index_stamp: str = ""
 ) -> Tuple[str, Optional[List[LangchainDocument]], int]:
     """
     Génère une réponse RAG en utilisant uniquement les documents actifs de la conversation.
@@ -110,6 +404,8 @@ async def generate_contextual_rag_response(
         question: La question posée par l'utilisateur
         active_document_uids: Liste des identifiants des documents à consulter
         chat_history: Historique des échanges précédents
+        metrics: Métriques de la requête à compléter (créées si absentes)
+        index_stamp: Versions d'index des documents actifs, ajoutées à la clé du cache de réponses
     
     Returns:
         Tuple contenant (réponse_générée, documents_sources_utilisés, nombre_documents_actifs)
@@ -118,97 +414,228 @@ async def generate_contextual_rag_response(
     logger.info(f"Question: {question[:100]}...")
     logger.info(f"Documents actifs: {len(active_document_uids)}")
     logger.info(f"Historique: {len(chat_history)} échanges")
+    metrics = metrics if metrics is not None else RagRequestMetrics()
     
     try:
-        rag_chain, doc_count = create_contextual_rag_chain(active_document_uids)
-        
-        result = await rag_chain.ainvoke({
-            "question": question,
-            "chat_history": chat_history
-        })
-        
-        ai_response_text = result.get("answer", "Désolé, une erreur est survenue.")
-        source_documents = result.get("source_documents")
+        standalone_question = await _resolve_question(question, chat_history, metrics)
+        cache_key = await _embed_question_for_cache(standalone_question, metrics)
+        corpus_key = f"{corpus_version()}|{index_stamp}" if cache_key is not None else None
+        if cache_key is not None:
+            cached = get_answer_cache().lookup(cache_key, active_document_uids, corpus_key)
+            if cached is not None:
+                metrics.answer_cache_hit = True
+                logger.info(f"Réponse servie depuis le cache ({metrics.as_log()})")
+                return cached.answer, cached.source_documents, len(active_document_uids)
+
+        answer_inputs, source_documents = await _retrieve_context(
+            standalone_question, active_document_uids, metrics
+        )
+        with metrics.timer("generation"):
+            ai_response_text = await get_answer_chain().ainvoke(
+                answer_inputs, config={"callbacks": metrics.callbacks()}
+            )
+        if cache_key is not None:
+            get_answer_cache().store(
+                standalone_question, cache_key, active_document_uids, ai_response_text, source_documents, corpus_key
+            )
         
-        logger.info(f"Réponse générée avec succès")
+        logger.info(f"Réponse générée avec succès ({metrics.as_log()})")
         if source_documents:
             logger.info(f"Sources utilisées: {len(source_documents)} documents")
             for i, doc in enumerate(source_documents):
                 logger.debug(f"Source {i+1}: {doc.metadata}")
         
-        return ai_response_text, source_documents, doc_count
+        return ai_response_text, source_documents, len(active_document_uids)
 
     except Exception as e:
         logger.error(f"Erreur lors de la génération de la réponse RAG: {e}", exc_info=True)
         return "Désolé, je n'ai pas pu traiter votre demande.", None, len(active_document_uids)
 
+class MarkdownChunker:
+    """
+    Regroupe des phrases complètes en chunks d'environ `chunk_size` caractères.
+    Les frontières sont identiques en mode simulé et en streaming réel.
+    """
+
+    def __init__(self, chunk_size: int = 80):
+        self.chunk_size = chunk_size
+        self._current_chunk = ""
+
+    def add_sentence(self, sentence: str) -> Optional[str]:
+        """Ajoute une phrase et retourne un chunk complet si la taille est atteinte."""
+        if not sentence.strip():
+            return None
+
+        if len(self._current_chunk + sentence) > self.chunk_size and self._current_chunk:
+            chunk = self._current_chunk.strip()
+            self._current_chunk = sentence
+            return chunk
+
+        self._current_chunk += sentence
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Retourne le dernier chunk en attente, s'il n'est pas vide."""
+        chunk = self._current_chunk.strip()
+        self._current_chunk = ""
+        return chunk or None
+
+
+def _split_sentences(text: str) -> List[str]:
+    """Découpe un texte en phrases en conservant la ponctuation finale."""
+    parts = SENTENCE_SPLIT_PATTERN.split(text)
+    return [
+        parts[i] + parts[i + 1] if i + 1 < len(parts) else parts[i]
+        for i in range(0, len(parts), 2)
+    ]
+
+
 def simulate_streaming(text: str, chunk_size: int = 80, delay: float = 0.08):
     """
     Version améliorée qui préserve la structure Markdown.
     """
-    # Trouver les points naturels de rupture (fin de phrase, après ponctuation)
-    sentences = re.split(r'([.!?]+\s+)', text)
-    
-    current_chunk = ""
-    for i in range(0, len(sentences), 2):
-        if i + 1 < len(sentences):
-            sentence = sentences[i] + sentences[i + 1]
-        else:
-            sentence = sentences[i]
-            
-        if not sentence.strip():
-            continue
-            
-        if len(current_chunk + sentence) > chunk_size and current_chunk:
-            yield current_chunk.strip()
-            current_chunk = sentence
-        else:
-            current_chunk += sentence
-    
-    if current_chunk.strip():
-        yield current_chunk.strip()
+    chunker = MarkdownChunker(chunk_size)
+    for sentence in _split_sentences(text):
+        chunk = chunker.add_sentence(sentence)
+        if chunk:
+            yield chunk
+
+    last_chunk = chunker.flush()
+    if last_chunk:
+        yield last_chunk
+
+
+async def stream_markdown_chunks(tokens: AsyncIterator[str], chunk_size: int = 80) -> AsyncIterator[str]:
+    """
+    Regroupe un flux de tokens en chunks alignés sur les fins de phrase.
+    Une phrase n'est émise que lorsque sa ponctuation finale est suivie d'un
+    caractère non blanc, ce qui donne les mêmes frontières que simulate_streaming.
+    """
+    chunker = MarkdownChunker(chunk_size)
+    buffer = ""
+
+    async for token in tokens:
+        buffer += token
+        consumed = 0
+        for match in COMPLETE_SENTENCE_PATTERN.finditer(buffer):
+            chunk = chunker.add_sentence(buffer[consumed:match.end()])
+            consumed = match.end()
+            if chunk:
+                yield chunk
+        buffer = buffer[consumed:]
+
+    # Fin du flux : le reste du tampon est traité comme dans simulate_streaming
+    for sentence in _split_sentences(buffer):
+        chunk = chunker.add_sentence(sentence)
+        if chunk:
+            yield chunk
+
+    last_chunk = chunker.flush()
+    if last_chunk:
+        yield last_chunk
 
 
 async def stream_contextual_rag_response(
     question: str,
     active_document_uids: List[str],
-    chat_history: List[Tuple[str, str]]
+    chat_history: List[Tuple[str, str]],
+    metrics: Optional[RagRequestMetrics] = None,
+    index_stamp: str = ""
 ):
     """
-    Génère une réponse RAG avec simulation de streaming.
+    Génère une réponse RAG en streaming.
+    En mode "tokens", les tokens du LLM sont regroupés en chunks Markdown et
+    transmis dès leur arrivée ; en mode "simulated", la réponse complète est
+    générée puis découpée.
     
     Args:
         question: La question posée par l'utilisateur
         active_document_uids: Liste des identifiants des documents à consulter
         chat_history: Historique des échanges précédents
+        metrics: Métriques de la requête à compléter (créées si absentes)
+        index_stamp: Versions d'index des documents actifs, ajoutées à la clé du cache de réponses
     
     Yields:
-        str: Chunks de la réponse simulant un streaming
+        str: Chunks de la réponse
     """
     logger.info(f"Début du streaming RAG pour la question: {question[:50]}...")
+    metrics = metrics if metrics is not None else RagRequestMetrics()
     
     try:
-        # Génération de la réponse complète d'abord
-        rag_chain, _ = create_contextual_rag_chain(active_document_uids)
-        
-        result = await rag_chain.ainvoke({
-            "question": question,
-            "chat_history": chat_history
-        })
-        
-        ai_response_text = result.get("answer", "Désolé, une erreur est survenue.")
-        logger.info(f"Réponse complète générée ({len(ai_response_text)} caractères)")
-        
-        # Simulation du streaming par chunks
+        standalone_question = await _resolve_question(question, chat_history, metrics)
+        cache_key = await _embed_question_for_cache(standalone_question, metrics)
+        corpus_key = f"{corpus_version()}|{index_stamp}" if cache_key is not None else None
+        if cache_key is not None:
+            cached = get_answer_cache().lookup(cache_key, active_document_uids, corpus_key)
+            if cached is not None:
+                metrics.answer_cache_hit = True
+                for chunk in simulate_streaming(cached.answer, chunk_size=Config.RAG_STREAM_CHUNK_SIZE):
+                    yield chunk
+                logger.info(f"Réponse servie depuis le cache ({metrics.as_log()})")
+                return
+
+        if Config.RAG_STREAMING_MODE == "simulated":
+            async for chunk in _stream_simulated_response(
+                standalone_question, active_document_uids, metrics, cache_key, corpus_key
+            ):
+                yield chunk
+            return
+
+        answer_inputs, source_documents = await _retrieve_context(
+            standalone_question, active_document_uids, metrics
+        )
+        logger.info(f"Contexte prêt ({len(source_documents)} documents), début de la génération")
+
+        tokens = get_answer_chain().astream(answer_inputs, config={"callbacks": metrics.callbacks()})
         chunk_count = 0
-        for chunk in simulate_streaming(ai_response_text, chunk_size=20, delay=0.05):
-            chunk_count += 1
-            logger.info(f"Streaming chunk {chunk_count}: '{chunk}' (length: {len(chunk)})")
-            yield chunk
-            await asyncio.sleep(0.05)  # Petit délai pour simuler le streaming
-            
-        logger.info(f"Streaming terminé - {chunk_count} chunks envoyés")
+        generated_text = []
+
+        async def collect(token_stream):
+            async for token in token_stream:
+                generated_text.append(token)
+                yield token
+
+        with metrics.timer("generation"):
+            async for chunk in stream_markdown_chunks(collect(tokens), chunk_size=Config.RAG_STREAM_CHUNK_SIZE):
+                chunk_count += 1
+                logger.debug(f"Streaming chunk {chunk_count}: '{chunk}' (length: {len(chunk)})")
+                yield chunk
+
+        # La réponse n'est mise en cache qu'une fois le flux terminé sans erreur
+        if cache_key is not None:
+            get_answer_cache().store(
+                standalone_question, cache_key, active_document_uids, "".join(generated_text), source_documents,
+                corpus_key,
+            )
+        logger.info(f"Streaming terminé - {chunk_count} chunks envoyés ({metrics.as_log()})")
                     
     except Exception as e:
         logger.error(f"Erreur pendant le streaming de la réponse RAG: {e}", exc_info=True)
-        yield "Désolé, une erreur interne est survenue."
\ No newline at end of file
+        yield "Désolé, une erreur interne est survenue."
+
+
+async def _stream_simulated_response(
+    standalone_question: str,
+    active_document_uids: List[str],
+    metrics: RagRequestMetrics,
+    cache_key: Optional[List[float]] = None,
+    corpus_key: Optional[str] = None
+):
+    """Génère la réponse complète puis la découpe (ancien comportement)."""
+    answer_inputs, source_documents = await _retrieve_context(standalone_question, active_document_uids, metrics)
+    with metrics.timer("generation"):
+        ai_response_text = await get_answer_chain().ainvoke(answer_inputs, config={"callbacks": metrics.callbacks()})
+    if cache_key is not None:
+        get_answer_cache().store(
+            standalone_question, cache_key, active_document_uids, ai_response_text, source_documents, corpus_key
+        )
+    logger.info(f"Réponse complète générée ({len(ai_response_text)} caractères)")
+    
+    chunk_count = 0
+    for chunk in simulate_streaming(ai_response_text, chunk_size=Config.RAG_STREAM_CHUNK_SIZE, delay=0.05):
+        chunk_count += 1
+        logger.info(f"Streaming chunk {chunk_count}: '{chunk}' (length: {len(chunk)})")
+        yield chunk
+        await asyncio.sleep(0.05)  # Petit délai pour simuler le streaming
+        
+    logger.info(f"Streaming terminé - {chunk_count} chunks envoyés ({metrics.as_log()})")
@@ -0,0 +1,156 @@
+import logging
+import os
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+from .utils import normaliser_texte_arabe
+
+logger = logging.getLogger(__name__)
+
+# Nombre premier de Mersenne 2^31 - 1 : les produits a * h tiennent dans un int64
+_MERSENNE_PRIME = (1 << 31) - 1
+# Taille des n-grammes de mots comparés
+SHINGLE_SIZE = 3
+
+
+@dataclass
+class DedupReport:
+    """Bilan du dédoublonnage : fragments écartés et octets de texte économisés."""
+    seen: int = 0
+    dropped: int = 0
+    bytes_saved: int = 0
+    # Fragment écarté -> fragment conservé dont il est un quasi-doublon
+    links: Dict[str, str] = field(default_factory=dict)
+
+
+def choisir_bandes(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Choisit le découpage LSH (bandes, lignes par bande) dont le seuil implicite
+    (1/b)^(1/r) est le plus proche du seuil demandé sans le dépasser (rappel privilégié).
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    return max(below or options[:1], key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+class NearDuplicateIndex:
+    """
+    Détection de quasi-doublons par MinHash et LSH.
+
+    Chaque fragment est réduit à l'ensemble de ses n-grammes de mots (texte normalisé
+    pour l'index), puis à une signature MinHash. Les signatures sont rangées par bandes :
+    seuls les fragments partageant une bande sont comparés, et un fragment est un
+    quasi-doublon si la similarité de Jaccard estimée atteint le seuil.
+
+    Les signatures des fragments conservés peuvent être enregistrées (save) puis
+    rechargées (load, add_signature) : une indexation incrémentale compare ainsi les
+    nouveaux fragments à tout le corpus indexé, pas seulement aux fichiers retraités.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, num_perm: Optional[int] = None, seed: int = 42):
+        self.threshold = Config.DEDUP_THRESHOLD if threshold is None else threshold
+        self.num_perm = num_perm or Config.DEDUP_NUM_PERM
+        self.seed = seed
+        self.bands, self.rows = choisir_bandes(self.num_perm, self.threshold)
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, _MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self._b = generator.integers(0, _MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self._buckets: List[Dict[bytes, List[str]]] = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self.report = DedupReport()
+
+    def signature(self, text: str) -> np.ndarray:
+        """Signature MinHash des n-grammes de mots du texte normalisé."""
+        words = normaliser_texte_arabe(text).split()
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.int64, count=len(shingles))
+        hashes %= _MERSENNE_PRIME
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        """
+        Ajoute un fragment à l'index, sauf s'il est le quasi-doublon d'un fragment déjà vu.
+
+        Returns:
+            Clé du fragment conservé dont il est un doublon, ou None s'il a été ajouté
+        """
+        self.report.seen += 1
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+
+        # Candidats sans répétition, dans un ordre déterministe
+        candidates = dict.fromkeys(candidate for band, band_key in enumerate(band_keys)
+                                   for candidate in self._buckets[band].get(band_key, ()))
+        for candidate in candidates:
+            if (self._signatures[candidate] == signature).mean() >= self.threshold:
+                self.report.dropped += 1
+                self.report.bytes_saved += len(text.encode("utf-8"))
+                self.report.links[key] = candidate
+                return candidate
+
+        self.add_signature(key, signature, band_keys)
+        return None
+
+    def add_signature(self, key: str, signature: np.ndarray, band_keys: Optional[List[bytes]] = None) -> None:
+        """Ajoute un fragment conservé (signature déjà calculée) sans le comparer aux autres."""
+        self._signatures[key] = signature
+        for band, band_key in enumerate(band_keys or self._band_keys(signature)):
+            self._buckets[band][band_key].append(key)
+
+    def save(self, path: str, keys: Iterable[str]) -> int:
+        """
+        Enregistre les signatures des fragments `keys` présents dans l'index (fichier .npz,
+        écrit de manière atomique).
+
+        Returns:
+            Nombre de signatures enregistrées
+        """
+        keys = [key for key in keys if key in self._signatures]
+        return self._write(path, keys, [self._signatures[key] for key in keys])
+
+    def prune(self, path: str, keys: Iterable[str]) -> int:
+        """
+        Retire du fichier de signatures les fragments absents de `keys`, sans reconstruire
+        l'index (fichiers supprimés lors d'une exécution sans fichier retraité).
+
+        Returns:
+            Nombre de signatures conservées
+        """
+        stored = self.load(path)
+        if not stored:
+            return 0
+        keys = [key for key in keys if key in stored]
+        if len(keys) < len(stored):
+            self._write(path, keys, [stored[key] for key in keys])
+        return len(keys)
+
+    def _write(self, path: str, keys: List[str], signatures: List[np.ndarray]) -> int:
+        signatures = np.stack(signatures) if keys else np.empty((0, self.num_perm), dtype=np.int64)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=np.array(keys, dtype=str), signatures=signatures,
+                     params=np.array([self.num_perm, self.seed, SHINGLE_SIZE]))
+        os.replace(tmp_path, path)
+        return len(keys)
+
+    def load(self, path: str) -> Dict[str, np.ndarray]:
+        """
+        Signatures enregistrées par save avec les mêmes paramètres (sinon, ou sans
+        fichier, aucune : elles sont à recalculer).
+        """
+        if not os.path.exists(path):
+            return {}
+        with np.load(path, allow_pickle=False) as data:
+            if data["params"].tolist() != [self.num_perm, self.seed, SHINGLE_SIZE]:
+                logger.info(f"Signatures {path} calculées avec d'autres paramètres, ignorées")
+                return {}
+            return dict(zip(data["keys"].tolist(), data["signatures"]))
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.config import Config
+from .utils import normaliser_requete, normaliser_texte_arabe
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "emb"
+
+
+class NormalizedEmbeddings(Embeddings):
+    """
+    Applique la normalisation d'index (normaliser_texte_arabe) aux fragments comme
+    aux questions avant le calcul des embeddings : les deux côtés de la recherche
+    sont comparés sous la même forme. Le texte stocké dans ChromaDB n'est pas modifié.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents([normaliser_texte_arabe(text) for text in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(normaliser_texte_arabe(text))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Enveloppe un modèle d'embedding et met en cache les embeddings de requêtes.
+
+    La clé est le nom du modèle et la question normalisée (normaliser_requete :
+    diacritiques, tatweel, formes d'alif, casse et ponctuation finale), de sorte que
+    deux graphies d'une même question partagent le même embedding. C'est la même
+    normalisation que la clé du cache de réponses : la recherche et le cache de
+    réponses utilisent un seul embedding par question. Cette normalisation ne sert
+    qu'à la clé : le modèle enveloppé reçoit la question telle quelle (NormalizedEmbeddings
+    lui applique la normalisation d'index, comme aux fragments).
+    Un cache LRU en mémoire est consulté en premier, puis, si un client Redis est
+    fourni, un niveau partagé entre les processus.
+    Les embeddings de documents ne sont pas mis en cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 2048,
+        redis_client=None,
+        redis_ttl: int = 86400
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.redis_client = redis_client
+        self.redis_ttl = redis_ttl
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redis_key(self, normalized_text: str) -> str:
+        digest = hashlib.sha1(normalized_text.encode("utf-8")).hexdigest()
+        return f"{REDIS_KEY_PREFIX}:{self.model_name}:{digest}"
+
+    def _get_from_redis(self, normalized_text: str) -> Optional[List[float]]:
+        try:
+            raw = self.redis_client.get(self._redis_key(normalized_text))
+        except Exception as e:
+            logger.warning(f"Cache d'embeddings Redis indisponible: {e}")
+            return None
+        if raw is None:
+            return None
+        return np.frombuffer(raw, dtype=np.float32).tolist()
+
+    def _set_in_redis(self, normalized_text: str, embedding: List[float]) -> None:
+        try:
+            self.redis_client.set(
+                self._redis_key(normalized_text),
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+                ex=self.redis_ttl
+            )
+        except Exception as e:
+            logger.warning(f"Cache d'embeddings Redis indisponible: {e}")
+
+    def _remember(self, key: Tuple[str, str], embedding: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized_text = normaliser_requete(text)
+        key = (self.model_name, normalized_text)
+
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        if self.redis_client is not None:
+            embedding = self._get_from_redis(normalized_text)
+            if embedding is not None:
+                self.redis_hits += 1
+                self._remember(key, embedding)
+                return embedding
+
+        self.misses += 1
+        embedding = self.embeddings.embed_query(text)
+        self._remember(key, embedding)
+        if self.redis_client is not None:
+            self._set_in_redis(normalized_text, embedding)
+        return embedding
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> Dict[str, float]:
+        """Compteurs du cache, dont le taux de succès (mémoire et Redis confondus)."""
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+            }
+
+
+def build_cached_embeddings(embeddings: Embeddings, model_name: str) -> CachedEmbeddings:
+    """Construit le cache d'embeddings à partir de la configuration de l'application."""
+    redis_client = None
+    if Config.RAG_EMBEDDING_CACHE_REDIS:
+        from src.db.redis import embedding_cache
+        redis_client = embedding_cache
+    return CachedEmbeddings(
+        embeddings,
+        model_name=model_name,
+        max_entries=Config.RAG_EMBEDDING_CACHE_SIZE,
+        redis_client=redis_client,
+        redis_ttl=Config.RAG_EMBEDDING_CACHE_TTL,
+    )
@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Pools de threads partagés (pattern singleton), créés au premier usage
+_interactive_executor: Optional[ThreadPoolExecutor] = None
+_ingestion_executor: Optional[ThreadPoolExecutor] = None
+_partition_search_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_interactive_executor() -> ThreadPoolExecutor:
+    """
+    Pool réservé au travail bloquant des requêtes interactives
+    (recherche Chroma, embedding de la question).
+    """
+    global _interactive_executor
+    if _interactive_executor is None:
+        _interactive_executor = ThreadPoolExecutor(
+            max_workers=Config.RAG_INTERACTIVE_WORKERS, thread_name_prefix="rag-interactive"
+        )
+    return _interactive_executor
+
+
+def get_ingestion_executor() -> ThreadPoolExecutor:
+    """
+    Pool réservé à l'ingestion (chargement, découpage, embeddings des documents).
+    Sa petite taille borne le nombre d'ingestions simultanées, sans prendre
+    les threads des requêtes interactives.
+    """
+    global _ingestion_executor
+    if _ingestion_executor is None:
+        _ingestion_executor = ThreadPoolExecutor(
+            max_workers=Config.RAG_INGESTION_WORKERS, thread_name_prefix="rag-ingestion"
+        )
+    return _ingestion_executor
+
+
+def get_partition_search_executor() -> ThreadPoolExecutor:
+    """
+    Pool des recherches dans les partitions d'une même requête (PartitionedRetriever).
+    Distinct du pool interactif, depuis lequel le retriever est appelé : un thread
+    interactif qui attend ses partitions ne peut pas bloquer faute de thread libre.
+    """
+    global _partition_search_executor
+    if _partition_search_executor is None:
+        _partition_search_executor = ThreadPoolExecutor(
+            max_workers=Config.VECTOR_PARTITION_SEARCH_WORKERS, thread_name_prefix="rag-partitions"
+        )
+    return _partition_search_executor
+
+
+async def _run_in(executor: ThreadPoolExecutor, func: Callable, *args: Any, **kwargs: Any) -> Any:
+    # Le contexte (contextvars) est propagé au thread, comme avec asyncio.to_thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(context.run, func, *args, **kwargs)
+    )
+
+
+async def run_interactive(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Exécute une fonction bloquante d'une requête interactive hors de la boucle asyncio."""
+    return await _run_in(get_interactive_executor(), func, *args, **kwargs)
+
+
+async def run_ingestion(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Exécute une fonction bloquante d'ingestion hors de la boucle asyncio."""
+    return await _run_in(get_ingestion_executor(), func, *args, **kwargs)
+
+
+def shutdown_executors() -> None:
+    """Arrête les pools (à l'arrêt de l'application)."""
+    global _interactive_executor, _ingestion_executor, _partition_search_executor
+    for executor in (_interactive_executor, _ingestion_executor, _partition_search_executor):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _interactive_executor = None
+    _ingestion_executor = None
+    _partition_search_executor = None
@@ -0,0 +1,67 @@
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import Config
+from .lexical import scores_rrf
+
+# Sources interrogées en parallèle : documents actifs de la conversation et corpus de base
+SOURCE_UPLOADS = "uploads"
+SOURCE_CORPUS = "corpus"
+# Métadonnée ajoutée à chaque fragment retourné : source dont il provient
+SOURCE_METADATA_KEY = "retrieval_source"
+
+
+def quotas_sources(k: int, shares: Optional[Mapping[str, float]] = None) -> Dict[str, int]:
+    """
+    Nombre maximal de fragments de chaque source parmi les k retenus
+    (part configurée dans Config.RAG_SOURCE_QUOTAS ; une part nulle désactive la source).
+    """
+    shares = Config.RAG_SOURCE_QUOTAS if shares is None else shares
+    return {source: max(1, round(k * share)) if share > 0 else 0 for source, share in shares.items()}
+
+
+def fusion_sources(
+    rankings_by_source: Mapping[str, Sequence[Sequence[Document]]],
+    k: int,
+    shares: Optional[Mapping[str, float]] = None,
+    rrf_k: Optional[int] = None,
+) -> List[Document]:
+    """
+    Fusionne les résultats de plusieurs sources par score normalisé (voir scores_rrf :
+    les classements vectoriel et BM25 de chaque source), dans la limite du quota de chaque
+    source. Les places qu'une source ne peut pas occuper (trop peu de résultats) reviennent
+    aux meilleurs fragments restants des autres sources.
+
+    Args:
+        rankings_by_source: Source -> classements de cette source (vectoriel, BM25...)
+        k: Nombre de fragments retenus
+        shares: Part maximale de chaque source (Config.RAG_SOURCE_QUOTAS par défaut)
+
+    Returns:
+        Les k meilleurs fragments, du meilleur au moins bon, marqués de leur source
+        (métadonnée SOURCE_METADATA_KEY)
+    """
+    quotas = quotas_sources(k, shares)
+    candidates: List[Tuple[float, str, Document]] = sorted(
+        ((score, source, doc) for source, rankings in rankings_by_source.items()
+         for doc, score in scores_rrf(rankings, rrf_k)),
+        key=lambda candidate: candidate[0], reverse=True,
+    )
+
+    selected, overflow = [], []
+    counts: Dict[str, int] = {}
+    for candidate in candidates:
+        source = candidate[1]
+        if counts.get(source, 0) < quotas.get(source, 0):
+            counts[source] = counts.get(source, 0) + 1
+            selected.append(candidate)
+        else:
+            overflow.append(candidate)
+    selected = sorted(selected[:k] + overflow[:max(0, k - len(selected))], key=lambda c: c[0], reverse=True)
+
+    documents = []
+    for _, source, doc in selected:
+        doc.metadata = {**(doc.metadata or {}), SOURCE_METADATA_KEY: source}
+        documents.append(doc)
+    return documents
@@ -0,0 +1,372 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from src.config import Config
+from .dedup import NearDuplicateIndex
+from .lexical import LexicalIndex, get_lexical_index
+from .loader import iter_split_windows, lister_fichiers
+from .pipeline import delete_chunks, index_chunks
+from .vectorstore import CORPUS_METADATA_KEY, get_collection
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+# Version du traitement des textes indexés (chargement, normalisation) : la changer
+# fait recalculer tous les fragments à la prochaine indexation
+INDEX_VERSION = 3
+# Signatures MinHash des fragments indexés, enregistrées à côté du manifeste
+SIGNATURES_SUFFIX = ".minhash.npz"
+
+
+def hash_fichier(file_path: str) -> str:
+    """Empreinte SHA-256 du contenu d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_chunk_ids(relative_path: str, chunks: List[Document], seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    IDs stables dérivés du contenu : empreinte du chemin relatif et du texte du fragment.
+    Un fragment inchangé garde son ID d'une exécution à l'autre (tant que INDEX_VERSION
+    ne change pas) ; les fragments
+    identiques d'un même fichier sont distingués par leur rang d'apparition.
+    `seen` (empreinte -> occurrences) permet de poursuivre la numérotation d'une
+    fenêtre de pages à la suivante.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha256(
+            f"{INDEX_VERSION}\0{relative_path}\0{chunk.page_content}".encode("utf-8")
+        ).hexdigest()[:32]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(digest if occurrence == 0 else f"{digest}_{occurrence}")
+    return ids
+
+
+class IndexManifest:
+    """
+    Manifeste de l'indexation : chemin relatif -> empreinte du contenu, IDs des fragments
+    indexés et fragments écartés comme quasi-doublons (ID -> ID du fragment conservé).
+    La taille et la date de modification permettent d'éviter de recalculer l'empreinte
+    des fichiers inchangés. Écrit de manière atomique (fichier temporaire puis renommage).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        # Version inconnue (pas de manifeste) : l'index peut contenir des vecteurs
+        # antérieurs au manifeste, la première indexation est une réindexation complète
+        self.index_version: Optional[int] = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+                self.index_version = data.get("index_version", 1)
+            else:
+                logger.warning(f"Manifeste {path} d'une version inconnue, ignoré")
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "index_version": self.index_version, "files": self.files},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def marquer_corpus(
+    collection, manifest: IndexManifest, lexical_index: Optional[LexicalIndex] = None, batch_size: Optional[int] = None
+) -> int:
+    """
+    Ajoute la marque CORPUS_METADATA_KEY aux fragments du manifeste déjà indexés
+    (index antérieur à la recherche fédérée), dans ChromaDB et dans l'index lexical,
+    sans recalcul des embeddings : les recherches vectorielle et BM25 du corpus portent
+    ainsi sur les mêmes fragments.
+
+    Returns:
+        Nombre de fragments marqués dans la collection
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    ids = sorted(chunk_id for entry in manifest.files.values() for chunk_id in entry.get("chunk_ids", []))
+    present = 0
+    for start in range(0, len(ids), batch_size):
+        batch = collection.get(ids=ids[start:start + batch_size], include=[])["ids"]
+        if batch:
+            collection.update(ids=batch, metadatas=[{CORPUS_METADATA_KEY: True}] * len(batch))
+            if lexical_index is not None:
+                lexical_index.marquer_corpus(batch)
+            present += len(batch)
+    logger.info(f"{present} fragment(s) du corpus marqué(s) pour la recherche fédérée")
+    return present
+
+
+def supprimer_fragments_hors_manifeste(
+    collection, manifest: IndexManifest, lexical_index: Optional[LexicalIndex] = None, batch_size: Optional[int] = None
+) -> int:
+    """
+    Supprime les fragments du corpus absents du manifeste : vecteurs d'un index antérieur
+    au manifeste (IDs "unknown_<i>") ou d'une version précédente du traitement des textes,
+    qu'aucune exécution ultérieure ne pourrait retrouver. Les fragments des documents
+    uploadés (métadonnée "document_uid") sont conservés.
+
+    Returns:
+        Nombre de fragments supprimés
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    known = {chunk_id for entry in manifest.files.values() for chunk_id in entry.get("chunk_ids", [])}
+    orphans: List[str] = []
+    offset = 0
+    while True:
+        batch = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        if not batch["ids"]:
+            break
+        orphans.extend(
+            chunk_id for chunk_id, metadata in zip(batch["ids"], batch["metadatas"])
+            if chunk_id not in known and not (metadata or {}).get("document_uid")
+        )
+        offset += len(batch["ids"])
+    if orphans:
+        logger.info(f"{len(orphans)} fragment(s) du corpus hors manifeste supprimé(s)")
+    return delete_chunks(collection, orphans, batch_size=batch_size, lexical_index=lexical_index)
+
+
+def precharger_fragments_indexes(
+    dedup: NearDuplicateIndex, chunk_ids: List[str], signatures_path: str, collection, batch_size: Optional[int] = None
+) -> None:
+    """
+    Ajoute à l'index de quasi-doublons les fragments déjà indexés des fichiers non retraités :
+    signatures enregistrées lors de l'exécution précédente, ou recalculées à partir des
+    textes de la collection pour les fragments qui n'en ont pas (premier dédoublonnage).
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    stored = dedup.load(signatures_path)
+    missing = []
+    for chunk_id in chunk_ids:
+        if chunk_id in stored:
+            dedup.add_signature(chunk_id, stored[chunk_id])
+        else:
+            missing.append(chunk_id)
+    for start in range(0, len(missing), batch_size):
+        batch = collection.get(ids=missing[start:start + batch_size], include=["documents"])
+        for chunk_id, text in zip(batch["ids"], batch["documents"]):
+            dedup.add_signature(chunk_id, dedup.signature(text or ""))
+    if missing:
+        logger.info(f"Signatures MinHash recalculées pour {len(missing)} fragment(s) déjà indexé(s)")
+
+
+@dataclass
+class IncrementalReport:
+    """Bilan d'une indexation incrémentale."""
+    unchanged_files: int = 0
+    changed_files: int = 0
+    removed_files: int = 0
+    indexed_chunks: int = 0
+    deleted_chunks: int = 0
+    duplicate_chunks: int = 0
+    duplicate_bytes: int = 0
+
+
+def indexer_incremental(
+    source_directory: str,
+    manifest_path: str,
+    collection=None,
+    embedding_factory: Optional[Callable[[], Embeddings]] = None,
+    workers: Optional[int] = None,
+    full: bool = False,
+    lexical_index: Optional[LexicalIndex] = None
+) -> IncrementalReport:
+    """
+    Met à jour l'index à partir du dossier source en ne traitant que les fichiers modifiés.
+
+    - fichier inchangé (même empreinte) : ignoré
+    - fichier nouveau ou modifié : rechargé et redécoupé ; seuls les fragments dont
+      l'ID (dérivé du contenu) est absent de l'index sont recalculés
+    - fichier supprimé ou fragments disparus : vecteurs supprimés de l'index
+    - manifeste absent ou version de traitement modifiée : tous les fichiers sont
+      retraités, puis les fragments du corpus absents du nouveau manifeste sont supprimés
+    - quasi-doublons (DEDUP_ENABLED) : un fragment presque identique à un fragment
+      déjà indexé (fichiers inchangés, dont les signatures MinHash sont enregistrées à
+      côté du manifeste) ou déjà traité lors de cette exécution n'est pas indexé ; si
+      le fichier du fragment conservé change ou disparaît, le fichier du doublon est retraité
+
+    Le manifeste est enregistré après chaque fichier, une fois tous ses vecteurs écrits :
+    une exécution interrompue reprend les seuls fichiers non enregistrés. Les fragments
+    déjà écrits d'un fichier en erreur sont retirés.
+
+    Args:
+        source_directory: Dossier des documents sources
+        manifest_path: Chemin du manifeste JSON
+        collection: Collection ChromaDB cible (collection principale par défaut)
+        embedding_factory: Voir index_documents
+        workers: Voir index_documents
+        full: Retraiter tous les fichiers, même inchangés
+        lexical_index: Index lexical tenu à jour avec la collection (celui de la
+            collection principale par défaut, aucun pour une autre collection)
+
+    Returns:
+        Bilan de l'indexation
+    """
+    if collection is None:
+        collection = get_collection()
+        lexical_index = lexical_index if lexical_index is not None else get_lexical_index()
+    manifest = IndexManifest(manifest_path)
+    report = IncrementalReport()
+    rebuild = manifest.index_version != INDEX_VERSION
+    if rebuild:
+        # Traitement des textes modifié ou index antérieur au manifeste : tout est recalculé,
+        # les anciens fragments sont retirés
+        logger.info(f"Version d'index {manifest.index_version} -> {INDEX_VERSION} : réindexation complète")
+        full = True
+
+    current_files = {os.path.relpath(path, source_directory): path for path in lister_fichiers(source_directory)}
+
+    # Fichier propriétaire de chaque fragment indexé (pour suivre les quasi-doublons)
+    owners = {chunk_id: path for path, entry in manifest.files.items() for chunk_id in entry["chunk_ids"]}
+    removed = sorted(set(manifest.files) - set(current_files))
+
+    # Fichiers supprimés du dossier source
+    for relative_path in removed:
+        report.deleted_chunks += delete_chunks(collection, manifest.files.pop(relative_path)["chunk_ids"],
+                                               lexical_index=lexical_index)
+        report.removed_files += 1
+        logger.info(f"Fichier supprimé, vecteurs retirés : {relative_path}")
+    if removed:
+        manifest.save()
+
+    # Détection des fichiers nouveaux ou modifiés
+    changed: Dict[str, dict] = {}
+    for relative_path, path in current_files.items():
+        stat = os.stat(path)
+        entry = manifest.files.get(relative_path)
+        if not full and entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            report.unchanged_files += 1
+            continue
+        content_hash = hash_fichier(path)
+        if not full and entry and entry["hash"] == content_hash:
+            entry["mtime_ns"] = stat.st_mtime_ns
+            report.unchanged_files += 1
+            continue
+        changed[relative_path] = {"hash": content_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    # Fichiers inchangés dont des doublons écartés renvoient à un fichier modifié ou supprimé
+    affected = set(removed) | set(changed)
+    for relative_path, entry in manifest.files.items():
+        if relative_path in changed:
+            continue
+        if any(owners.get(canonical) in affected for canonical in entry.get("duplicates", {}).values()):
+            changed[relative_path] = {key: entry[key] for key in ("hash", "size", "mtime_ns")}
+            report.unchanged_files -= 1
+
+    # Sans fichier à retraiter, les signatures ne sont ni chargées ni réécrites
+    dedup = NearDuplicateIndex() if Config.DEDUP_ENABLED and changed else None
+    signatures_path = f"{os.path.splitext(manifest_path)[0]}{SIGNATURES_SUFFIX}"
+    if dedup:
+        # Les nouveaux fragments sont comparés à ceux des fichiers inchangés, comme lors d'une
+        # exécution complète où ces fichiers auraient été traités en premier
+        precharger_fragments_indexes(dedup, [
+            chunk_id for relative_path, entry in manifest.files.items() if relative_path not in changed
+            for chunk_id in entry["chunk_ids"]
+        ], signatures_path, collection)
+
+    # Fragments produits mais pas encore enregistrés, par fichier ; fichiers entièrement lus
+    # (avec succès ou en erreur) en attente de l'enregistrement de leurs fragments
+    outstanding: Dict[str, Set[str]] = {relative_path: set() for relative_path in changed}
+    yielded: Dict[str, List[str]] = {relative_path: [] for relative_path in changed}
+    chunk_files: Dict[str, str] = {}
+    read: Dict[str, bool] = {}
+
+    def finish_file(relative_path: str) -> None:
+        # Fichier lu et tous ses fragments enregistrés : le manifeste est mis à jour aussitôt,
+        # une exécution interrompue ne recalcule pas les fichiers déjà terminés
+        entry = changed[relative_path]
+        previous = manifest.files.get(relative_path)
+        previous_ids = set(previous["chunk_ids"]) if previous else set()
+        if not read.pop(relative_path):
+            # Fichier en erreur : il garde l'ancienne version, les fragments déjà écrits sont retirés
+            written = sorted(set(yielded[relative_path]) - previous_ids)
+            report.deleted_chunks += delete_chunks(collection, written, lexical_index=lexical_index)
+            return
+        # Les anciens fragments des fichiers modifiés ne sont retirés qu'une fois les nouveaux écrits
+        stale_ids = sorted(previous_ids - set(entry["chunk_ids"]))
+        report.deleted_chunks += delete_chunks(collection, stale_ids, lexical_index=lexical_index)
+        manifest.files[relative_path] = entry
+        manifest.save()
+
+    def on_stored(chunk_ids: List[str]) -> None:
+        for chunk_id in chunk_ids:
+            relative_path = chunk_files.pop(chunk_id)
+            outstanding[relative_path].discard(chunk_id)
+            if relative_path in read and not outstanding[relative_path]:
+                finish_file(relative_path)
+
+    def changed_chunks() -> Iterator[Tuple[str, Document]]:
+        # Chaque fichier est lu par fenêtres de pages : seuls les IDs sont conservés
+        for relative_path, entry in changed.items():
+            chunk_ids: List[str] = []
+            duplicates: Dict[str, str] = {}
+            seen: Dict[str, int] = {}
+            try:
+                for window in iter_split_windows(current_files[relative_path]):
+                    for chunk_id, chunk in zip(content_chunk_ids(relative_path, window, seen), window):
+                        canonical = dedup.add(chunk_id, chunk.page_content) if dedup else None
+                        if canonical is not None:
+                            duplicates[chunk_id] = canonical
+                            continue
+                        chunk_ids.append(chunk_id)
+                        chunk.metadata[CORPUS_METADATA_KEY] = True
+                        outstanding[relative_path].add(chunk_id)
+                        yielded[relative_path].append(chunk_id)
+                        chunk_files[chunk_id] = relative_path
+                        yield chunk_id, chunk
+            except Exception as e:
+                logger.error(f"Erreur lors du chargement de {relative_path}: {e}", exc_info=True)
+                read[relative_path] = False
+            else:
+                entry["chunk_ids"] = chunk_ids
+                entry["duplicates"] = duplicates
+                read[relative_path] = True
+                report.changed_files += 1
+                logger.info(f"Fichier modifié ou nouveau : {relative_path} ({len(chunk_ids)} fragments)")
+            if not outstanding[relative_path]:
+                finish_file(relative_path)
+
+    if changed:
+        indexing = index_chunks(changed_chunks(), collection=collection, embedding_factory=embedding_factory,
+                                workers=workers, lexical_index=lexical_index, on_stored=on_stored)
+        report.indexed_chunks = indexing.indexed
+    if dedup:
+        report.duplicate_chunks = dedup.report.dropped
+        report.duplicate_bytes = dedup.report.bytes_saved
+
+    if all("chunk_ids" in entry for entry in changed.values()):
+        # Un fichier en erreur garde l'ancienne version : il sera retraité (et les fragments
+        # hors manifeste supprimés) à la prochaine exécution
+        if rebuild:
+            report.deleted_chunks += supprimer_fragments_hors_manifeste(collection, manifest, lexical_index)
+        manifest.index_version = INDEX_VERSION
+    manifest.save()
+    indexed_ids = (chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"])
+    if dedup:
+        dedup.save(signatures_path, indexed_ids)
+    elif Config.DEDUP_ENABLED and removed:
+        NearDuplicateIndex().prune(signatures_path, indexed_ids)
+    logger.info(
+        f"Indexation incrémentale : {report.changed_files} fichier(s) modifié(s), "
+        f"{report.unchanged_files} inchangé(s), {report.removed_files} supprimé(s) ; "
+        f"{report.indexed_chunks} fragment(s) indexé(s), {report.deleted_chunks} supprimé(s), "
+        f"{report.duplicate_chunks} quasi-doublon(s) écarté(s) ({report.duplicate_bytes} octets)"
+    )
+    return report
@@ -0,0 +1,65 @@
+import logging
+
+from src.config import Config
+from .dedup import NearDuplicateIndex
+from .loader import iter_split_windows
+from .vectorstore import add_documents_to_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Version du traitement des textes des fichiers uploadés (chargement, normalisation) :
+# les documents indexés par une version antérieure sont réindexés (rag.reindex_outdated_uploads).
+# 2 : texte normalisé (NFC) au lieu du texte remis en forme pour l'affichage
+UPLOAD_INDEX_VERSION = 2
+
+
+def indexer_fichier_uploade(file_path: str, index_key: str, filename: str) -> int:
+    """
+    Charge, découpe et indexe un fichier uploadé.
+    Le fichier est traité par fenêtres de pages (chargement, découpage, embeddings
+    puis écriture), de sorte qu'un long PDF n'est jamais chargé en entier en mémoire.
+    Les quasi-doublons au sein du document (passages répétés) ne sont pas indexés.
+    Chaque fragment porte la clé d'index du document (métadonnée "document_uid") pour
+    le filtrage du RAG. Les vecteurs d'un contenu donné sont partagés par tous les
+    documents identiques, quelle que soit leur conversation : l'isolation est assurée
+    par le filtre du retriever, construit à partir des documents de la conversation.
+    
+    Args:
+        file_path: Chemin du fichier sur le disque
+        index_key: Clé d'index du document (empreinte du contenu, voir Document.vector_key)
+        filename: Nom du fichier affiché comme source
+        
+    Returns:
+        Nombre de fragments indexés
+    """
+    logger.info(f"Indexation du contenu {index_key} depuis {file_path}")
+    indexed = 0
+    dedup = NearDuplicateIndex() if Config.DEDUP_ENABLED else None
+    for split_docs in iter_split_windows(file_path):
+        if dedup:
+            split_docs = [
+                doc for position, doc in enumerate(split_docs, start=dedup.report.seen)
+                if dedup.add(str(position), doc.page_content) is None
+            ]
+        if not split_docs:
+            continue
+        for doc in split_docs:
+            if not doc.metadata:
+                doc.metadata = {}
+            doc.metadata.update({
+                "document_uid": index_key,
+                "source": filename
+            })
+        add_documents_to_vectorstore(split_docs, document_uid=index_key, start_index=indexed)
+        indexed += len(split_docs)
+
+    if not indexed:
+        logger.warning(f"Aucun contenu indexable dans le document {index_key}")
+        return 0
+    if dedup and dedup.report.dropped:
+        logger.info(
+            f"Document {index_key} : {dedup.report.dropped} quasi-doublon(s) écarté(s) "
+            f"({dedup.report.bytes_saved} octets)"
+        )
+    logger.info(f"Document {index_key} indexé avec {indexed} fragments")
+    return indexed
@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from camel_tools.tokenizers.word import simple_word_tokenize
+from langchain.schema import Document
+
+from src.config import Config
+from .utils import normaliser_texte_arabe
+
+logger = logging.getLogger(__name__)
+
+# Métadonnée des fragments du corpus de base (indexer_rag.py), qui n'ont pas de "document_uid" ;
+# utilisée par les deux recherches du corpus (filtre ChromaDB et colonne "corpus" de l'index lexical)
+CORPUS_METADATA_KEY = "corpus"
+
+# Préfixes et suffixes retirés par la racinisation légère (texte déjà normalisé : ة -> ه, ى -> ي)
+PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "ه", "ي")
+# Mots outils ignorés (forme normalisée)
+MOTS_VIDES = frozenset(normaliser_texte_arabe(" ".join((
+    "من", "في", "على", "إلى", "عن", "أن", "إن", "ما", "لا", "لم", "لن", "هو", "هي", "هم", "هذا", "هذه",
+    "ذلك", "تلك", "التي", "الذي", "الذين", "كان", "كانت", "قد", "ثم", "أو", "أم", "بل", "كل", "مع",
+    "عند", "إذا", "حتى", "و", "ف", "ب", "ل", "هل", "كيف", "متى", "ماذا",
+))).split())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    document_uid TEXT,
+    corpus INTEGER NOT NULL DEFAULT 0,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    tokens TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_document_uid ON chunks(document_uid);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    tokens, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 0'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, tokens) VALUES (new.id, new.tokens);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, tokens) VALUES ('delete', old.id, old.tokens);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, tokens) VALUES ('delete', old.id, old.tokens);
+    INSERT INTO chunks_fts(rowid, tokens) VALUES (new.id, new.tokens);
+END;
+"""
+
+# Index lexical partagé (pattern singleton)
+_lexical_index = None
+
+
+def raciner_leger(word: str) -> str:
+    """
+    Racinisation légère d'un mot arabe normalisé (dans l'esprit de Light10) :
+    retrait du و initial, de l'article et des suffixes courants, sans analyse morphologique.
+    Deux lettres au moins sont toujours conservées.
+    """
+    if len(word) > 3 and word.startswith("و"):
+        word = word[1:]
+    for prefix in PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            word = word[len(prefix):]
+            break
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            word = word[:-len(suffix)]
+    return word
+
+
+def tokens_lexicaux(text: str) -> List[str]:
+    """
+    Termes indexés d'un texte : normalisation d'index, découpage en mots (camel_tools),
+    suppression de la ponctuation et des mots outils, puis racinisation légère.
+    """
+    terms = []
+    for word in simple_word_tokenize(normaliser_texte_arabe(text).lower()):
+        if not word.isalnum() or word in MOTS_VIDES:
+            continue
+        terms.append(raciner_leger(word))
+    return terms
+
+
+class LexicalIndex:
+    """
+    Index lexical BM25 des fragments, tenu à jour avec la collection ChromaDB.
+
+    Les fragments (texte, métadonnées et termes racinisés) sont stockés dans une base
+    SQLite ; la recherche utilise l'index plein texte FTS5 et son classement BM25.
+    Comme pour la recherche vectorielle, les résultats sont filtrés par "document_uid".
+    Une connexion est ouverte par thread (recherches depuis le pool interactif).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+            # Index antérieur à la recherche fédérée : colonne ajoutée, remplie par marquer_corpus
+            if "corpus" not in {row[1] for row in connection.execute("PRAGMA table_info(chunks)")}:
+                connection.execute("ALTER TABLE chunks ADD COLUMN corpus INTEGER NOT NULL DEFAULT 0")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # Pages libres rendues par étapes (vacuum_incremental) ; sans effet sur une base déjà créée
+            connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # WAL : les recherches ne sont pas bloquées pendant une indexation
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[Document]) -> None:
+        """Ajoute ou remplace des fragments (même ID que dans ChromaDB)."""
+        rows = [
+            (
+                chunk_id, (doc.metadata or {}).get("document_uid"), (doc.metadata or {}).get(CORPUS_METADATA_KEY) is True,
+                doc.page_content, json.dumps(doc.metadata or {}, ensure_ascii=False),
+                " ".join(tokens_lexicaux(doc.page_content)),
+            )
+            for chunk_id, doc in zip(ids, documents)
+        ]
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO chunks(chunk_id, document_uid, corpus, content, metadata, tokens) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(chunk_id) DO UPDATE SET document_uid = excluded.document_uid, corpus = excluded.corpus, "
+                "content = excluded.content, metadata = excluded.metadata, tokens = excluded.tokens",
+                rows,
+            )
+
+    def marquer_corpus(self, ids: Sequence[str]) -> int:
+        """
+        Marque des fragments déjà indexés comme fragments du corpus (colonne et métadonnée
+        CORPUS_METADATA_KEY), comme dans ChromaDB.
+
+        Returns:
+            Nombre de fragments marqués
+        """
+        with self._connection() as connection:
+            return connection.executemany(
+                "UPDATE chunks SET corpus = 1, metadata = json_set(metadata, '$.' || ?, json('true')) "
+                "WHERE chunk_id = ?",
+                [(CORPUS_METADATA_KEY, chunk_id) for chunk_id in ids],
+            ).rowcount
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+
+    def delete_documents(self, document_uids: Sequence[str]) -> None:
+        """Supprime tous les fragments des documents indiqués."""
+        placeholders = ", ".join("?" for _ in document_uids)
+        with self._connection() as connection:
+            connection.execute(f"DELETE FROM chunks WHERE document_uid IN ({placeholders})", list(document_uids))
+
+    def optimize(self) -> None:
+        """Fusionne les segments de l'index FTS5 (après de nombreuses suppressions)."""
+        with self._connection() as connection:
+            connection.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('optimize')")
+
+    def count(self, corpus_only: bool = False) -> int:
+        condition = " WHERE corpus = 1" if corpus_only else ""
+        return self._connection().execute(f"SELECT COUNT(*) FROM chunks{condition}").fetchone()[0]
+
+    def search(self, query: str, document_uids: Sequence[str], k: int) -> List[Document]:
+        """
+        Fragments des documents indiqués classés par score BM25 (meilleur en premier).
+        Un terme suffit pour qu'un fragment soit candidat ; sans document, rien n'est retourné.
+        """
+        document_uids = list(dict.fromkeys(document_uids))
+        if not document_uids:
+            return []
+        placeholders = ", ".join("?" for _ in document_uids)
+        return self._search(query, f"c.document_uid IN ({placeholders})", document_uids, k)
+
+    def search_corpus(self, query: str, k: int) -> List[Document]:
+        """
+        Fragments du corpus de base (marqués CORPUS_METADATA_KEY, comme pour la recherche
+        vectorielle du corpus) classés par score BM25.
+        """
+        return self._search(query, "c.corpus = 1", [], k)
+
+    def _search(self, query: str, condition: str, parameters: List[str], k: int) -> List[Document]:
+        terms = list(dict.fromkeys(tokens_lexicaux(query)))
+        if not terms:
+            return []
+
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self._connection().execute(
+            "SELECT c.chunk_id, c.content, c.metadata FROM chunks_fts "
+            "JOIN chunks c ON c.id = chunks_fts.rowid "
+            f"WHERE chunks_fts MATCH ? AND {condition} "
+            "ORDER BY bm25(chunks_fts) LIMIT ?",
+            [match, *parameters, k],
+        ).fetchall()
+        return [
+            Document(page_content=content, metadata=json.loads(metadata), id=chunk_id)
+            for chunk_id, content, metadata in rows
+        ]
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Index lexical de la collection principale (Config.LEXICAL_INDEX_PATH)."""
+    global _lexical_index
+    if _lexical_index is None:
+        logger.info(f"Ouverture de l'index lexical : {Config.LEXICAL_INDEX_PATH}")
+        _lexical_index = LexicalIndex(Config.LEXICAL_INDEX_PATH)
+    return _lexical_index
+
+
+def reconstruire_index_lexical(collection, lexical_index: LexicalIndex, batch_size: Optional[int] = None) -> int:
+    """
+    Remplit l'index lexical à partir des fragments déjà présents dans une collection ChromaDB
+    (index créé avant la recherche hybride), par lots bornés.
+
+    Returns:
+        Nombre de fragments ajoutés
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    total = 0
+    while True:
+        batch = collection.get(limit=batch_size, offset=total, include=["documents", "metadatas"])
+        if not batch["ids"]:
+            break
+        lexical_index.upsert(batch["ids"], [
+            Document(page_content=text or "", metadata=metadata or {})
+            for text, metadata in zip(batch["documents"], batch["metadatas"])
+        ])
+        total += len(batch["ids"])
+    logger.info(f"Index lexical reconstruit : {total} fragment(s)")
+    return total
+
+
+def _document_key(doc: Document) -> str:
+    return doc.id or f"{doc.metadata.get('document_uid')}:{doc.page_content}"
+
+
+def scores_rrf(rankings: Iterable[Sequence[Document]], rrf_k: Optional[int] = None) -> List[Tuple[Document, float]]:
+    """
+    Scores Reciprocal Rank Fusion : chaque fragment reçoit la somme de 1 / (rrf_k + rang)
+    sur les classements où il apparaît, divisée par le score maximal possible
+    (1 pour un fragment classé premier dans tous les classements).
+
+    Returns:
+        Fragments sans doublon et leur score normalisé, du meilleur au moins bon
+    """
+    rrf_k = Config.HYBRID_RRF_K if rrf_k is None else rrf_k
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    count = 0
+    for ranking in rankings:
+        count += 1
+        for rank, doc in enumerate(ranking, start=1):
+            key = _document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    best: List[Tuple[str, float]] = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(documents[key], score * (rrf_k + 1) / count) for key, score in best]
+
+
+def fusion_rrf(rankings: Iterable[Sequence[Document]], k: int, rrf_k: Optional[int] = None) -> List[Document]:
+    """
+    Fusionne plusieurs classements par Reciprocal Rank Fusion (voir scores_rrf).
+
+    Returns:
+        Les k meilleurs fragments, sans doublon
+    """
+    return [doc for doc, _ in scores_rrf(rankings, rrf_k)[:k]]
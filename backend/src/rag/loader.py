@@ -1,22 +1,113 @@
 import os
 import logging
-from typing import List
+from itertools import islice
+from typing import Iterator, List, Optional
+
+import filetype
 from langchain_community.document_loaders import (
-    DirectoryLoader,
     CSVLoader,
-    PyPDFLoader,
     UnstructuredHTMLLoader,
 )
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+from src.config import Config
 # Import du chargeur de texte arabe personnalisé
 from .utils import ArabicTextLoader
+# Chargeur PDF à extraction parallèle par plages de pages
+from .pdf import ParallelPyPDFLoader
+# Découpage mesuré en tokens du modèle d'embedding
+from .splitter import ArabicTokenSplitter, get_token_counter
+from .vectorstore import EMBEDDING_MODEL_NAME
 
 # Configuration du système de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Registre des chargeurs, indexé par type de fichier détecté
+LOADER_REGISTRY = {
+    "csv": {"loader_cls": CSVLoader, "loader_kwargs": {'encoding': 'utf-8'}, "extensions": (".csv",)},
+    "html": {"loader_cls": UnstructuredHTMLLoader, "extensions": (".html", ".htm")},
+    "pdf": {"loader_cls": ParallelPyPDFLoader, "extensions": (".pdf",)},
+    "txt": {"loader_cls": ArabicTextLoader, "loader_kwargs": {'encoding': 'utf-8'}, "extensions": (".txt",)}, # Chargeur spécialisé pour l'arabe
+}
+
+def detecter_type(file_path: str) -> Optional[str]:
+    """
+    Détecte le type d'un fichier pour choisir son chargeur.
+    Les signatures binaires (magic bytes, via `filetype`) priment sur l'extension :
+    un PDF mal nommé est chargé comme PDF, et un binaire non supporté (image,
+    archive...) est refusé même avec une extension de texte. Les formats texte
+    (csv, html, txt) n'ayant pas de signature, ils sont reconnus par l'extension.
+    
+    Args:
+        file_path: Chemin du fichier
+        
+    Returns:
+        Clé du registre des chargeurs, ou None si le type n'est pas supporté
+    """
+    kind = filetype.guess(file_path)
+    if kind is not None:
+        return kind.extension if kind.extension in LOADER_REGISTRY else None
+
+    extension = os.path.splitext(file_path)[1].lower()
+    for file_type, config in LOADER_REGISTRY.items():
+        if extension in config["extensions"]:
+            return file_type
+    return None
+
+def _est_extension_supportee(file_path: str) -> bool:
+    extension = os.path.splitext(file_path)[1].lower()
+    return any(extension in config["extensions"] for config in LOADER_REGISTRY.values())
+
+def lister_fichiers(source_directory: str) -> List[str]:
+    """
+    Liste (triés) les fichiers d'un dossier et de ses sous-dossiers dont l'extension est supportée.
+    
+    Args:
+        source_directory: Chemin vers le dossier source
+        
+    Returns:
+        Chemins des fichiers supportés
+    """
+    fichiers = []
+    for root, _, files in os.walk(source_directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if _est_extension_supportee(path):
+                fichiers.append(path)
+    return sorted(fichiers)
+
+def iter_documents(file_path: str) -> Iterator[Document]:
+    """
+    Charge un fichier avec le chargeur de son type et produit ses documents au fil
+    de l'eau (une page à la fois pour les PDF, une ligne à la fois pour les CSV).
+    
+    Args:
+        file_path: Chemin du fichier à charger
+        
+    Yields:
+        Documents du fichier (aucun si le type n'est pas supporté)
+    """
+    file_type = detecter_type(file_path)
+    if file_type is None:
+        logger.warning(f"Type de fichier non supporté : {file_path}")
+        return
+    config = LOADER_REGISTRY[file_type]
+    loader = config["loader_cls"](file_path, **config.get("loader_kwargs", {}))
+    yield from loader.lazy_load()
+
+def charger_fichier(file_path: str) -> List[Document]:
+    """
+    Charge un seul fichier avec le chargeur correspondant à son type.
+    
+    Args:
+        file_path: Chemin du fichier à charger
+        
+    Returns:
+        Liste des documents chargés (vide si le type n'est pas supporté)
+    """
+    return list(iter_documents(file_path))
+
 def charger_documents(source_directory: str) -> List[Document]:
     """
     Charge tous les documents depuis un dossier source spécifié.
@@ -31,36 +122,12 @@ def charger_documents(source_directory: str) -> List[Document]:
     logger.info(f"Chargement des documents depuis : {source_directory}")
     documents = []
 
-    # Configuration des chargeurs pour chaque type de fichier supporté
-    loader_configs = [
-        {"glob": "**/*.csv", "loader_cls": CSVLoader, "loader_kwargs": {'encoding': 'utf-8'}},
-        {"glob": "**/*.html", "loader_cls": UnstructuredHTMLLoader},
-        {"glob": "**/*.pdf", "loader_cls": PyPDFLoader},
-        {"glob": "**/*.txt", "loader_cls": ArabicTextLoader, "loader_kwargs": {'encoding': 'utf-8'}} # Chargeur spécialisé pour l'arabe
-    ]
-
-    # Traitement de chaque type de fichier
-    for config in loader_configs:
+    for file_path in lister_fichiers(source_directory):
         try:
-            loader = DirectoryLoader(
-                source_directory,
-                glob=config["glob"],
-                loader_cls=config["loader_cls"],
-                loader_kwargs=config.get("loader_kwargs", {}),
-                recursive=True, # Recherche dans les sous-dossiers
-                show_progress=True, # Affichage de la progression
-                use_multithreading=True, # Traitement parallèle pour accélérer le chargement
-                silent_errors=True # Ignore les fichiers qui ne peuvent pas être chargés
-            )
-            loaded_docs = loader.load()
-            if loaded_docs:
-                logger.info(f"Chargé {len(loaded_docs)} document(s) de type {config['glob']}")
-                documents.extend(loaded_docs)
-            else:
-                 logger.warning(f"Aucun document trouvé pour le type {config['glob']}")
+            documents.extend(iter_documents(file_path))
         except Exception as e:
-            # Enregistre l'erreur mais continue le traitement des autres types
-            logger.error(f"Erreur lors du chargement des fichiers {config['glob']} depuis {source_directory}: {e}", exc_info=True)
+            # Enregistre l'erreur mais continue le traitement des autres fichiers
+            logger.error(f"Erreur lors du chargement du fichier {file_path}: {e}", exc_info=True)
 
     # Vérification du résultat final
     if not documents:
@@ -70,10 +137,19 @@ def charger_documents(source_directory: str) -> List[Document]:
 
     return documents
 
+def _text_splitter() -> ArabicTokenSplitter:
+    """Découpeur de texte commun à l'indexation complète et à l'indexation par fenêtres."""
+    return ArabicTokenSplitter(
+        get_token_counter(EMBEDDING_MODEL_NAME),
+        chunk_size=Config.SPLITTER_CHUNK_TOKENS,      # Taille maximale de chaque fragment, en tokens
+        chunk_overlap=Config.SPLITTER_OVERLAP_TOKENS, # Chevauchement (phrases entières) pour maintenir le contexte
+    )
+
 def split_documents(documents: List[Document]) -> List[Document]:
     """
     Découpe les documents chargés en plus petits fragments pour optimiser la recherche.
-    Utilise des séparateurs adaptés aux textes arabes et français.
+    Les fragments suivent les phrases arabes et françaises et tiennent dans la
+    fenêtre du modèle d'embedding (aucune troncature au calcul des embeddings).
     
     Args:
         documents: Liste des documents à découper
@@ -83,16 +159,27 @@ def split_documents(documents: List[Document]) -> List[Document]:
     """
     logger.info(f"Découpage de {len(documents)} documents...")
     
-    # Configuration du découpeur de texte
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,        # Taille maximale de chaque fragment
-        chunk_overlap=100,      # Chevauchement entre fragments pour maintenir le contexte
-        length_function=len,    # Fonction de calcul de la longueur
-        is_separator_regex=False, # Utilise les séparateurs comme chaînes littérales
-        separators=["\n\n", "\n", ". ", "، ", "؛ ", " ", ""] # Séparateurs adaptés à l'arabe et au français
-    )
-    
     # Découpage des documents
-    texts = text_splitter.split_documents(documents)
+    texts = _text_splitter().split_documents(documents)
     logger.info(f"Découpage terminé : {len(texts)} fragments créés.")
-    return texts
\ No newline at end of file
+    return texts
+
+def iter_split_windows(file_path: str, pages_per_window: Optional[int] = None) -> Iterator[List[Document]]:
+    """
+    Charge et découpe un fichier par fenêtres de N documents (N pages pour un PDF).
+    Seule la fenêtre courante et ses fragments sont en mémoire : la mémoire
+    consommée ne dépend pas de la longueur du document. Chaque page étant
+    découpée séparément, les fragments sont identiques à ceux de split_documents.
+    
+    Args:
+        file_path: Chemin du fichier à charger
+        pages_per_window: Nombre de documents par fenêtre (INGESTION_PAGE_WINDOW par défaut)
+        
+    Yields:
+        Fragments de chaque fenêtre, dans l'ordre du fichier
+    """
+    pages_per_window = pages_per_window or Config.INGESTION_PAGE_WINDOW
+    text_splitter = _text_splitter()
+    pages = iter_documents(file_path)
+    while window := list(islice(pages, pages_per_window)):
+        yield text_splitter.split_documents(window)
@@ -0,0 +1,446 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Set
+
+import numpy as np
+from chromadb.errors import InvalidCollectionException
+
+from src.config import Config
+from .lexical import LexicalIndex, get_lexical_index
+from .partitions import PARTITION_PREFIX
+from .vectorstore import (
+    ACTIVE_COLLECTION_FILE, CHROMA_DB_PATH, COLLECTION_NAME, active_collection_name, get_chroma_client,
+    reset_vectorstore_cache,
+)
+
+logger = logging.getLogger(__name__)
+
+# Verrou partagé par l'indexation (lecteurs du verrou) et la compaction (exclusive)
+LOCK_FILE = "maintenance.lock"
+CHROMA_SQLITE_FILE = "chroma.sqlite3"
+# IDs d'une collection remplacée, enregistrés à la bascule ("<collection>.retired.json")
+RETIRED_IDS_SUFFIX = ".retired.json"
+# Partitions vides à la bascule ("<collection>.empty_partitions.json"), supprimées à la finalisation si elles le sont restées
+EMPTY_PARTITIONS_SUFFIX = ".empty_partitions.json"
+# Passes de réplication avant la bascule (écritures reçues par l'ancienne collection pendant la copie)
+MAX_REPLICATION_PASSES = 5
+# Requêtes de mesure de latence (embeddings déjà stockés, perturbés, sans modèle)
+LATENCY_SAMPLE_SIZE = 20
+# Norme du bruit ajouté aux embeddings échantillonnés, relative à leur norme
+LATENCY_QUERY_NOISE = 0.3
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+@dataclass
+class IndexSnapshot:
+    """Taille et latence de l'index à un instant donné."""
+    chunks: int = 0
+    disk_bytes: int = 0  # Dossier ChromaDB (SQLite et segments HNSW)
+    sqlite_free_bytes: int = 0  # Pages libres de chroma.sqlite3
+    lexical_bytes: int = 0
+    query_p50_ms: float = 0.0
+
+
+@dataclass
+class CompactionReport:
+    """Bilan d'une compaction : état avant/après, durée de la bascule et durée totale."""
+    collection_before: str = ""
+    collection_after: str = ""
+    before: Optional[IndexSnapshot] = None
+    after: Optional[IndexSnapshot] = None
+    replicated_chunks: int = 0  # Écritures reçues par l'ancienne collection pendant la copie et après la bascule
+    empty_partitions: List[str] = field(default_factory=list)  # Partitions vides à la bascule (mode "document")
+    swap_ms: float = 0.0
+    seconds: float = 0.0
+    sample: List = field(default_factory=list)  # Embeddings (perturbés) des requêtes de mesure de latence
+
+
+class CompactionBusyError(RuntimeError):
+    """Une compaction ou une indexation utilise déjà l'index."""
+
+
+@contextmanager
+def verrou_index(persist_directory: str = CHROMA_DB_PATH, exclusive: bool = False) -> Iterator[None]:
+    """
+    Verrou de maintenance de l'index (fichier LOCK_FILE, flock).
+    Les indexations le prennent en mode partagé et attendent la fin d'une compaction ;
+    la compaction le prend en mode exclusif et échoue si une indexation est en cours.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(os.path.join(persist_directory, LOCK_FILE), "a") as lock:
+        try:
+            fcntl.flock(lock, (fcntl.LOCK_EX | fcntl.LOCK_NB) if exclusive else fcntl.LOCK_SH)
+        except BlockingIOError:
+            raise CompactionBusyError("Index en cours d'indexation ou de compaction")
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def taille_dossier(path: str) -> int:
+    """Taille totale des fichiers d'un dossier (octets)."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def octets_libres_sqlite(path: str) -> int:
+    """Octets occupés par les pages libres d'une base SQLite (récupérables par VACUUM)."""
+    if not os.path.exists(path):
+        return 0
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        return page_size * connection.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def vacuum_incremental(path: str, step_pages: Optional[int] = None) -> int:
+    """
+    Rend au système les pages libres d'une base SQLite par étapes de `step_pages` pages,
+    chacune dans sa propre transaction : les autres connexions n'attendent qu'une étape.
+    Une base créée sans auto_vacuum est d'abord convertie par un VACUUM complet (bloquant, une seule fois).
+
+    Returns:
+        Octets libérés
+    """
+    step_pages = step_pages or Config.SQLITE_VACUUM_STEP_PAGES
+    size_before = os.path.getsize(path)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info(f"Conversion de {path} en auto_vacuum incrémental (VACUUM complet)")
+            connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.execute("VACUUM")
+        while connection.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            connection.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+            time.sleep(0)  # Laisse passer les lectures en attente entre deux étapes
+    finally:
+        connection.close()
+    return size_before - os.path.getsize(path)
+
+
+def _ids(collection) -> Set[str]:
+    return set(collection.get(include=[])["ids"])
+
+
+def _copier(source, target, ids: List[str], batch_size: int) -> int:
+    """Copie des fragments (embeddings compris, sans recalcul) d'une collection à l'autre."""
+    copied = 0
+    for start in range(0, len(ids), batch_size):
+        batch = source.get(ids=ids[start:start + batch_size], include=["embeddings", "documents", "metadatas"])
+        if not batch["ids"]:
+            continue  # Fragments supprimés entre-temps
+        target.upsert(
+            ids=batch["ids"], embeddings=batch["embeddings"],
+            documents=batch["documents"], metadatas=batch["metadatas"],
+        )
+        copied += len(batch["ids"])
+    return copied
+
+
+def repliquer(source, target, batch_size: Optional[int] = None) -> int:
+    """
+    Reporte sur `target` les fragments ajoutés ou supprimés dans `source`.
+    Les IDs dérivent du contenu (voir content_chunk_ids) : un fragment n'est jamais modifié en place.
+
+    Returns:
+        Nombre de fragments copiés ou supprimés
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    source_ids, target_ids = _ids(source), _ids(target)
+    removed = sorted(target_ids - source_ids)
+    for start in range(0, len(removed), batch_size):
+        target.delete(ids=removed[start:start + batch_size])
+    return _copier(source, target, sorted(source_ids - target_ids), batch_size) + len(removed)
+
+
+def requetes_perturbees(embeddings, noise: float = LATENCY_QUERY_NOISE, seed: int = 0) -> List[List[float]]:
+    """
+    Requêtes de mesure dérivées d'embeddings stockés : un bruit gaussien (de norme `noise`
+    fois celle du vecteur) évite que chaque requête retrouve exactement son propre fragment,
+    ce qui sous-estimerait la latence du parcours HNSW. La norme d'origine est conservée.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for embedding in embeddings:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        perturbation = rng.standard_normal(vector.shape).astype(np.float32)
+        vector = vector + perturbation * (noise * norm / float(np.linalg.norm(perturbation)))
+        queries.append((vector * (norm / float(np.linalg.norm(vector)))).tolist())
+    return queries
+
+
+def latence_requetes(collection, query_embeddings, k: int = 7) -> float:
+    """Latence médiane (ms) des recherches vectorielles pour des embeddings de requête donnés."""
+    latencies = []
+    for embedding in query_embeddings:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[embedding], n_results=k, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(latencies, 50)) if latencies else 0.0
+
+
+def mesurer_index(collection, persist_directory: str, query_embeddings, lexical_index: Optional[LexicalIndex]) -> IndexSnapshot:
+    return IndexSnapshot(
+        chunks=collection.count(),
+        disk_bytes=taille_dossier(persist_directory),
+        sqlite_free_bytes=octets_libres_sqlite(os.path.join(persist_directory, CHROMA_SQLITE_FILE)),
+        lexical_bytes=os.path.getsize(lexical_index.path) if lexical_index is not None else 0,
+        query_p50_ms=latence_requetes(collection, query_embeddings),
+    )
+
+
+def ecrire_collection_active(persist_directory: str, name: str) -> None:
+    """Remplace atomiquement le nom de la collection active (os.replace)."""
+    path = os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def supprimer_segments_orphelins(persist_directory: str) -> int:
+    """
+    Supprime les dossiers de segments HNSW qui ne sont plus référencés par chroma.sqlite3
+    (ChromaDB ne les efface que si le segment est chargé dans le processus qui supprime la collection).
+
+    Returns:
+        Nombre de dossiers supprimés
+    """
+    connection = sqlite3.connect(os.path.join(persist_directory, CHROMA_SQLITE_FILE), timeout=30)
+    try:
+        segments = {row[0] for row in connection.execute("SELECT id FROM segments")}
+    finally:
+        connection.close()
+    removed = 0
+    for name in os.listdir(persist_directory):
+        path = os.path.join(persist_directory, name)
+        if os.path.isdir(path) and _SEGMENT_DIR.match(name) and name not in segments:
+            shutil.rmtree(path)
+            removed += 1
+    return removed
+
+
+def _fichier_retrait(persist_directory: str, collection_name: str) -> str:
+    """Fichier des IDs d'une collection remplacée, au moment de la bascule (voir finaliser_compaction)."""
+    return os.path.join(persist_directory, f"{collection_name}{RETIRED_IDS_SUFFIX}")
+
+
+def _fichier_partitions_vides(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, f"{collection_name}{EMPTY_PARTITIONS_SUFFIX}")
+
+
+def partitions_vides(client) -> List[str]:
+    """Collections de partition sans fragment (indexation interrompue entre la création et l'écriture)."""
+    return sorted(
+        name for name in client.list_collections()
+        if name.startswith(PARTITION_PREFIX) and client.get_collection(name).count() == 0
+    )
+
+
+def supprimer_partitions_vides(client, names: List[str]) -> int:
+    """
+    Supprime celles des partitions indiquées qui sont toujours vides. Les indexations ne prennent
+    pas le verrou d'index : une partition vide à la bascule peut avoir été remplie depuis.
+
+    Returns:
+        Nombre de partitions supprimées
+    """
+    removed = 0
+    for name in names:
+        try:
+            partition = client.get_collection(name)
+        except InvalidCollectionException:
+            continue
+        if partition.count() == 0:
+            client.delete_collection(name)
+            removed += 1
+    return removed
+
+
+def basculer_index(
+    client=None,
+    persist_directory: str = CHROMA_DB_PATH,
+    batch_size: Optional[int] = None,
+) -> CompactionReport:
+    """
+    Première étape de la compaction, sous verrou exclusif :
+    1. Copie les fragments vivants dans une nouvelle collection (segment HNSW reconstruit sans
+       les éléments supprimés), en reportant les écritures reçues entre-temps par l'ancienne
+    2. Enregistre les IDs de l'ancienne collection au moment de la bascule
+    3. Bascule la collection active (fichier ACTIVE_COLLECTION_FILE, remplacement atomique) ;
+       chaque processus recharge son vectorstore (au plus ACTIVE_COLLECTION_CHECK_SECONDS plus tard)
+
+    L'ancienne collection est conservée pour les recherches en cours : elle est supprimée par
+    finaliser_compaction, après le délai de grâce.
+
+    En mode Config.VECTOR_PARTITION_MODE="document", les partitions ne sont pas recopiées : un
+    document supprimé l'est avec toute sa collection (pas d'éléments supprimés dans un segment
+    HNSW vivant). Les partitions vides sont enregistrées, pour suppression à la finalisation ;
+    les segments des partitions supprimées et les pages libérées sont récupérés par finaliser_compaction.
+
+    Returns:
+        Bilan de la compaction (état avant, durée de la bascule)
+    """
+    client = client or get_chroma_client()
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+
+    with verrou_index(persist_directory, exclusive=True):
+        old = client.get_or_create_collection(active_collection_name(persist_directory))
+        report = CompactionReport(collection_before=old.name)
+        sample = old.get(limit=LATENCY_SAMPLE_SIZE, include=["embeddings"])["embeddings"]
+        report.sample = [] if sample is None else requetes_perturbees(sample)
+        report.before = mesurer_index(old, persist_directory, report.sample, None)
+        logger.info(f"Compaction de '{old.name}' : {report.before.chunks} fragment(s), "
+                    f"{report.before.disk_bytes / 1024 / 1024:.1f} Mo")
+
+        new = client.create_collection(f"{COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}", metadata=old.metadata)
+        _copier(old, new, sorted(_ids(old)), batch_size)
+        for _ in range(MAX_REPLICATION_PASSES):
+            replicated = repliquer(old, new, batch_size)
+            report.replicated_chunks += replicated
+            if not replicated:
+                break
+
+        # Bascule : les lectures et écritures suivantes utilisent la nouvelle collection
+        report.replicated_chunks += repliquer(old, new, batch_size)
+        with open(_fichier_retrait(persist_directory, old.name), "w", encoding="utf-8") as f:
+            json.dump(sorted(_ids(old)), f)
+        if Config.VECTOR_PARTITION_MODE == "document":
+            report.empty_partitions = partitions_vides(client)
+            with open(_fichier_partitions_vides(persist_directory, old.name), "w", encoding="utf-8") as f:
+                json.dump(report.empty_partitions, f)
+        swap_start = time.perf_counter()
+        ecrire_collection_active(persist_directory, new.name)
+        reset_vectorstore_cache()
+        report.swap_ms = (time.perf_counter() - swap_start) * 1000
+        report.collection_after = new.name
+    logger.info(f"Collection active : '{new.name}' (bascule {report.swap_ms:.0f} ms), "
+                f"'{old.name}' conservée pour les recherches en cours")
+    return report
+
+
+def finaliser_compaction(
+    old_name: str,
+    client=None,
+    persist_directory: str = CHROMA_DB_PATH,
+    lexical_index: Optional[LexicalIndex] = None,
+    batch_size: Optional[int] = None,
+    vacuum: bool = True,
+) -> int:
+    """
+    Dernière étape de la compaction, après le délai de grâce : reporte sur la collection active
+    les seules écritures reçues par l'ancienne collection depuis la bascule (processus qui ne
+    l'avaient pas encore rechargée), supprime l'ancienne collection et ses segments, ainsi que les
+    partitions restées vides depuis la bascule et les segments des partitions supprimées, puis rend
+    les pages libres de chroma.sqlite3 et de l'index lexical (vacuum incrémental).
+
+    Le report est fait dans un seul sens, par différence avec les IDs enregistrés à la bascule :
+    les ajouts et suppressions faits depuis dans la collection active sont conservés.
+
+    Returns:
+        Nombre de fragments copiés ou supprimés dans la collection active
+    """
+    client = client or get_chroma_client()
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    retired_path = _fichier_retrait(persist_directory, old_name)
+    replicated = 0
+
+    with verrou_index(persist_directory):
+        try:
+            old = client.get_collection(old_name)
+        except InvalidCollectionException:
+            old = None
+        if old is not None and old.name != active_collection_name(persist_directory):
+            try:
+                with open(retired_path, encoding="utf-8") as f:
+                    ids_at_swap = set(json.load(f))
+            except FileNotFoundError:
+                logger.warning(f"IDs de '{old_name}' à la bascule introuvables, écritures tardives non reportées")
+                ids_at_swap = None
+            if ids_at_swap is not None:
+                new = client.get_or_create_collection(active_collection_name(persist_directory))
+                old_ids = _ids(old)
+                removed = sorted(ids_at_swap - old_ids)
+                for start in range(0, len(removed), batch_size):
+                    new.delete(ids=removed[start:start + batch_size])
+                replicated = _copier(old, new, sorted(old_ids - ids_at_swap), batch_size) + len(removed)
+            client.delete_collection(old_name)
+            logger.info(f"Ancienne collection '{old_name}' supprimée ({replicated} écriture(s) tardive(s) reportée(s))")
+        if os.path.exists(retired_path):
+            os.remove(retired_path)
+        empty_path = _fichier_partitions_vides(persist_directory, old_name)
+        if os.path.exists(empty_path):
+            with open(empty_path, encoding="utf-8") as f:
+                removed_partitions = supprimer_partitions_vides(client, json.load(f))
+            os.remove(empty_path)
+            logger.info(f"{removed_partitions} partition(s) vide(s) supprimée(s)")
+        segments = supprimer_segments_orphelins(persist_directory)
+        logger.info(f"{segments} dossier(s) de segments orphelins supprimé(s)")
+
+        if vacuum:
+            vacuum_incremental(os.path.join(persist_directory, CHROMA_SQLITE_FILE))
+            lexical_index = lexical_index if lexical_index is not None else get_lexical_index()
+            if lexical_index is not None:
+                lexical_index.optimize()
+                vacuum_incremental(lexical_index.path)
+    return replicated
+
+
+def compacter_index(
+    client=None,
+    persist_directory: str = CHROMA_DB_PATH,
+    lexical_index: Optional[LexicalIndex] = None,
+    grace_seconds: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    vacuum: bool = True,
+) -> CompactionReport:
+    """
+    Compacte l'index vectoriel sans interrompre les recherches (voir basculer_index), attend
+    le délai de grâce sans tenir le verrou d'index, puis finalise (voir finaliser_compaction).
+    Utilisée par compact_index.py ; la tâche Celery planifie la finalisation au lieu d'attendre.
+
+    Args:
+        client: Client ChromaDB (client persistant de l'application par défaut)
+        persist_directory: Dossier de la base ChromaDB
+        lexical_index: Index lexical à optimiser (celui de l'application par défaut)
+        grace_seconds: Délai entre la bascule et la suppression de l'ancienne collection
+        batch_size: Taille des lots de copie
+        vacuum: Récupérer les pages libres des fichiers SQLite
+
+    Returns:
+        Bilan de la compaction (taille et latence avant/après)
+    """
+    client = client or get_chroma_client()
+    lexical_index = lexical_index if lexical_index is not None else get_lexical_index()
+    grace_seconds = Config.VECTOR_COMPACTION_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    start = time.perf_counter()
+
+    report = basculer_index(client, persist_directory, batch_size)
+    if lexical_index is not None:
+        report.before.lexical_bytes = os.path.getsize(lexical_index.path)
+    time.sleep(grace_seconds)
+    report.replicated_chunks += finaliser_compaction(
+        report.collection_before, client, persist_directory, lexical_index, batch_size, vacuum,
+    )
+    new = client.get_or_create_collection(active_collection_name(persist_directory))
+    report.after = mesurer_index(new, persist_directory, report.sample, lexical_index)
+    report.seconds = time.perf_counter() - start
+    logger.info(
+        f"Compaction terminée en {report.seconds:.1f} s ('{report.collection_before}' -> '{report.collection_after}', "
+        f"bascule {report.swap_ms:.0f} ms) : {report.before.disk_bytes / 1024 / 1024:.1f} Mo -> "
+        f"{report.after.disk_bytes / 1024 / 1024:.1f} Mo, p50 {report.before.query_p50_ms:.1f} ms -> "
+        f"{report.after.query_p50_ms:.1f} ms"
+    )
+    return report
@@ -0,0 +1,56 @@
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RagRequestMetrics:
+    """
+    Métriques collectées pendant le traitement d'une question RAG.
+    Une instance est créée par requête puis journalisée à la fin du traitement.
+    """
+    llm_calls: int = 0
+    question_rewritten: bool = False
+    retrieved_documents: int = 0
+    answer_cache_hit: bool = False
+    # Fragments reclassés par le cross-encoder (None : reclassement désactivé, False : budget dépassé)
+    reranked: Optional[bool] = None
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def timer(self, step: str):
+        """Mesure la durée d'une étape (en millisecondes) et l'ajoute aux métriques."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings_ms[step] = self.timings_ms.get(step, 0.0) + (time.perf_counter() - start) * 1000
+
+    def callbacks(self) -> List[BaseCallbackHandler]:
+        """Callbacks Langchain à transmettre aux chaînes pour compter les appels au LLM."""
+        return [LLMCallCounter(self)]
+
+    def as_log(self) -> str:
+        timings = ", ".join(f"{step}={duration:.0f}ms" for step, duration in self.timings_ms.items())
+        return (
+            f"appels LLM={self.llm_calls}, question reformulée={self.question_rewritten}, "
+            f"documents={self.retrieved_documents}, cache={'oui' if self.answer_cache_hit else 'non'}"
+            + (f", reclassement={'oui' if self.reranked else 'repli'}" if self.reranked is not None else "")
+            + (f", {timings}" if timings else "")
+        )
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Compte chaque démarrage d'appel au LLM (modèles de chat inclus)."""
+
+    def __init__(self, metrics: RagRequestMetrics):
+        self.metrics = metrics
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.metrics.llm_calls += 1
@@ -0,0 +1,115 @@
+import logging
+import os
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model.int8.onnx"
+# Longueur maximale utilisée par sentence-transformers pour paraphrase-multilingual-mpnet-base-v2
+MAX_SEQ_LENGTH = 128
+
+
+def onnx_model_dir(base_dir: str, model_name: str) -> str:
+    """Dossier d'export ONNX propre à un modèle (ex: onnx_models/sentence-transformers__paraphrase-...)."""
+    return os.path.join(base_dir, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """
+    Exporte le transformer d'un modèle sentence-transformers au format ONNX,
+    avec le tokenizer, puis produit une variante quantifiée int8 (quantification dynamique).
+
+    Args:
+        model_name: Nom ou chemin du modèle HuggingFace
+        output_dir: Dossier de destination
+        quantize: Produire aussi le modèle int8
+
+    Returns:
+        Dossier contenant les modèles exportés
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Export ONNX du modèle {model_name} vers {output_dir}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["نص تجريبي"], return_tensors="pt")
+    onnx_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+            dynamo=False,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, os.path.join(output_dir, ONNX_INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    logger.info("Export ONNX terminé")
+    return output_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings calculés avec ONNX Runtime sur CPU, équivalents à
+    HuggingFaceEmbeddings (mean pooling du dernier état caché, sans normalisation).
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, batch_size: int = 32, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            mask = batch["attention_mask"].astype(np.int64)
+            hidden = self.session.run(
+                None, {"input_ids": batch["input_ids"].astype(np.int64), "attention_mask": mask}
+            )[0]
+            # Mean pooling sur les tokens réels, comme le module Pooling de sentence-transformers
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            embeddings.extend(pooled.tolist())
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chromadb.errors import InvalidCollectionException
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from src.config import Config
+from .executors import get_partition_search_executor
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MODES = ("shared", "document")
+# Préfixe des collections de partition (une par contenu uploadé, clé d'index "document_uid")
+PARTITION_PREFIX = "doc_"
+
+
+def partition_name(document_uid: str) -> str:
+    """
+    Nom de la collection d'un document : empreinte de sa clé d'index, de longueur fixe
+    (les noms de collection ChromaDB sont limités à 63 caractères). La clé elle-même est
+    conservée dans les métadonnées de la collection.
+    """
+    return PARTITION_PREFIX + hashlib.sha1(document_uid.encode("utf-8")).hexdigest()
+
+
+def get_partition(client, document_uid: str, create: bool = False):
+    """Collection d'un document, ou None si elle n'existe pas (et que `create` est faux)."""
+    if create:
+        return client.get_or_create_collection(partition_name(document_uid), metadata={"document_uid": document_uid})
+    try:
+        return client.get_collection(partition_name(document_uid))
+    except InvalidCollectionException:
+        return None
+
+
+def ecrire_partition(client, document_uid: str, ids: Sequence[str], embeddings, documents: Sequence[Document]) -> None:
+    """Ajoute ou remplace des fragments dans la collection du document (créée au besoin)."""
+    get_partition(client, document_uid, create=True).upsert(
+        ids=list(ids), embeddings=embeddings,
+        documents=[doc.page_content for doc in documents],
+        metadatas=[doc.metadata or None for doc in documents],
+    )
+
+
+def supprimer_partitions(client, document_uids: Iterable[str]) -> int:
+    """
+    Supprime les collections des documents indiqués.
+
+    Returns:
+        Nombre de fragments supprimés
+    """
+    deleted = 0
+    for document_uid in document_uids:
+        partition = get_partition(client, document_uid)
+        if partition is None:
+            continue
+        deleted += partition.count()
+        client.delete_collection(partition.name)
+    return deleted
+
+
+def _query(collection, embedding: List[float], k: int, where: Optional[dict] = None) -> List[Tuple[float, Document]]:
+    if k == 0:
+        return []
+    result = collection.query(
+        query_embeddings=[embedding], n_results=k, where=where, include=["documents", "metadatas", "distances"],
+    )
+    return [
+        (distance, Document(page_content=text or "", metadata=metadata or {}, id=chunk_id))
+        for chunk_id, text, metadata, distance in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+        )
+    ]
+
+
+class PartitionedRetriever(BaseRetriever):
+    """
+    Recherche vectorielle dans les seules collections des documents actifs, sans filtre
+    de métadonnées : chaque index HNSW ne contient que les fragments d'un document, le
+    rappel n'est pas dégradé par le filtre et la latence ne dépend pas de la taille totale de la base.
+    Les k meilleurs fragments de toutes les partitions sont fusionnés par distance
+    (même modèle d'embedding, même espace). Les documents indexés avant le partitionnement
+    sont recherchés dans la collection partagée, filtrée par "document_uid".
+
+    Les partitions sont interrogées en parallèle (au plus VECTOR_PARTITION_SEARCH_WORKERS
+    à la fois) : la latence suit la partition la plus lente plutôt que leur somme.
+
+    Un document n'est interrogeable qu'une fois indexé : sa partition ne change plus ensuite,
+    son nombre de fragments est donc gardé avec la collection (une collection supprimée
+    puis recréée est relue).
+    """
+
+    client: Any
+    embeddings: Any
+    document_uids: Tuple[str, ...]
+    k: int = 7
+    shared_collection: Any = None
+    # Clé d'index -> (partition, nombre de fragments)
+    _partitions: Dict[str, Tuple[Any, int]] = PrivateAttr(default_factory=dict)
+
+    def _partition(self, document_uid: str, refresh: bool = False) -> Optional[Tuple[Any, int]]:
+        if refresh or document_uid not in self._partitions:
+            partition = get_partition(self.client, document_uid)
+            if partition is None:
+                # Pas encore migré : non mémorisé, la partition peut apparaître plus tard
+                self._partitions.pop(document_uid, None)
+                return None
+            self._partitions[document_uid] = (partition, partition.count())
+        return self._partitions[document_uid]
+
+    def _search_partition(self, document_uid: str, embedding: List[float]) -> Optional[List[Tuple[float, Document]]]:
+        """Fragments les plus proches dans la partition du document, ou None s'il n'est pas partitionné."""
+        cached = self._partition(document_uid)
+        if cached is None:
+            return None
+        try:
+            return _query(cached[0], embedding, min(self.k, cached[1]))
+        except Exception:
+            cached = self._partition(document_uid, refresh=True)
+            return None if cached is None else _query(cached[0], embedding, min(self.k, cached[1]))
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if not self.document_uids:
+            return []
+        embedding = self.embeddings.embed_query(query)
+        if len(self.document_uids) > 1 and Config.VECTOR_PARTITION_SEARCH_WORKERS > 1:
+            searches = list(get_partition_search_executor().map(
+                lambda document_uid: self._search_partition(document_uid, embedding), self.document_uids
+            ))
+        else:
+            searches = [self._search_partition(document_uid, embedding) for document_uid in self.document_uids]
+        scored: List[Tuple[float, Document]] = []
+        legacy = []
+        for document_uid, results in zip(self.document_uids, searches):
+            if results is None:
+                legacy.append(document_uid)
+            else:
+                scored.extend(results)
+        if legacy and self.shared_collection is not None:
+            scored.extend(_query(self.shared_collection, embedding, self.k, where={"document_uid": {"$in": legacy}}))
+        scored.sort(key=lambda item: item[0])
+        return [doc for _, doc in scored[:self.k]]
+
+
+def migrer_vers_partitions(client, collection, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    Déplace les fragments des documents uploadés (métadonnée "document_uid") de la collection
+    partagée vers leurs partitions, sans recalcul des embeddings. Les fragments du corpus
+    (sans "document_uid") restent dans la collection partagée.
+
+    Returns:
+        Nombre de fragments déplacés par document
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    ids_by_document: Dict[str, List[str]] = {}
+    offset = 0
+    while True:
+        batch = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        if not batch["ids"]:
+            break
+        for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            document_uid = (metadata or {}).get("document_uid")
+            if document_uid:
+                ids_by_document.setdefault(document_uid, []).append(chunk_id)
+        offset += len(batch["ids"])
+
+    moved = {}
+    for document_uid, ids in ids_by_document.items():
+        for start in range(0, len(ids), batch_size):
+            batch = collection.get(ids=ids[start:start + batch_size], include=["embeddings", "documents", "metadatas"])
+            ecrire_partition(client, document_uid, batch["ids"], batch["embeddings"], [
+                Document(page_content=text or "", metadata=metadata or {})
+                for text, metadata in zip(batch["documents"], batch["metadatas"])
+            ])
+        collection.delete(ids=ids)
+        moved[document_uid] = len(ids)
+    logger.info(f"{sum(moved.values())} fragment(s) de {len(moved)} document(s) déplacé(s) vers leurs partitions")
+    return moved
@@ -0,0 +1,168 @@
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pypdf
+from langchain.schema import Document
+from langchain_community.document_loaders.base import BaseLoader
+from langchain_community.document_loaders.parsers.pdf import _purge_metadata
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Pools de processus d'extraction partagés (pattern singleton), créés au premier PDF volumineux
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+# Dans un processus démon (worker Celery prefork), pool billiard : multiprocessing
+# refuse qu'un processus démon crée des processus, billiard le permet
+_pdf_daemon_pool = None
+
+
+def get_pdf_executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Pool de processus réservé à l'extraction de texte des PDF.
+    Il est conservé d'un fichier à l'autre : le démarrage des processus ("spawn")
+    n'est payé qu'une fois par indexation. `workers` (PDF_EXTRACTION_WORKERS par
+    défaut) n'est utilisé qu'à la création du pool.
+    """
+    global _pdf_executor
+    if _pdf_executor is None:
+        workers = workers or Config.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+        _pdf_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_executor
+
+
+def get_pdf_daemon_pool(workers: Optional[int] = None):
+    """
+    Pool billiard ("spawn") utilisé à la place de get_pdf_executor dans un processus
+    démon, c'est-à-dire dans les workers Celery qui indexent les uploads.
+    """
+    global _pdf_daemon_pool
+    if _pdf_daemon_pool is None:
+        import billiard
+
+        workers = workers or Config.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+        _pdf_daemon_pool = billiard.get_context("spawn").Pool(processes=workers)
+    return _pdf_daemon_pool
+
+
+def shutdown_pdf_executor() -> None:
+    """Arrête les pools d'extraction (à l'arrêt de l'indexation, de l'application ou du worker)."""
+    global _pdf_executor, _pdf_daemon_pool
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=True)
+        _pdf_executor = None
+    if _pdf_daemon_pool is not None:
+        _pdf_daemon_pool.close()
+        _pdf_daemon_pool.join()
+        _pdf_daemon_pool = None
+
+
+def extraire_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str, float]]:
+    """
+    Extrait le texte des pages [start, end) d'un PDF (exécuté dans un processus du pool).
+    Même extraction que PyPDFLoader (mode "plain", texte nettoyé des espaces de bord).
+
+    Returns:
+        (numéro de page, texte, durée d'extraction en secondes) pour chaque page
+    """
+    return _extraire(pypdf.PdfReader(file_path), start, end)
+
+
+def _extraire(reader: pypdf.PdfReader, start: int, end: int) -> List[Tuple[int, str, float]]:
+    pages = []
+    for page_number in range(start, end):
+        page_start = time.perf_counter()
+        text = reader.pages[page_number].extract_text(extraction_mode="plain").strip()
+        pages.append((page_number, text, time.perf_counter() - page_start))
+    return pages
+
+
+class ParallelPyPDFLoader(BaseLoader):
+    """
+    Chargeur PDF équivalent à PyPDFLoader (un document par page, mêmes métadonnées),
+    qui répartit l'extraction du texte par plages de pages sur un pool de processus.
+    Les pages sont produites dans l'ordre du document, au plus deux plages par
+    processus étant en cours : la mémoire reste bornée pour les longs PDF.
+
+    L'extraction est parallèle pour le corpus (indexer_rag.py, pool multiprocessing)
+    comme pour les uploads, indexés dans les workers Celery prefork : ces processus
+    démons utilisent un pool billiard. Les petits PDF (PDF_PARALLEL_MIN_PAGES) et
+    PDF_EXTRACTION_WORKERS=1 restent dans le processus courant, avec le lecteur déjà ouvert.
+
+    Après le chargement, `page_seconds` donne la durée d'extraction de chaque page.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        workers: Optional[int] = None,
+        pages_per_shard: Optional[int] = None,
+        min_pages: Optional[int] = None
+    ):
+        self.file_path = str(file_path)
+        self.workers = Config.PDF_EXTRACTION_WORKERS if workers is None else workers
+        self.pages_per_shard = pages_per_shard or Config.PDF_PAGES_PER_SHARD
+        self.min_pages = Config.PDF_PARALLEL_MIN_PAGES if min_pages is None else min_pages
+        self.page_seconds: Dict[int, float] = {}
+
+    def _document_metadata(self, reader: pypdf.PdfReader) -> dict:
+        return _purge_metadata(
+            {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+            | dict(reader.metadata or {})
+            | {"source": self.file_path, "total_pages": len(reader.pages)}
+        )
+
+    def _iter_shards(self, reader: pypdf.PdfReader) -> Iterator[List[Tuple[int, str, float]]]:
+        total_pages = len(reader.pages)
+        shards = [(start, min(start + self.pages_per_shard, total_pages))
+                  for start in range(0, total_pages, self.pages_per_shard)]
+        workers = self.workers or os.cpu_count() or 1
+        if workers <= 1 or len(shards) <= 1 or total_pages < self.min_pages:
+            for start, end in shards:
+                yield _extraire(reader, start, end)
+            return
+
+        logger.info(f"Extraction de {self.file_path} : {total_pages} pages en {len(shards)} plages")
+        daemon = multiprocessing.current_process().daemon
+        pool = get_pdf_daemon_pool(workers) if daemon else get_pdf_executor(workers)
+
+        def submit(start: int, end: int) -> Callable[[], List[Tuple[int, str, float]]]:
+            if daemon:
+                return pool.apply_async(extraire_pages, (self.file_path, start, end)).get
+            return pool.submit(extraire_pages, self.file_path, start, end).result
+
+        in_flight = deque()
+        for start, end in shards:
+            in_flight.append(submit(start, end))
+            # Ordre des pages conservé : on attend la plage la plus ancienne
+            while len(in_flight) >= 2 * workers:
+                yield in_flight.popleft()()
+        while in_flight:
+            yield in_flight.popleft()()
+
+    def lazy_load(self) -> Iterator[Document]:
+        reader = pypdf.PdfReader(self.file_path)
+        metadata = self._document_metadata(reader)
+        page_labels = reader.page_labels
+
+        start = time.perf_counter()
+        for shard in self._iter_shards(reader):
+            for page_number, text, seconds in shard:
+                self.page_seconds[page_number] = seconds
+                yield Document(
+                    page_content=text,
+                    metadata=metadata | {"page": page_number, "page_label": page_labels[page_number]},
+                )
+
+        if self.page_seconds:
+            slowest = max(self.page_seconds, key=self.page_seconds.get)
+            logger.info(
+                f"Extraction de {self.file_path} terminée en {time.perf_counter() - start:.2f}s : "
+                f"{1000 * sum(self.page_seconds.values()) / len(self.page_seconds):.1f} ms/page en moyenne, "
+                f"page {slowest} la plus lente ({1000 * self.page_seconds[slowest]:.1f} ms)"
+            )
@@ -0,0 +1,219 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from multiprocessing import get_context
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from src.config import Config
+from .lexical import LexicalIndex
+from .vectorstore import get_collection, get_embedding_function, load_embedding_model
+
+logger = logging.getLogger(__name__)
+
+# Modèle d'embedding propre à chaque processus du pool (chargé une seule fois par processus)
+_worker_embeddings: Optional[Embeddings] = None
+
+
+@dataclass
+class IndexingReport:
+    """Bilan d'une exécution du pipeline d'indexation."""
+    indexed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Fragments indexés par seconde."""
+        return self.indexed / self.seconds if self.seconds else 0.0
+
+
+def _init_worker(embedding_factory: Callable[[], Embeddings], threads_per_worker: int) -> None:
+    """Initialise un processus du pool : limite les threads puis charge le modèle."""
+    global _worker_embeddings
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    _worker_embeddings = embedding_factory()
+
+
+def _embed_in_worker(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _existing_ids(collection, ids: Sequence[str]) -> set:
+    """IDs déjà présents dans la collection (fragments indexés lors d'une exécution précédente)."""
+    return set(collection.get(ids=list(ids), include=[])["ids"])
+
+
+def delete_chunks(
+    collection,
+    ids: Sequence[str],
+    batch_size: Optional[int] = None,
+    lexical_index: Optional[LexicalIndex] = None
+) -> int:
+    """
+    Supprime des fragments de la collection (et de son index lexical) par lots bornés.
+    
+    Returns:
+        Nombre d'IDs demandés à la suppression
+    """
+    batch_size = batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    for batch in _batched(ids, batch_size):
+        collection.delete(ids=batch)
+        if lexical_index is not None:
+            lexical_index.delete(batch)
+    return len(ids)
+
+
+def index_documents(
+    documents: Iterable[Document],
+    ids: Iterable[str],
+    collection=None,
+    embedding_factory: Optional[Callable[[], Embeddings]] = None,
+    embed_batch_size: Optional[int] = None,
+    write_batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    lexical_index: Optional[LexicalIndex] = None
+) -> IndexingReport:
+    """
+    Calcule les embeddings des fragments par lots et les écrit dans ChromaDB.
+    Voir index_chunks ; les IDs sont fournis à part, dans le même ordre que les fragments.
+    """
+    return index_chunks(zip(ids, documents), collection=collection, embedding_factory=embedding_factory,
+                        embed_batch_size=embed_batch_size, write_batch_size=write_batch_size, workers=workers,
+                        lexical_index=lexical_index)
+
+
+def index_chunks(
+    chunks: Iterable[Tuple[str, Document]],
+    collection=None,
+    embedding_factory: Optional[Callable[[], Embeddings]] = None,
+    embed_batch_size: Optional[int] = None,
+    write_batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    lexical_index: Optional[LexicalIndex] = None,
+    on_stored: Optional[Callable[[List[str]], None]] = None
+) -> IndexingReport:
+    """
+    Calcule les embeddings des fragments par lots et les écrit dans ChromaDB.
+
+    Les fragments sont consommés au fil de l'eau : au plus deux lots par processus
+    sont en cours de calcul et les écritures se font par lots bornés. Un générateur
+    (par exemple des fenêtres de pages) n'est donc jamais matérialisé en entier. Les
+    fragments dont l'ID existe déjà dans la collection sont ignorés, ce qui permet de
+    reprendre une indexation interrompue sans tout recalculer (les IDs doivent être stables).
+
+    Args:
+        chunks: Couples (ID, fragment) à indexer
+        collection: Collection ChromaDB cible (collection principale par défaut)
+        embedding_factory: Fonction sans argument qui charge le modèle d'embedding
+            (doit être picklable pour le pool de processus)
+        embed_batch_size: Taille des lots d'embeddings
+        write_batch_size: Taille des lots d'écriture dans ChromaDB
+        workers: Nombre de processus (0 = nombre de cœurs, 1 = dans le processus courant)
+        lexical_index: Index lexical (BM25) tenu à jour avec la collection ; les fragments
+            déjà présents dans la collection y sont aussi écrits (index lexical créé après coup)
+        on_stored: Appelée avec les IDs de chaque lot écrit, ou déjà présent dans la collection :
+            l'appelant sait ainsi quels fragments sont enregistrés (reprise après interruption)
+
+    Returns:
+        Bilan de l'indexation
+    """
+    collection = collection if collection is not None else get_collection()
+    embed_batch_size = embed_batch_size or Config.INDEX_EMBED_BATCH_SIZE
+    write_batch_size = write_batch_size or Config.INDEX_WRITE_BATCH_SIZE
+    workers = Config.INDEX_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+
+    report = IndexingReport()
+    start = time.perf_counter()
+    pending: List[Tuple[str, Document, List[float]]] = []
+
+    def write_pending(force: bool = False) -> None:
+        while pending and (force or len(pending) >= write_batch_size):
+            batch = pending[:write_batch_size]
+            del pending[:write_batch_size]
+            collection.upsert(
+                ids=[chunk_id for chunk_id, _, _ in batch],
+                embeddings=[embedding for _, _, embedding in batch],
+                documents=[doc.page_content for _, doc, _ in batch],
+                metadatas=[doc.metadata or None for _, doc, _ in batch],
+            )
+            if lexical_index is not None:
+                lexical_index.upsert([chunk_id for chunk_id, _, _ in batch], [doc for _, doc, _ in batch])
+            if on_stored is not None:
+                on_stored([chunk_id for chunk_id, _, _ in batch])
+            report.indexed += len(batch)
+            report.seconds = time.perf_counter() - start
+            logger.info(
+                f"Indexation : {report.indexed} fragment(s) écrit(s), {report.skipped} ignoré(s) "
+                f"({report.throughput:.1f} fragments/s)"
+            )
+
+    def batches_to_embed() -> Iterator[Tuple[List[str], List[Document]]]:
+        for batch in _batched(chunks, embed_batch_size):
+            already_indexed = _existing_ids(collection, [chunk_id for chunk_id, _ in batch])
+            report.skipped += len(already_indexed)
+            if already_indexed and lexical_index is not None:
+                present = [(chunk_id, doc) for chunk_id, doc in batch if chunk_id in already_indexed]
+                lexical_index.upsert([chunk_id for chunk_id, _ in present], [doc for _, doc in present])
+            if already_indexed and on_stored is not None:
+                on_stored([chunk_id for chunk_id, _ in batch if chunk_id in already_indexed])
+            todo = [(chunk_id, doc) for chunk_id, doc in batch if chunk_id not in already_indexed]
+            if todo:
+                yield [chunk_id for chunk_id, _ in todo], [doc for _, doc in todo]
+
+    if workers <= 1:
+        embeddings = embedding_factory() if embedding_factory else get_embedding_function()
+        for batch_ids, batch_docs in batches_to_embed():
+            vectors = embeddings.embed_documents([doc.page_content for doc in batch_docs])
+            pending.extend(zip(batch_ids, batch_docs, vectors))
+            write_pending()
+    else:
+        embedding_factory = embedding_factory or partial(load_embedding_model, Config.EMBEDDING_BACKEND)
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        logger.info(f"Indexation avec {workers} processus ({threads_per_worker} thread(s) chacun)")
+        # "spawn" : les bibliothèques de calcul (torch, onnxruntime) supportent mal le fork
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(embedding_factory, threads_per_worker),
+        ) as executor:
+            in_flight = deque()
+            for batch_ids, batch_docs in batches_to_embed():
+                future = executor.submit(_embed_in_worker, [doc.page_content for doc in batch_docs])
+                in_flight.append((batch_ids, batch_docs, future))
+                # Ordre conservé et mémoire bornée : on attend le lot le plus ancien
+                while len(in_flight) >= 2 * workers:
+                    done_ids, done_docs, done_future = in_flight.popleft()
+                    pending.extend(zip(done_ids, done_docs, done_future.result()))
+                    write_pending()
+            while in_flight:
+                done_ids, done_docs, done_future = in_flight.popleft()
+                pending.extend(zip(done_ids, done_docs, done_future.result()))
+                write_pending()
+
+    write_pending(force=True)
+    report.seconds = time.perf_counter() - start
+    logger.info(
+        f"Indexation terminée : {report.indexed} fragment(s) indexé(s), {report.skipped} déjà présent(s), "
+        f"{report.seconds:.1f}s ({report.throughput:.1f} fragments/s)"
+    )
+    return report
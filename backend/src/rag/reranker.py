@@ -0,0 +1,197 @@
+import logging
+import os
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import Config
+from .onnx_embeddings import ONNX_INT8_MODEL_FILE, ONNX_MODEL_FILE, onnx_model_dir
+
+logger = logging.getLogger(__name__)
+
+# Longueur maximale d'une paire (question, fragment) : question courte + fragment de 120 tokens
+RERANK_MAX_LENGTH = 256
+RERANK_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Score de pertinence de chaque paire (question, fragment)
+PairScorer = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+# Instance partagée du reranker (pattern singleton)
+_reranker = None
+
+
+def export_cross_encoder_onnx(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """
+    Exporte un cross-encoder HuggingFace (classification de paires) au format ONNX,
+    avec son tokenizer, puis produit une variante quantifiée int8 (voir export_onnx_model).
+
+    Returns:
+        Dossier contenant les modèles exportés
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Export ONNX du cross-encoder {model_name} vers {output_dir}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["سؤال"], ["نص تجريبي"], return_tensors="pt")
+    onnx_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=14,
+            dynamo=False,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, os.path.join(output_dir, ONNX_INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    logger.info("Export ONNX terminé")
+    return output_dir
+
+
+class OnnxCrossEncoder:
+    """Scores d'un cross-encoder calculés avec ONNX Runtime sur CPU (logit de pertinence)."""
+
+    def __init__(self, model_dir: str, quantized: bool = False, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def __call__(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        batch = self.tokenizer(
+            [question for question, _ in pairs], [text for _, text in pairs],
+            padding=True, truncation="only_second", max_length=RERANK_MAX_LENGTH, return_tensors="np",
+        )
+        logits = self.session.run(None, {
+            "input_ids": batch["input_ids"].astype(np.int64),
+            "attention_mask": batch["attention_mask"].astype(np.int64),
+        })[0]
+        return logits[:, 0].tolist()
+
+
+def load_cross_encoder(backend: str, model_name: Optional[str] = None) -> PairScorer:
+    """
+    Charge le cross-encoder pour le backend demandé ("torch", "onnx" ou "onnx-int8").
+    Les backends ONNX exportent le modèle dans Config.EMBEDDING_ONNX_DIR au premier chargement.
+    """
+    if backend not in RERANK_BACKENDS:
+        raise ValueError(f"Backend de reranking inconnu: {backend} (attendu: {', '.join(RERANK_BACKENDS)})")
+    model_name = model_name or Config.RAG_RERANK_MODEL
+
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        model = CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH, device="cpu")
+        return lambda pairs: model.predict(pairs, batch_size=len(pairs), show_progress_bar=False).tolist()
+
+    quantized = backend == "onnx-int8"
+    model_dir = onnx_model_dir(Config.EMBEDDING_ONNX_DIR, model_name)
+    if not os.path.exists(os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)):
+        logger.info(f"Cross-encoder ONNX absent de {model_dir}, export en cours...")
+        export_cross_encoder_onnx(model_name, model_dir, quantize=quantized)
+    return OnnxCrossEncoder(model_dir, quantized=quantized, num_threads=Config.EMBEDDING_ONNX_THREADS)
+
+
+class CrossEncoderReranker:
+    """
+    Reclasse les fragments candidats par pertinence pour la question (cross-encoder).
+    Les paires sont évaluées par lots ; si l'échéance est dépassée entre deux lots,
+    le reclassement est abandonné et l'appelant garde l'ordre de la recherche.
+
+    Un lot en cours ne peut pas être interrompu (asyncio.wait_for n'arrête pas le thread) :
+    la taille de chaque lot est donc réduite au nombre de paires qui tiennent dans le temps
+    restant, d'après la durée par paire mesurée sur les lots précédents. Tant que cette durée
+    est inconnue, le premier lot ne contient qu'une paire. Le dépassement du budget est ainsi
+    limité à la durée d'une paire (plus la variance du CPU).
+    """
+
+    # Poids de la dernière mesure dans la moyenne glissante de la durée par paire
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self, scorer: PairScorer, batch_size: Optional[int] = None):
+        self.scorer = scorer
+        self.batch_size = batch_size or Config.RAG_RERANK_BATCH_SIZE
+        self.seconds_per_pair: Optional[float] = None
+
+    def _next_batch_size(self, deadline: Optional[float]) -> int:
+        """Taille du prochain lot (0 si même une paire ne tient plus avant l'échéance)."""
+        if deadline is None:
+            return self.batch_size
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return 0
+        if self.seconds_per_pair is None:
+            return 1
+        return min(self.batch_size, int(remaining / self.seconds_per_pair))
+
+    def _record_latency(self, elapsed: float, pairs: int) -> None:
+        measured = elapsed / pairs
+        if self.seconds_per_pair is None:
+            self.seconds_per_pair = measured
+        else:
+            self.seconds_per_pair += self.LATENCY_SMOOTHING * (measured - self.seconds_per_pair)
+
+    def rank(
+        self, question: str, documents: Sequence[Document], top_n: int, deadline: Optional[float] = None
+    ) -> Optional[List[Document]]:
+        """
+        Args:
+            deadline: Échéance (time.monotonic()) au-delà de laquelle le calcul est abandonné
+
+        Returns:
+            Les top_n fragments les plus pertinents, ou None si l'échéance est dépassée
+        """
+        scores: List[float] = []
+        start = 0
+        while start < len(documents):
+            size = self._next_batch_size(deadline)
+            if size < 1:
+                return None
+            batch = documents[start:start + size]
+            batch_start = time.monotonic()
+            scores.extend(self.scorer([(question, doc.page_content) for doc in batch]))
+            self._record_latency(time.monotonic() - batch_start, len(batch))
+            start += len(batch)
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [documents[i] for i in order[:top_n]]
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """Reranker partagé, chargé au premier appel (backend Config.RAG_RERANK_BACKEND)."""
+    global _reranker
+    if _reranker is None:
+        logger.info(f"Initialisation du reranker {Config.RAG_RERANK_MODEL} (backend {Config.RAG_RERANK_BACKEND})")
+        _reranker = CrossEncoderReranker(load_cross_encoder(Config.RAG_RERANK_BACKEND))
+    return _reranker
+
+
+def reranker_fragments(
+    question: str, documents: Sequence[Document], top_n: int, deadline: Optional[float] = None
+) -> Optional[List[Document]]:
+    """Reclasse les fragments avec le reranker partagé (à exécuter hors de la boucle asyncio)."""
+    return get_reranker().rank(question, documents, top_n, deadline)
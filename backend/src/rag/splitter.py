@@ -0,0 +1,112 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+from langchain.text_splitter import TextSplitter
+
+from .utils import estimer_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fins de phrase (point, points d'exclamation et d'interrogation latins et arabes, point urdu) et sauts de ligne
+FIN_DE_PHRASE = re.compile(r"(?:[.!?؟۔]+|\n)\s*")
+# Séparateurs de propositions (virgule et point-virgule arabes et latins, deux-points)
+FIN_DE_PROPOSITION = re.compile(r"[،؛,;:]\s*")
+FIN_DE_MOT = re.compile(r"\s+")
+NIVEAUX_DE_DECOUPAGE = (FIN_DE_PHRASE, FIN_DE_PROPOSITION, FIN_DE_MOT)
+
+# Compte les tokens d'une liste de textes, en un seul appel
+TokenCounter = Callable[[List[str]], List[int]]
+
+
+def compteur_de_tokens(tokenizer) -> TokenCounter:
+    """Compteur basé sur un tokenizer HuggingFace (sans les tokens spéciaux, comptés à part)."""
+    def count(texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    return count
+
+
+def compteur_estime(texts: List[str]) -> List[int]:
+    """Compteur de secours, sans tokenizer (voir estimer_tokens)."""
+    return [estimer_tokens(text) for text in texts]
+
+
+@lru_cache(maxsize=4)
+def get_token_counter(model_name: str) -> TokenCounter:
+    """
+    Compteur de tokens du modèle d'embedding, chargé une fois par processus.
+    Si le tokenizer n'est pas disponible (hors ligne, modèle absent), l'estimation
+    par nombre de caractères est utilisée.
+    """
+    try:
+        from transformers import AutoTokenizer
+        return compteur_de_tokens(AutoTokenizer.from_pretrained(model_name))
+    except Exception as e:
+        logger.warning(f"Tokenizer {model_name} indisponible ({e}), estimation du nombre de tokens")
+        return compteur_estime
+
+
+def _segments(text: str, pattern: re.Pattern, start: int, end: int) -> List[Tuple[int, int]]:
+    """Découpe text[start:end] après chaque séparateur ; les segments vides sont ignorés."""
+    spans = []
+    for match in pattern.finditer(text, start, end):
+        if match.end() > start and text[start:match.end()].strip():
+            spans.append((start, match.end()))
+        start = max(start, match.end())
+    if start < end and text[start:end].strip():
+        spans.append((start, end))
+    return spans
+
+
+class ArabicTokenSplitter(TextSplitter):
+    """
+    Découpe un texte en fragments mesurés en tokens du modèle d'embedding.
+
+    Le texte est découpé en phrases (؟ ۔ . ! ? et sauts de ligne), dont les tokens sont
+    comptés en un seul appel au tokenizer ; seules les phrases trop longues sont
+    redécoupées en propositions (، ؛ , ;) puis en mots. Les phrases sont ensuite
+    regroupées en une seule passe, sans dépasser `chunk_size` tokens, avec un
+    chevauchement d'au plus `chunk_overlap` tokens de phrases entières.
+    Les fragments sont des extraits exacts du texte d'origine.
+    """
+
+    def __init__(self, count_tokens: TokenCounter, chunk_size: int = 120, chunk_overlap: int = 16, **kwargs):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        self._count_tokens = count_tokens
+
+    def _units(self, text: str, start: int, end: int, level: int = 0) -> List[Tuple[int, int, int]]:
+        spans = _segments(text, NIVEAUX_DE_DECOUPAGE[level], start, end)
+        units = []
+        for (span_start, span_end), tokens in zip(spans, self._count_tokens([text[s:e] for s, e in spans])):
+            if tokens > self._chunk_size and level + 1 < len(NIVEAUX_DE_DECOUPAGE):
+                units.extend(self._units(text, span_start, span_end, level + 1))
+            else:
+                # Un mot seul plus long que la limite est conservé tel quel
+                units.append((span_start, span_end, tokens))
+        return units
+
+    def split_text(self, text: str) -> List[str]:
+        chunks = []
+        window: List[Tuple[int, int, int]] = []
+        window_tokens = 0
+        first = 0  # Début de la fenêtre courante dans `window`
+
+        for unit in self._units(text, 0, len(text)):
+            tokens = unit[2]
+            if first < len(window) and window_tokens + tokens > self._chunk_size:
+                chunks.append(text[window[first][0]:window[-1][1]].strip())
+                # Chevauchement : on garde les dernières phrases tant qu'elles tiennent
+                while first < len(window) and (
+                    window_tokens > self._chunk_overlap or window_tokens + tokens > self._chunk_size
+                ):
+                    window_tokens -= window[first][2]
+                    first += 1
+            window.append(unit)
+            window_tokens += tokens
+
+        if first < len(window):
+            chunks.append(text[window[first][0]:window[-1][1]].strip())
+        return chunks
@@ -2,12 +2,77 @@ import arabic_reshaper
 from bidi.algorithm import get_display
 from camel_tools.utils.normalize import normalize_unicode
 from langchain_community.document_loaders import TextLoader
-from typing import List
+from typing import Iterator, List
 from langchain.schema import Document
+import re
+import unicodedata
+
+# Nombre moyen de caractères par token LLM, estimation prudente pour l'arabe
+CHARS_PER_TOKEN = 3
+
+def estimer_tokens(text: str) -> int:
+    """
+    Estime le nombre de tokens LLM d'un texte sans appel au modèle.
+    
+    Args:
+        text: Texte à mesurer
+        
+    Returns:
+        Nombre de tokens estimé
+    """
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+# Ponctuation finale ignorée lors de la comparaison de questions
+PONCTUATION_FINALE = "؟?!.،,؛;: "
+TATWEEL = "\u0640"
+# Diacritiques (tanwin, harakat, shadda, sukun, hamza et madda isolées), alif suscrit et signes coraniques
+DIACRITIQUES = "".join(chr(c) for c in range(0x064B, 0x0660)) + "\u0670" + "".join(chr(c) for c in range(0x06D6, 0x06EE))
+# Table unique appliquée en une passe : suppressions et unification des lettres
+_TABLE_NORMALISATION = str.maketrans({
+    **{c: None for c in DIACRITIQUES + TATWEEL},
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",  # formes d'alif
+    "ى": "ي",  # alif maqsura
+    "ة": "ه",  # ta marbuta
+})
+_ESPACES = re.compile(r"\s+")
+
+def normaliser_texte_arabe(text: str) -> str:
+    """
+    Normalise un texte arabe pour l'index et la comparaison (et non pour l'affichage) :
+    NFKC (qui ramène aussi les formes de présentation à leurs lettres de base),
+    suppression des diacritiques et du tatweel, unification des formes d'alif,
+    de l'alif maqsura et du ta marbuta, espaces réduits.
+    Appliquée de la même manière aux fragments indexés et aux questions.
+    
+    Args:
+        text: Texte brut
+        
+    Returns:
+        Texte normalisé
+    """
+    text = unicodedata.normalize("NFKC", text).translate(_TABLE_NORMALISATION)
+    return _ESPACES.sub(" ", text).strip()
+
+def normaliser_requete(text: str) -> str:
+    """
+    Normalise une question pour la comparer à d'autres formulations :
+    normalisation arabe, casse et ponctuation finale ignorées.
+    
+    Args:
+        text: Question brute de l'utilisateur
+        
+    Returns:
+        Question normalisée
+    """
+    return normaliser_texte_arabe(text).strip(PONCTUATION_FINALE).casefold()
 
 def pretraiter_texte_arabe(text: str) -> str:
     """
-    Applique un prétraitement complet au texte arabe pour un affichage et traitement corrects.
+    Prépare un texte arabe pour l'affichage dans un terminal ou une interface sans
+    support bidirectionnel. Ne pas utiliser avant l'indexation : les formes de
+    présentation et l'ordre visuel ne correspondent plus aux questions des utilisateurs.
     
     Étapes du traitement :
     1. Normalisation Unicode pour standardiser les caractères
@@ -34,15 +99,17 @@ def pretraiter_texte_arabe(text: str) -> str:
 class ArabicTextLoader(TextLoader):
     """
     Chargeur de documents texte spécialisé pour les fichiers contenant du texte arabe.
-    Hérite de TextLoader et applique automatiquement le prétraitement arabe.
+    Le texte est conservé dans l'ordre logique Unicode (NFC) : la normalisation pour
+    l'index est appliquée par le modèle d'embedding (voir NormalizedEmbeddings) et
+    la mise en forme d'affichage (pretraiter_texte_arabe) n'est jamais indexée.
     """
     
     def load(self) -> List[Document]:
         """
-        Charge le fichier texte et applique le prétraitement arabe au contenu.
+        Charge le fichier texte arabe.
         
         Returns:
-            Liste contenant un document avec le texte prétraité et ses métadonnées
+            Liste contenant un document avec le texte et ses métadonnées
             
         Raises:
             RuntimeError: Si le fichier ne peut pas être lu
@@ -54,10 +121,14 @@ class ArabicTextLoader(TextLoader):
         except Exception as e:
             raise RuntimeError(f"Erreur lors de la lecture du fichier {self.file_path}: {e}") from e
 
-        # Application du prétraitement spécialisé pour l'arabe
-        processed_text = pretraiter_texte_arabe(text)
+        # Forme canonique Unicode, sans transformation d'affichage
+        processed_text = unicodedata.normalize("NFC", text)
 
         # Création des métadonnées avec le chemin source
         metadata = {"source": self.file_path}
         
-        return [Document(page_content=processed_text, metadata=metadata)]
\ No newline at end of file
+        return [Document(page_content=processed_text, metadata=metadata)]
+
+    def lazy_load(self) -> Iterator[Document]:
+        """Version itérable de load(), utilisée par le chargement au fil de l'eau."""
+        yield from self.load()
\ No newline at end of file
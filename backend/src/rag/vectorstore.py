@@ -1,17 +1,34 @@
 # src/rag/vectorstore.py
 import os
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from functools import lru_cache
+from typing import Iterable, List, Dict, Any, Optional, Tuple
 from langchain.schema import Document
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
-from chromadb import PersistentClient
+from chromadb import HttpClient, PersistentClient
 from chromadb.config import Settings
 
+from src.config import Config
+from .cache import get_answer_cache
+from .embeddings import NormalizedEmbeddings, build_cached_embeddings
+from .lexical import CORPUS_METADATA_KEY, LexicalIndex, get_lexical_index
+from .onnx_embeddings import OnnxEmbeddings, export_onnx_model, onnx_model_dir, ONNX_INT8_MODEL_FILE, ONNX_MODEL_FILE
+from .partitions import PARTITION_MODES, PartitionedRetriever, ecrire_partition, supprimer_partitions
+
 # Configuration des constantes pour la base de données vectorielle
 CHROMA_DB_PATH = os.path.join(os.getcwd(), "chroma_db_fiqh") # Chemin de stockage de la base ChromaDB
 COLLECTION_NAME = "fiqh_maliki" # Nom de la collection pour les documents de fiqh maliki
 EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2" # Modèle multilingue pour l'arabe et français
+RETRIEVER_CACHE_SIZE = 128 # Nombre de retrievers préparés conservés (un par ensemble de documents actifs)
+DELETE_BATCH_SIZE = 100 # Documents supprimés par requête filtrée (where) sur la collection
+# Fichier contenant le nom de la collection active (remplacée par la compaction, voir src/rag/maintenance.py)
+ACTIVE_COLLECTION_FILE = "active_collection"
+# Manifeste de l'indexation du corpus, réécrit à chaque exécution de indexer_rag.py
+MANIFEST_FILE = "index_manifest.json"
+# Fichier touché après chaque écriture dans la base embarquée (uploads indexés par les workers)
+WRITES_FILE = "last_write"
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,24 +36,60 @@ logger = logging.getLogger(__name__)
 # Variables globales pour les instances partagées (pattern singleton simple)
 _chroma_client = None
 _embedding_function = None
+_vectorstore = None
+_active_collection_checked_at = float("-inf")  # Dernière relecture de ACTIVE_COLLECTION_FILE (time.monotonic)
+_corpus_version = None  # Collection active et date d'écriture du manifeste à la dernière relecture
+_writes_seen = None  # Dates d'écriture du manifeste et de WRITES_FILE connues du client courant
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def load_embedding_model(backend: str):
+    """
+    Charge le modèle d'embedding pour le backend demandé.
+    Les backends ONNX exportent le modèle dans Config.EMBEDDING_ONNX_DIR au premier
+    chargement si l'export n'existe pas encore (voir export_embeddings_onnx.py).
+    
+    Args:
+        backend: "torch", "onnx" ou "onnx-int8"
+        
+    Returns:
+        Instance du modèle d'embedding (sans cache), précédée de la normalisation d'index
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Backend d'embedding inconnu: {backend} (attendu: {', '.join(EMBEDDING_BACKENDS)})")
+
+    if backend == "torch":
+        return NormalizedEmbeddings(HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            # model_kwargs={'device': 'cuda'} # Décommentez si GPU disponible
+            # encode_kwargs={'normalize_embeddings': False}
+        ))
+
+    quantized = backend == "onnx-int8"
+    model_dir = onnx_model_dir(Config.EMBEDDING_ONNX_DIR, EMBEDDING_MODEL_NAME)
+    model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+    if not os.path.exists(os.path.join(model_dir, model_file)):
+        logger.info(f"Modèle ONNX absent de {model_dir}, export en cours...")
+        export_onnx_model(EMBEDDING_MODEL_NAME, model_dir, quantize=quantized)
+    return NormalizedEmbeddings(OnnxEmbeddings(model_dir, quantized=quantized, num_threads=Config.EMBEDDING_ONNX_THREADS))
 
 def get_embedding_function():
     """
     Initialise et retourne le modèle d'embedding multilingue.
     Utilise un pattern singleton pour éviter les réinitialisations multiples.
+    Les embeddings de requêtes sont mis en cache (voir CachedEmbeddings).
     
     Returns:
-        Instance du modèle HuggingFace pour la génération d'embeddings
+        Modèle d'embedding (backend Config.EMBEDDING_BACKEND) enveloppé par le cache d'embeddings
     """
     global _embedding_function
     if _embedding_function is None:
-        logger.info(f"Initialisation du modèle d'embedding: {EMBEDDING_MODEL_NAME}")
+        backend = Config.EMBEDDING_BACKEND
+        logger.info(f"Initialisation du modèle d'embedding: {EMBEDDING_MODEL_NAME} (backend {backend})")
         try:
-            _embedding_function = HuggingFaceEmbeddings(
-                model_name=EMBEDDING_MODEL_NAME,
-                # model_kwargs={'device': 'cuda'} # Décommentez si GPU disponible
-                # encode_kwargs={'normalize_embeddings': False}
-            )
+            model = load_embedding_model(backend)
+            # Le backend fait partie de la clé de cache : int8 et fp32 ne produisent pas les mêmes vecteurs
+            _embedding_function = build_cached_embeddings(model, f"{EMBEDDING_MODEL_NAME}:{backend}")
             logger.info("Modèle d'embedding initialisé avec succès")
         except Exception as e:
             logger.error(f"Erreur lors de l'initialisation du modèle d'embedding: {e}", exc_info=True)
@@ -45,13 +98,20 @@ def get_embedding_function():
 
 def get_chroma_client():
     """
-    Initialise et retourne le client ChromaDB persistant.
-    Configure la base de données pour la persistance sur disque.
+    Initialise et retourne le client ChromaDB : client HTTP si Config.CHROMA_SERVER_HOST
+    est défini, sinon client persistant embarqué (base sur disque dans CHROMA_DB_PATH).
     
     Returns:
-        Instance du client ChromaDB persistant
+        Instance du client ChromaDB
     """
     global _chroma_client
+    if _chroma_client is None and Config.CHROMA_SERVER_HOST:
+        logger.info(f"Connexion au serveur ChromaDB {Config.CHROMA_SERVER_HOST}:{Config.CHROMA_SERVER_PORT}")
+        _chroma_client = HttpClient(
+            host=Config.CHROMA_SERVER_HOST,
+            port=Config.CHROMA_SERVER_PORT,
+            settings=Settings(anonymized_telemetry=False)
+        )
     if _chroma_client is None:
         logger.info(f"Initialisation du client ChromaDB persistant à : {CHROMA_DB_PATH}")
         try:
@@ -69,14 +129,109 @@ def get_chroma_client():
             raise
     return _chroma_client
 
+def active_collection_name(persist_directory: str = CHROMA_DB_PATH) -> str:
+    """
+    Nom de la collection servant les recherches : celui enregistré par la dernière
+    compaction dans ACTIVE_COLLECTION_FILE, sinon COLLECTION_NAME.
+    """
+    try:
+        with open(os.path.join(persist_directory, ACTIVE_COLLECTION_FILE), encoding="utf-8") as f:
+            return f.read().strip() or COLLECTION_NAME
+    except FileNotFoundError:
+        return COLLECTION_NAME
+
+def get_collection():
+    """Collection ChromaDB active (créée si nécessaire)."""
+    return get_chroma_client().get_or_create_collection(active_collection_name())
+
+def _manifest_mtime(persist_directory: str = CHROMA_DB_PATH) -> int:
+    try:
+        return os.stat(os.path.join(persist_directory, MANIFEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def _writes_mtime(persist_directory: str = CHROMA_DB_PATH) -> int:
+    try:
+        return os.stat(os.path.join(persist_directory, WRITES_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def marquer_ecriture(persist_directory: str = CHROMA_DB_PATH) -> None:
+    """
+    Signale une écriture dans la base embarquée aux autres processus (WRITES_FILE) :
+    ChromaDB embarqué ne partage pas les écritures entre processus, chacun garde ses
+    segments en mémoire. Les processus qui lisent rechargent leur client (_refresh_after_swap).
+    """
+    global _writes_seen
+    path = os.path.join(persist_directory, WRITES_FILE)
+    previous = _writes_mtime(persist_directory)
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(path, "a"):
+        pass
+    os.utime(path)
+    # Écriture de ce processus : son client la voit déjà, sauf écriture d'un autre processus entre-temps
+    if _writes_seen is not None and _writes_seen[1] == previous:
+        _writes_seen = (_writes_seen[0], _writes_mtime(persist_directory))
+
+def _recharger_client():
+    """Oublie le client embarqué et ses segments en mémoire : ils sont relus depuis le disque."""
+    global _chroma_client
+    if _chroma_client is not None:
+        _chroma_client.clear_system_cache()
+    _chroma_client = None
+    reset_vectorstore_cache()
+
+def _refresh_after_swap(force: bool = False):
+    """
+    Oublie le wrapper et les retrievers si une compaction a remplacé la collection active,
+    recharge le client embarqué si un autre processus a écrit dans la base (upload indexé
+    par un worker, réindexation par indexer_rag.py), et vide le cache de réponses si le
+    corpus a changé (compaction, ou réindexation dans un autre processus).
+    Sur le chemin des recherches, les fichiers ne sont relus qu'une fois par
+    Config.ACTIVE_COLLECTION_CHECK_SECONDS ; les écritures les relisent toujours (`force`).
+    """
+    global _active_collection_checked_at, _corpus_version, _writes_seen
+    now = time.monotonic()
+    if not force and now - _active_collection_checked_at < Config.ACTIVE_COLLECTION_CHECK_SECONDS:
+        return
+    _active_collection_checked_at = now
+    name = active_collection_name()
+    if _vectorstore is not None and _vectorstore._collection.name != name:
+        logger.info(f"Collection active remplacée par '{name}', rechargement du vectorstore")
+        reset_vectorstore_cache()
+    writes = (_manifest_mtime(), _writes_mtime())
+    if _writes_seen is not None and writes != _writes_seen and not Config.CHROMA_SERVER_HOST:
+        logger.info("Base vectorielle modifiée par un autre processus, rechargement du client ChromaDB")
+        _recharger_client()
+    _writes_seen = writes
+    version = f"{name}:{_manifest_mtime()}"
+    if _corpus_version is not None and version != _corpus_version:
+        logger.info(f"Corpus modifié ({_corpus_version} -> {version}), cache de réponses vidé")
+        get_answer_cache().clear()
+    _corpus_version = version
+
+def corpus_version() -> str:
+    """
+    Version du corpus servi (collection active et date d'écriture du manifeste d'indexation),
+    relue au plus une fois par Config.ACTIVE_COLLECTION_CHECK_SECONDS : clé du cache de réponses.
+    """
+    _refresh_after_swap()
+    return _corpus_version
+
 def get_vectorstore():
     """
-    Retourne une instance du wrapper Langchain pour ChromaDB.
-    Combine le client ChromaDB et le modèle d'embedding dans un wrapper Langchain.
+    Retourne l'instance partagée du wrapper Langchain pour ChromaDB.
+    Combine le client ChromaDB et le modèle d'embedding dans un wrapper Langchain,
+    construit une seule fois (pattern singleton).
     
     Returns:
         Instance du vectorstore Chroma configuré
     """
+    global _vectorstore
+    _refresh_after_swap()
+    if _vectorstore is not None:
+        return _vectorstore
+
     # Récupération des instances des composants nécessaires
     _chroma_client_instance = get_chroma_client()
     _embedding_function_instance = get_embedding_function()
@@ -88,21 +243,33 @@ def get_vectorstore():
 
     try:
         # Création du wrapper Langchain avec les composants initialisés
-        vectorstore = Chroma(
+        _vectorstore = Chroma(
             client=_chroma_client_instance,
-            collection_name=COLLECTION_NAME,
+            collection_name=active_collection_name(),
             embedding_function=_embedding_function_instance
         )
         logger.info("Wrapper VectorStore LangChain Chroma initialisé.")
-        return vectorstore
+        return _vectorstore
     except Exception as e:
         logger.error(f"Erreur lors de l'initialisation du wrapper Chroma Langchain: {e}", exc_info=True)
         raise
 
+def reset_vectorstore_cache():
+    """
+    Oublie le wrapper Chroma et les retrievers préparés.
+    À appeler lorsque la collection sous-jacente est recréée.
+    """
+    global _vectorstore
+    _vectorstore = None
+    _build_filtered_retriever.cache_clear()
+    _build_corpus_retriever.cache_clear()
+
 def get_filtered_retriever(active_document_uids: List[str], k: int = 7):
     """
-    Crée un retriever qui recherche uniquement dans les documents spécifiés.
-    Utilise le filtrage par UID de document pour limiter la recherche.
+    Retourne un retriever qui recherche uniquement dans les documents spécifiés.
+    Utilise le filtrage par UID de document pour limiter la recherche, ou, en mode
+    Config.VECTOR_PARTITION_MODE="document", les seules collections des documents indiqués.
+    Les retrievers sont mis en cache (LRU) par ensemble de documents actifs.
     
     Args:
         active_document_uids: Liste des identifiants uniques des documents à inclure
@@ -111,12 +278,30 @@ def get_filtered_retriever(active_document_uids: List[str], k: int = 7):
     Returns:
         Retriever configuré avec filtrage par documents
     """
-    logger.info(f"Création d'un retriever filtré pour {len(active_document_uids)} documents actifs")
+    _refresh_after_swap()
+    # L'ordre des documents n'a pas d'importance pour le filtre : clé canonique triée
+    return _build_filtered_retriever(tuple(sorted(set(active_document_uids))), k, Config.VECTOR_PARTITION_MODE)
+
+@lru_cache(maxsize=RETRIEVER_CACHE_SIZE)
+def _build_filtered_retriever(document_uids: Tuple[str, ...], k: int, partition_mode: str = "shared"):
+    """Construit le retriever filtré pour un ensemble canonique de documents."""
+    if partition_mode not in PARTITION_MODES:
+        raise ValueError(f"Mode de partitionnement inconnu: {partition_mode} (attendu: {', '.join(PARTITION_MODES)})")
+    logger.info(f"Création d'un retriever filtré pour {len(document_uids)} documents actifs")
     
     vectorstore = get_vectorstore()
     
+    if partition_mode == "document":
+        return PartitionedRetriever(
+            client=get_chroma_client(),
+            embeddings=get_embedding_function(),
+            document_uids=document_uids,
+            k=k,
+            shared_collection=vectorstore._collection,
+        )
+
     # Gestion du cas où aucun document n'est spécifié
-    if not active_document_uids:
+    if not document_uids:
         logger.warning("Aucun document actif fourni - création d'un retriever vide")
         return vectorstore.as_retriever(
             search_kwargs={
@@ -126,7 +311,7 @@ def get_filtered_retriever(active_document_uids: List[str], k: int = 7):
         )
     
     # Création du filtre pour ChromaDB utilisant les UIDs spécifiés
-    filter_criteria = {"document_uid": {"$in": active_document_uids}}
+    filter_criteria = {"document_uid": {"$in": list(document_uids)}}
     logger.debug(f"Critères de filtre: {filter_criteria}")
     
     return vectorstore.as_retriever(
@@ -138,23 +323,37 @@ def get_filtered_retriever(active_document_uids: List[str], k: int = 7):
         }
     )
 
-def add_documents_to_vectorstore(documents: List[Document], document_uid: str = None):
+def get_corpus_retriever(k: int = 7):
+    """
+    Retourne le retriever du corpus de base : fragments marqués CORPUS_METADATA_KEY
+    de la collection active (mis en cache comme les retrievers filtrés).
     """
-    Ajoute une liste de documents (découpés) au Vector Store ChromaDB.
+    _refresh_after_swap()
+    return _build_corpus_retriever(k)
+
+@lru_cache(maxsize=8)
+def _build_corpus_retriever(k: int):
+    return get_vectorstore().as_retriever(search_kwargs={"k": k, "filter": {CORPUS_METADATA_KEY: True}})
+
+def add_documents_to_vectorstore(documents: List[Document], document_uid: str = None, start_index: int = 0):
+    """
+    Ajoute une liste de documents (découpés) au Vector Store ChromaDB et à l'index lexical.
     Enrichit les métadonnées avec l'UID du document pour permettre le filtrage.
+    En mode Config.VECTOR_PARTITION_MODE="document", les fragments d'un document vont dans sa collection.
     
     Args:
         documents: Liste des fragments de documents à ajouter
         document_uid: Identifiant unique du document source (pour le filtrage)
+        start_index: Rang du premier fragment dans le document (ajout par fenêtres successives)
     """
     if not documents:
         logger.warning("Aucun document à ajouter au vectorstore.")
         return
 
     try:
-        # Récupération du vectorstore configuré
+        # Récupération du vectorstore configuré (collection active relue : pas d'écriture dans une collection remplacée)
+        _refresh_after_swap(force=True)
         vectorstore = get_vectorstore()
-        logger.info(f"Ajout de {len(documents)} fragments de documents à la collection '{COLLECTION_NAME}'...")
 
         # Enrichissement des métadonnées pour le filtrage par document
         for i, doc in enumerate(documents):
@@ -166,14 +365,67 @@ def add_documents_to_vectorstore(documents: List[Document], document_uid: str =
                 logger.debug(f"Fragment {i}: ajout document_uid={document_uid} dans les métadonnées")
         
         # Génération d'identifiants uniques pour chaque fragment
-        ids = [f"{doc.metadata.get('document_uid', 'unknown')}_{i}" for i, doc in enumerate(documents)]
+        ids = [f"{doc.metadata.get('document_uid', 'unknown')}_{i}" for i, doc in enumerate(documents, start=start_index)]
         
+        if document_uid and Config.VECTOR_PARTITION_MODE == "document":
+            embeddings = get_embedding_function().embed_documents([doc.page_content for doc in documents])
+            ecrire_partition(get_chroma_client(), document_uid, ids, embeddings, documents)
+            get_lexical_index().upsert(ids, documents)
+            marquer_ecriture()
+            logger.info(f"Ajout terminé dans la partition du document {document_uid}.")
+            return
+
         # Ajout des documents au vectorstore (l'embedding est géré automatiquement)
+        logger.info(f"Ajout de {len(documents)} fragments de documents à la collection '{vectorstore._collection.name}'...")
         vectorstore.add_documents(documents=documents, ids=ids)
+        get_lexical_index().upsert(ids, documents)
+        marquer_ecriture()
         
         # Information sur le nombre total d'éléments dans la collection
         logger.info(f"Ajout terminé. La collection contient maintenant {vectorstore._collection.count()} éléments.")
 
     except Exception as e:
         logger.error(f"Erreur lors de l'ajout des documents au vectorstore: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+def delete_documents_from_vectorstore(
+    document_uids: Iterable[str],
+    collection=None,
+    lexical_index: Optional[LexicalIndex] = None,
+    batch_size: int = DELETE_BATCH_SIZE
+) -> int:
+    """
+    Supprime tous les fragments d'un ou plusieurs documents (métadonnée "document_uid")
+    de la collection et de son index lexical, par requêtes filtrées de `batch_size` documents.
+    Pour la collection principale, les partitions des documents sont aussi supprimées.
+    
+    Args:
+        document_uids: Identifiants des documents (clés d'index) à supprimer
+        collection: Collection ChromaDB (collection principale et son index lexical par défaut)
+        lexical_index: Index lexical à tenir à jour avec la collection
+        batch_size: Nombre de documents par requête de suppression
+    
+    Returns:
+        Nombre de fragments supprimés de la collection
+    """
+    document_uids = sorted(set(document_uids))
+    if not document_uids:
+        return 0
+    partition_chunks = 0
+    main_collection = collection is None
+    if main_collection:
+        collection = get_collection()
+        lexical_index = lexical_index if lexical_index is not None else get_lexical_index()
+        partition_chunks = supprimer_partitions(get_chroma_client(), document_uids)
+
+    count_before = collection.count()
+    for start in range(0, len(document_uids), batch_size):
+        batch = document_uids[start:start + batch_size]
+        collection.delete(where={"document_uid": {"$in": batch}})
+        if lexical_index is not None:
+            lexical_index.delete_documents(batch)
+    deleted = count_before - collection.count() + partition_chunks
+    if main_collection:
+        marquer_ecriture()
+    logger.info(f"{deleted} fragment(s) supprimé(s) pour {len(document_uids)} document(s) de la collection '{collection.name}'")
+    return deleted
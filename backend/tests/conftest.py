@@ -11,6 +11,8 @@ import os
 from src import app as original_app
 from src.db.main import get_session
 from src.auth.dependencies import AccessTokenBearer, RefreshTokenBearer, RoleChecker
+from src.rag import loader
+from src.rag.splitter import compteur_estime
 
 # Création des mocks pour les services et la session
 mock_session = AsyncMock()  # Utiliser AsyncMock pour les opérations asynchrones
@@ -75,4 +77,12 @@ def fake_user_service():
 @pytest.fixture
 def test_client():
     """Fixture pour le client de test FastAPI."""
-    return TestClient(app)
\ No newline at end of file
+    return TestClient(app)
+
+@pytest.fixture(autouse=True)
+def token_counter_without_download(monkeypatch):
+    """
+    Découpage avec le compteur estimé : get_token_counter téléchargerait le tokenizer
+    depuis HuggingFace (délais réseau hors ligne), les tests restent hermétiques.
+    """
+    monkeypatch.setattr(loader, "get_token_counter", lambda model_name: compteur_estime)
@@ -0,0 +1,39 @@
+"""Utilitaires partagés par les tests (et réutilisés par les benchmarks)."""
+
+LINE = "Bab al-tahara : les conditions de validite de l'ablution selon l'ecole malikite, paragraphe {page}-{line}."
+
+
+def write_text_pdf(path, pages, lines_per_page=40):
+    """
+    Écrit un PDF texte de `pages` pages (police Helvetica standard), page par page,
+    sans dépendance ni matérialisation du document complet.
+    """
+    offsets = {}
+    page_ids = [4 + 2 * i for i in range(pages)]
+    with open(path, "wb") as f:
+        def write_object(number, body):
+            offsets[number] = f.tell()
+            f.write(f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for page, page_id in enumerate(page_ids):
+            lines = "".join(
+                f"({LINE.format(page=page, line=line)}) Tj 0 -16 Td\n" for line in range(lines_per_page)
+            )
+            content = f"BT /F1 9 Tf 36 800 Td\n{lines}ET".encode("latin-1")
+            write_object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+            ).encode("latin-1"))
+            write_object(page_id + 1, f"<< /Length {len(content)} >>\nstream\n".encode("latin-1") + content + b"\nendstream")
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("latin-1"))
+
+        xref_offset = f.tell()
+        count = max(offsets) + 1
+        f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode("latin-1"))
+        for number in range(1, count):
+            f.write(f"{offsets[number]:010d} 00000 n \n".encode("latin-1"))
+        f.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1"))
@@ -0,0 +1,383 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src import celery_tasks
+from src.config import Config
+from src.conversations.service import ConversationService
+from src.rag.ingestion import UPLOAD_INDEX_VERSION
+from src.db.models import (
+    Conversation, Document, DOCUMENT_STATUS_FAILED, DOCUMENT_STATUS_INDEXING, DOCUMENT_STATUS_PENDING, DOCUMENT_STATUS_READY,
+)
+
+
+@pytest.fixture
+def eager_indexing(tmp_path, monkeypatch):
+    """File Celery en mode eager, base SQLite temporaire et vectorstore factice."""
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+    indexed_chunks = []
+
+    def fake_add_documents(documents, document_uid=None, start_index=0):
+        indexed_chunks.extend(documents)
+
+    monkeypatch.setattr(celery_tasks.c_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(celery_tasks, "get_task_engine", lambda: create_async_engine(database_url, poolclass=NullPool))
+    monkeypatch.setattr("src.rag.ingestion.add_documents_to_vectorstore", fake_add_documents)
+    monkeypatch.setattr(Config, "UPLOAD_DIR", str(tmp_path))
+
+    async def create_tables():
+        engine = create_async_engine(database_url)
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        await engine.dispose()
+
+    asyncio.run(create_tables())
+    return database_url, indexed_chunks
+
+
+def _add_document(database_url, file_path, index_key=None, conversation_uid=None, **fields):
+    async def add():
+        engine = create_async_engine(database_url)
+        document = Document(
+            uid=uuid.uuid4(), filename="fiqh.txt", conversation_uid=conversation_uid or uuid.uuid4(),
+            file_path=file_path, size=10, mime_type="text/plain", index_key=index_key, **fields
+        )
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(document)
+            await session.commit()
+        await engine.dispose()
+        return document.uid
+    return asyncio.run(add())
+
+
+def _get_document(database_url, document_uid):
+    async def get():
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine) as session:
+            document = await session.get(Document, document_uid)
+        await engine.dispose()
+        return document
+    return asyncio.run(get())
+
+
+def test_uploaded_document_is_indexed_by_the_queue(eager_indexing, tmp_path):
+    """
+    Un document créé "pending" est indexé par la tâche Celery puis passe à "ready".
+    """
+    database_url, indexed_chunks = eager_indexing
+    (tmp_path / "fiqh.txt").write_text("باب الطهارة\n\nفرائض الوضوء سبعة.", encoding="utf-8")
+    document_uid = _add_document(database_url, "fiqh.txt")
+    assert _get_document(database_url, document_uid).status == DOCUMENT_STATUS_PENDING
+
+    asyncio.run(celery_tasks.enqueue_document_indexing([document_uid]))
+
+    document = _get_document(database_url, document_uid)
+    assert document.status == DOCUMENT_STATUS_READY
+    assert document.index_error is None
+    assert indexed_chunks and all(chunk.metadata["document_uid"] == str(document_uid) for chunk in indexed_chunks)
+
+
+def test_indexing_failure_is_recorded(eager_indexing):
+    """
+    Une erreur d'indexation place le document à l'état "failed" avec le message d'erreur.
+    """
+    database_url, _ = eager_indexing
+    document_uid = _add_document(database_url, "absent.txt")
+
+    asyncio.run(celery_tasks.enqueue_document_indexing([document_uid]))
+
+    document = _get_document(database_url, document_uid)
+    assert document.status == DOCUMENT_STATUS_FAILED
+    assert document.index_error
+
+
+def test_identical_content_is_indexed_once(eager_indexing, tmp_path):
+    """
+    Deux documents de même contenu (deux conversations) partagent un seul jeu de vecteurs,
+    identifié par l'empreinte du contenu.
+    """
+    database_url, indexed_chunks = eager_indexing
+    (tmp_path / "fiqh.txt").write_text("باب الطهارة\n\nفرائض الوضوء سبعة.", encoding="utf-8")
+    first = _add_document(database_url, "fiqh.txt", index_key="abc123")
+    second = _add_document(database_url, "fiqh.txt", index_key="abc123")
+
+    asyncio.run(celery_tasks.enqueue_document_indexing([first]))
+    chunk_count = len(indexed_chunks)
+    asyncio.run(celery_tasks.enqueue_document_indexing([second]))
+
+    assert chunk_count and len(indexed_chunks) == chunk_count
+    assert all(chunk.metadata["document_uid"] == "abc123" for chunk in indexed_chunks)
+    assert _get_document(database_url, second).status == DOCUMENT_STATUS_READY
+
+
+def test_shared_file_and_vectors_are_deleted_with_the_last_document(eager_indexing, tmp_path, monkeypatch):
+    """
+    Le fichier et les vecteurs partagés ne sont supprimés qu'avec le dernier document qui les référence.
+    """
+    database_url, _ = eager_indexing
+    (tmp_path / "blob.txt").write_text("فرائض الوضوء سبعة.", encoding="utf-8")
+    first = _add_document(database_url, "blob.txt", index_key="abc123")
+    second = _add_document(database_url, "blob.txt", index_key="abc123")
+    deleted_keys = []
+    service = ConversationService()
+
+    async def owned_conversation(user_uid, conversation_uid, session):
+        return object()
+
+    monkeypatch.setattr(service, "get_user_conversation", owned_conversation)
+    monkeypatch.setattr(
+        "src.rag.vectorstore.delete_documents_from_vectorstore",
+        lambda document_uids: deleted_keys.extend(document_uids)
+    )
+
+    def remove(document_uid):
+        async def run():
+            engine = create_async_engine(database_url)
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                document = await session.get(Document, document_uid)
+                await service.remove_document_from_context(
+                    document_uid, document.conversation_uid, uuid.uuid4(), session
+                )
+            await engine.dispose()
+        asyncio.run(run())
+
+    remove(first)
+    assert (tmp_path / "blob.txt").exists() and deleted_keys == []
+
+    remove(second)
+    assert not (tmp_path / "blob.txt").exists() and deleted_keys == ["abc123"]
+
+
+def test_deleting_a_conversation_purges_its_unshared_vectors(eager_indexing, tmp_path, monkeypatch):
+    """
+    La suppression d'une conversation supprime les vecteurs et fichiers de ses documents,
+    sauf ceux partagés avec une autre conversation.
+    """
+    database_url, _ = eager_indexing
+    user_uid, conversation_uid = uuid.uuid4(), uuid.uuid4()
+    for name in ("own.txt", "shared.txt"):
+        (tmp_path / name).write_text("فرائض الوضوء سبعة.", encoding="utf-8")
+
+    async def add_conversation():
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine) as session:
+            session.add(Conversation(uid=conversation_uid, title="الطهارة", user_uid=user_uid))
+            await session.commit()
+        await engine.dispose()
+
+    asyncio.run(add_conversation())
+    _add_document(database_url, "own.txt", index_key="own", conversation_uid=conversation_uid)
+    _add_document(database_url, "shared.txt", index_key="shared", conversation_uid=conversation_uid)
+    _add_document(database_url, "shared.txt", index_key="shared")
+    deleted_keys = []
+    monkeypatch.setattr(
+        "src.rag.vectorstore.delete_documents_from_vectorstore",
+        lambda document_uids: deleted_keys.extend(document_uids)
+    )
+
+    async def delete_conversation():
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await ConversationService().delete_conversation(conversation_uid, user_uid, session)
+        await engine.dispose()
+
+    asyncio.run(delete_conversation())
+
+    assert deleted_keys == ["own"]
+    assert not (tmp_path / "own.txt").exists() and (tmp_path / "shared.txt").exists()
+
+
+def test_enqueue_failure_marks_uploads_failed(eager_indexing, monkeypatch):
+    """
+    Si l'envoi à la file Celery échoue après l'enregistrement, le document passe à "failed"
+    (avec le message d'erreur) au lieu de rester "pending" sans jamais être indexé.
+    """
+    from io import BytesIO
+
+    from fastapi import UploadFile
+
+    database_url, _ = eager_indexing
+    service = ConversationService()
+
+    async def owned_conversation(user_uid, conversation_uid, session):
+        return object()
+
+    async def broker_down(document_uids):
+        raise ConnectionError("broker injoignable")
+
+    monkeypatch.setattr(service, "get_user_conversation", owned_conversation)
+    monkeypatch.setattr("src.conversations.service.enqueue_document_indexing", broker_down)
+
+    async def upload():
+        engine = create_async_engine(database_url)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def postgres_uuid_default(connection, _):
+            # Valeur par défaut des UID côté serveur (fonction PostgreSQL absente de SQLite)
+            connection.create_function("gen_random_uuid", 0, lambda: uuid.uuid4().hex)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            result = await service.process_and_index_files(
+                [UploadFile(file=BytesIO("فرائض الوضوء سبعة.".encode("utf-8")), filename="fiqh.txt")],
+                uuid.uuid4(), uuid.uuid4(), session,
+            )
+        await engine.dispose()
+        return result
+
+    result = asyncio.run(upload())
+
+    [info] = result["documents"]
+    assert info["status"] == DOCUMENT_STATUS_FAILED and result["errors"]
+    document = _get_document(database_url, uuid.UUID(info["uid"]))
+    assert document.status == DOCUMENT_STATUS_FAILED
+    assert "broker injoignable" in document.index_error
+
+
+def test_same_content_is_indexed_by_one_task_at_a_time(eager_indexing, tmp_path):
+    """
+    Deux uploads simultanés d'un même contenu : tant que le premier est en cours d'indexation,
+    la tâche du second est relancée plus tard, puis partage ses vecteurs.
+    """
+    database_url, indexed_chunks = eager_indexing
+    (tmp_path / "fiqh.txt").write_text("باب الطهارة\n\nفرائض الوضوء سبعة.", encoding="utf-8")
+    first = _add_document(database_url, "fiqh.txt", index_key="abc123")
+    second = _add_document(database_url, "fiqh.txt", index_key="abc123")
+
+    async def set_status(document_uid, status):
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine) as session:
+            document = await session.get(Document, document_uid)
+            document.status = status
+            document.indexing_started_at = datetime.utcnow()
+            session.add(document)
+            await session.commit()
+        await engine.dispose()
+
+    asyncio.run(set_status(first, DOCUMENT_STATUS_INDEXING))
+    with pytest.raises(celery_tasks.IndexingInProgress):
+        asyncio.run(celery_tasks.index_uploaded_document(str(second)))
+    assert not indexed_chunks and _get_document(database_url, second).status == DOCUMENT_STATUS_PENDING
+
+    asyncio.run(set_status(first, DOCUMENT_STATUS_READY))
+    asyncio.run(celery_tasks.index_uploaded_document(str(second)))
+    assert not indexed_chunks and _get_document(database_url, second).status == DOCUMENT_STATUS_READY
+
+
+def test_abandoned_indexing_does_not_block_other_uploads(eager_indexing, tmp_path):
+    """
+    Une indexation commencée depuis plus de INDEXING_STALE_SECONDS (worker arrêté) n'est
+    plus attendue : le même contenu est indexé par la tâche suivante, et la tâche périodique
+    remet le document abandonné en attente.
+    """
+    database_url, indexed_chunks = eager_indexing
+    (tmp_path / "fiqh.txt").write_text("باب الطهارة\n\nفرائض الوضوء سبعة.", encoding="utf-8")
+    started_at = datetime.utcnow() - timedelta(seconds=Config.INDEXING_STALE_SECONDS + 60)
+    abandoned = _add_document(database_url, "fiqh.txt", index_key="abc123",
+                              status=DOCUMENT_STATUS_INDEXING, indexing_started_at=started_at)
+    running = _add_document(database_url, "autre.txt", index_key="def456",
+                            status=DOCUMENT_STATUS_INDEXING, indexing_started_at=datetime.utcnow())
+    second = _add_document(database_url, "fiqh.txt", index_key="abc123")
+
+    asyncio.run(celery_tasks.index_uploaded_document(str(second)))
+    assert indexed_chunks and _get_document(database_url, second).status == DOCUMENT_STATUS_READY
+
+    assert asyncio.run(celery_tasks.reset_stale_indexing_documents()) == [str(abandoned)]
+    assert _get_document(database_url, abandoned).status == DOCUMENT_STATUS_PENDING
+    assert _get_document(database_url, running).status == DOCUMENT_STATUS_INDEXING
+
+
+def test_eager_task_does_not_wait_for_an_indexing_copy(eager_indexing, tmp_path, monkeypatch):
+    """
+    En mode eager, self.retry relance la tâche immédiatement : le document est indexé
+    sans attendre la copie en cours plutôt que de boucler sur les tentatives.
+    """
+    database_url, indexed_chunks = eager_indexing
+    (tmp_path / "fiqh.txt").write_text("باب الطهارة\n\nفرائض الوضوء سبعة.", encoding="utf-8")
+    _add_document(database_url, "fiqh.txt", index_key="abc123", status=DOCUMENT_STATUS_INDEXING)
+    second = _add_document(database_url, "fiqh.txt", index_key="abc123")
+    retries = []
+    monkeypatch.setattr(celery_tasks.index_document, "retry", lambda **kwargs: retries.append(kwargs))
+
+    celery_tasks.index_document.delay(str(second))
+
+    assert retries == []
+    assert indexed_chunks and _get_document(database_url, second).status == DOCUMENT_STATUS_READY
+
+
+def test_content_lock_uses_a_postgres_advisory_lock():
+    executed = []
+
+    class FakeSession:
+        def __init__(self, dialect):
+            self.bind = type("Bind", (), {"dialect": type("Dialect", (), {"name": dialect})()})()
+
+        async def execute(self, statement, parameters=None):
+            executed.append((str(statement), parameters))
+
+    asyncio.run(celery_tasks.verrou_contenu(FakeSession("sqlite"), "abc123"))
+    assert executed == []
+    asyncio.run(celery_tasks.verrou_contenu(FakeSession("postgresql"), "abc123"))
+    assert executed == [("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))", {"key": "abc123"})]
+
+
+def test_shared_chunks_are_shown_under_the_conversation_filename(eager_indexing):
+    """
+    Les fragments partagés gardent le nom du premier fichier indexé : la source affichée
+    est le nom du document dans la conversation.
+    """
+    from langchain_core.documents import Document as LangchainDocument
+
+    database_url, _ = eager_indexing
+    conversation_uid = uuid.uuid4()
+    _add_document(database_url, "blob.txt", index_key="abc123", conversation_uid=conversation_uid)
+    shared = LangchainDocument(page_content="فرائض الوضوء سبعة.", metadata={"document_uid": "abc123", "source": "autre.txt"})
+    corpus = LangchainDocument(page_content="باب الطهارة", metadata={"source": "mukhtasar_khalil.txt", "corpus": True})
+
+    async def resolve():
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine) as session:
+            result = await ConversationService().with_display_names([shared, corpus], conversation_uid, session)
+        await engine.dispose()
+        return result
+
+    renamed, unchanged = asyncio.run(resolve())
+    assert renamed.metadata["source"] == "fiqh.txt" and shared.metadata["source"] == "autre.txt"
+    assert unchanged is corpus
+
+
+def test_documents_indexed_by_an_older_version_are_reindexed(eager_indexing, tmp_path, monkeypatch):
+    """
+    Les documents prêts indexés avant UPLOAD_INDEX_VERSION (texte remis en forme pour
+    l'affichage) sont réindexés une fois par contenu : anciens vecteurs supprimés,
+    nouveaux fragments écrits, version enregistrée pour toutes les copies.
+    """
+    database_url, indexed_chunks = eager_indexing
+    deleted_keys = []
+    monkeypatch.setattr(celery_tasks, "delete_documents_from_vectorstore", deleted_keys.extend)
+    (tmp_path / "blob.txt").write_text("فرائض الوضوء سبعة.", encoding="utf-8")
+    (tmp_path / "recent.txt").write_text("أركان الصلاة.", encoding="utf-8")
+    copies = [
+        _add_document(database_url, "blob.txt", index_key="abc123", status=DOCUMENT_STATUS_READY)
+        for _ in range(2)
+    ]
+    recent = _add_document(database_url, "recent.txt", index_key="def456", status=DOCUMENT_STATUS_READY,
+                           index_version=UPLOAD_INDEX_VERSION)
+
+    celery_tasks.reindex_outdated_uploads()
+
+    assert deleted_keys == ["abc123"]
+    assert indexed_chunks and all(chunk.metadata["document_uid"] == "abc123" for chunk in indexed_chunks)
+    for document_uid in copies + [recent]:
+        document = _get_document(database_url, document_uid)
+        assert document.status == DOCUMENT_STATUS_READY and document.index_version == UPLOAD_INDEX_VERSION
+    # Plus rien à réindexer
+    indexed_chunks.clear()
+    celery_tasks.reindex_outdated_uploads()
+    assert indexed_chunks == [] and deleted_keys == ["abc123"]
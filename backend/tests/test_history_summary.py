@@ -0,0 +1,218 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src import celery_tasks
+from src.config import Config
+from src.conversations.service import ConversationService
+from src.db.models import Conversation, Message, User
+from src.rag.chain import SUMMARY_TURN_PROMPT
+
+USER_UID = uuid.uuid4()
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def summary_policy(tmp_path, monkeypatch):
+    """Politique "summary" sur 2 échanges, file Celery en mode eager et base SQLite temporaire."""
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+    summarized = []
+
+    async def fake_summarize(previous_summary, turns):
+        summarized.append(turns)
+        return " | ".join(filter(None, [previous_summary] + [prompt for prompt, _ in turns]))
+
+    monkeypatch.setattr(Config, "RAG_HISTORY_POLICY", "summary")
+    monkeypatch.setattr(Config, "RAG_HISTORY_MAX_TURNS", 2)
+    monkeypatch.setattr(celery_tasks.c_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(celery_tasks, "get_task_engine", lambda: create_async_engine(database_url, poolclass=NullPool))
+    monkeypatch.setattr(celery_tasks, "summarize_history", fake_summarize)
+
+    async def create_tables():
+        engine = create_async_engine(database_url)
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            session.add(User(uid=USER_UID, username="u", email="u@example.com", first_name="u", last_name="u",
+                             password_hash="x"))
+            await session.commit()
+        await engine.dispose()
+
+    asyncio.run(create_tables())
+    return database_url, summarized
+
+
+def _create_conversation(database_url, turns):
+    async def create():
+        engine = create_async_engine(database_url)
+        conversation = Conversation(uid=uuid.uuid4(), title="Fiqh", user_uid=USER_UID)
+        messages = [
+            Message(uid=uuid.uuid4(), conversation_uid=conversation.uid, user_uid=USER_UID,
+                    prompt=f"q{i}", response=f"r{i}", created_at=START + timedelta(minutes=i))
+            for i in range(turns)
+        ]
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(conversation)
+            session.add_all(messages)
+            await session.commit()
+        await engine.dispose()
+        return conversation.uid, [message.uid for message in messages]
+    return asyncio.run(create())
+
+
+def _get_conversation(database_url, conversation_uid):
+    async def get():
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine) as session:
+            conversation = await session.get(Conversation, conversation_uid)
+        await engine.dispose()
+        return conversation
+    return asyncio.run(get())
+
+
+def test_saving_a_message_does_not_wait_for_the_summary(summary_policy, monkeypatch):
+    """Le résumé est mis à jour par la file Celery : la sauvegarde n'appelle pas le LLM."""
+    database_url, summarized = summary_policy
+    conversation_uid, _ = _create_conversation(database_url, 2)
+    queued = []
+    monkeypatch.setattr(celery_tasks.update_history_summary, "delay", queued.append)
+
+    async def save():
+        engine = create_async_engine(database_url)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def postgres_uuid_default(connection, _):
+            # Valeur par défaut des UID côté serveur (fonction PostgreSQL absente de SQLite)
+            connection.create_function("gen_random_uuid", 0, lambda: uuid.uuid4().hex)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await ConversationService().save_message_pair(
+                conversation_uid=conversation_uid, user_uid=USER_UID, prompt="q2", response="r2", session=session
+            )
+        await engine.dispose()
+
+    asyncio.run(save())
+
+    assert queued == [str(conversation_uid)]
+    assert summarized == []
+
+
+def test_dropped_turns_are_summarized_once(summary_policy):
+    database_url, summarized = summary_policy
+    conversation_uid, _ = _create_conversation(database_url, 5)
+
+    asyncio.run(celery_tasks.update_conversation_summary(str(conversation_uid)))
+    asyncio.run(celery_tasks.update_conversation_summary(str(conversation_uid)))
+
+    conversation = _get_conversation(database_url, conversation_uid)
+    assert conversation.history_summary == "q0 | q1 | q2"
+    assert conversation.history_summary_until == START + timedelta(minutes=2)
+    # La seconde exécution n'a rien à intégrer
+    assert summarized == [[("q0", "r0"), ("q1", "r1")], [("q2", "r2")]]
+
+
+def test_summary_is_dropped_when_the_history_is_edited_meanwhile(summary_policy, monkeypatch):
+    database_url, summarized = summary_policy
+    conversation_uid, message_uids = _create_conversation(database_url, 3)
+
+    async def edit_during_summary(previous_summary, turns):
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine) as session:
+            message = await session.get(Message, message_uids[0])
+            message.prompt = "q0 modifiée"
+            session.add(message)
+            await session.commit()
+        await engine.dispose()
+        return "résumé périmé"
+
+    monkeypatch.setattr(celery_tasks, "summarize_history", edit_during_summary)
+    asyncio.run(celery_tasks.update_conversation_summary(str(conversation_uid)))
+
+    conversation = _get_conversation(database_url, conversation_uid)
+    assert conversation.history_summary is None and conversation.history_summary_until is None
+
+
+def test_summary_is_computed_without_holding_a_connection(summary_policy, monkeypatch):
+    """Les appels au LLM ont lieu sans connexion (ni transaction ni verrou) ouverte sur la base."""
+    database_url, _ = summary_policy
+    conversation_uid, _ = _create_conversation(database_url, 4)
+    checked_out = []
+    held_during_summary = []
+
+    def get_task_engine():
+        engine = create_async_engine(database_url, poolclass=NullPool)
+        event.listen(engine.sync_engine, "checkout", lambda *args: checked_out.append(1))
+        event.listen(engine.sync_engine, "checkin", lambda *args: checked_out.pop())
+        return engine
+
+    async def summarize(previous_summary, turns):
+        held_during_summary.append(len(checked_out))
+        return " | ".join(prompt for prompt, _ in turns)
+
+    monkeypatch.setattr(celery_tasks, "get_task_engine", get_task_engine)
+    monkeypatch.setattr(celery_tasks, "summarize_history", summarize)
+    asyncio.run(celery_tasks.update_conversation_summary(str(conversation_uid)))
+
+    assert held_during_summary == [0]
+    assert _get_conversation(database_url, conversation_uid).history_summary == "q0 | q1"
+
+
+def _edit_and_capture_history(database_url, conversation_uid, message_uid, new_prompt):
+    """Édite un message et renvoie les historiques transmis à la régénération."""
+    regeneration_histories = []
+
+    async def fake_generate(prompt, conversation_uid, session, chat_history=None):
+        regeneration_histories.append(chat_history)
+        return f"réponse à {prompt}", None
+
+    service = ConversationService()
+    service.generate_rag_response = fake_generate
+
+    async def edit():
+        engine = create_async_engine(database_url)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await service.edit_message_and_regenerate(
+                conversation_uid, message_uid, USER_UID, new_prompt, session
+            )
+        await engine.dispose()
+    asyncio.run(edit())
+    return regeneration_histories
+
+
+def test_editing_after_the_summary_does_not_repeat_summarized_turns(summary_policy):
+    """Le résumé reste valable : la fenêtre ne reprend que les échanges qu'il ne couvre pas."""
+    database_url, _ = summary_policy
+    conversation_uid, message_uids = _create_conversation(database_url, 7)
+    asyncio.run(celery_tasks.update_conversation_summary(str(conversation_uid)))
+
+    regeneration_histories = _edit_and_capture_history(database_url, conversation_uid, message_uids[6], "q6 modifiée")
+
+    # q4 est déjà dans le résumé : seule q5 précède le message modifié
+    assert regeneration_histories == [[(SUMMARY_TURN_PROMPT, "q0 | q1 | q2 | q3 | q4"), ("q5", "r5")]]
+    assert _get_conversation(database_url, conversation_uid).history_summary == "q0 | q1 | q2 | q3 | q4"
+
+
+def test_editing_a_summarized_message_rebuilds_the_summary(summary_policy):
+    """
+    L'édition d'un message déjà résumé efface le résumé (ignoré pour la régénération),
+    puis le résumé est reconstruit à partir des échanges restants.
+    """
+    database_url, summarized = summary_policy
+    conversation_uid, message_uids = _create_conversation(database_url, 7)
+    asyncio.run(celery_tasks.update_conversation_summary(str(conversation_uid)))
+    assert _get_conversation(database_url, conversation_uid).history_summary == "q0 | q1 | q2 | q3 | q4"
+    regeneration_histories = _edit_and_capture_history(database_url, conversation_uid, message_uids[3], "q3 modifiée")
+
+    # Régénération sans le résumé, qui couvre le message modifié
+    assert regeneration_histories == [[("q1", "r1"), ("q2", "r2")]]
+    conversation = _get_conversation(database_url, conversation_uid)
+    # Restent q0, q1, q2 et q3 modifiée : le résumé est reconstruit avec q0 et q1
+    assert conversation.history_summary == "q0 | q1"
+    assert conversation.history_summary_until == START + timedelta(minutes=1)
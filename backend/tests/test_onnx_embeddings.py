@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+
+from src.rag.onnx_embeddings import OnnxEmbeddings, export_onnx_model
+from src.rag.vectorstore import EMBEDDING_MODEL_NAME
+
+# Échantillon fixe de textes arabes (questions et extraits de fiqh)
+ECHANTILLON_ARABE = [
+    "ما حكم الوضوء قبل الصلاة؟",
+    "فرائض الوضوء عند المالكية سبعة: النية وغسل الوجه وغسل اليدين إلى المرفقين.",
+    "هل يجوز الجمع بين الصلاتين في السفر؟",
+    "الزكاة واجبة في الذهب والفضة إذا بلغا النصاب وحال عليهما الحول.",
+    "قال مالك رحمه الله: لا بأس بذلك.",
+]
+
+
+def _cosine(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+@pytest.fixture(scope="module")
+def exported_model(tmp_path_factory):
+    """Exporte le modèle réel ; le test est ignoré si le modèle n'est pas téléchargeable."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    try:
+        reference = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    except Exception as e:
+        pytest.skip(f"Modèle {EMBEDDING_MODEL_NAME} indisponible: {e}")
+    output_dir = export_onnx_model(EMBEDDING_MODEL_NAME, str(tmp_path_factory.mktemp("onnx")), quantize=True)
+    return reference.embed_documents(ECHANTILLON_ARABE), output_dir
+
+
+def test_onnx_fp32_matches_torch(exported_model):
+    """
+    Les embeddings ONNX fp32 sont équivalents à ceux de PyTorch.
+    """
+    reference, output_dir = exported_model
+    onnx_embeddings = OnnxEmbeddings(output_dir).embed_documents(ECHANTILLON_ARABE)
+    assert _cosine(reference, onnx_embeddings).min() > 0.9999
+
+
+def test_onnx_int8_agrees_with_torch(exported_model):
+    """
+    Les embeddings int8 restent très proches de ceux de PyTorch (cosinus).
+    """
+    reference, output_dir = exported_model
+    onnx_embeddings = OnnxEmbeddings(output_dir, quantized=True).embed_documents(ECHANTILLON_ARABE)
+    assert _cosine(reference, onnx_embeddings).min() > 0.98
@@ -0,0 +1,194 @@
+import asyncio
+from unittest.mock import patch
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.config import Config
+from src.rag import cache, chain
+from src.rag.cache import SemanticAnswerCache
+from src.rag.metrics import RagRequestMetrics
+
+
+class FakeRetriever:
+    def invoke(self, query):
+        return [Document(page_content="نص فقهي", metadata={"document_uid": "doc-1"})]
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_lookup_respects_threshold_and_document_set():
+    """
+    Une question proche sur le même ensemble de documents réutilise la réponse ;
+    une question éloignée ou un autre ensemble de documents ne la réutilise pas.
+    """
+    answer_cache = SemanticAnswerCache(max_entries=10, similarity_threshold=0.95, ttl_seconds=60)
+    answer_cache.store("q", _vector(1, 0, 0), ["doc-1", "doc-2"], "جواب")
+
+    assert answer_cache.lookup(_vector(0.99, 0.05, 0), ["doc-2", "doc-1"]).answer == "جواب"
+    assert answer_cache.lookup(_vector(0.5, 0.5, 0), ["doc-1", "doc-2"]) is None
+    assert answer_cache.lookup(_vector(1, 0, 0), ["doc-1"]) is None
+
+    stats = answer_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert abs(stats["hit_rate"] - 1 / 3) < 1e-9
+
+
+def test_ttl_lru_and_invalidation():
+    """
+    Les entrées expirées, les moins récemment utilisées et celles d'un document modifié sont retirées.
+    """
+    answer_cache = SemanticAnswerCache(max_entries=2, similarity_threshold=0.95, ttl_seconds=60)
+    answer_cache.store("a", _vector(1, 0, 0), ["doc-1"], "أ")
+    answer_cache.store("b", _vector(0, 1, 0), ["doc-1"], "ب")
+    answer_cache.lookup(_vector(1, 0, 0), ["doc-1"])  # "a" devient la plus récente
+    answer_cache.store("c", _vector(0, 0, 1), ["doc-2"], "ج")
+
+    assert answer_cache.lookup(_vector(0, 1, 0), ["doc-1"]) is None
+    assert answer_cache.stats()["evictions"] == 1
+
+    assert answer_cache.invalidate_documents(["doc-1"]) == 1
+    assert answer_cache.lookup(_vector(1, 0, 0), ["doc-1"]) is None
+
+    answer_cache.ttl_seconds = -1
+    assert answer_cache.lookup(_vector(0, 0, 1), ["doc-2"]) is None
+    assert answer_cache.stats()["entries"] == 0
+
+
+def test_corpus_change_invalidates_cached_answers(tmp_path, monkeypatch):
+    """
+    Les réponses portent sur une version du corpus : une réindexation (manifeste réécrit,
+    dans un autre processus) ou une compaction les rend inutilisables et vide le cache.
+    """
+    from src.rag import vectorstore
+
+    answer_cache = SemanticAnswerCache(max_entries=10, similarity_threshold=0.95, ttl_seconds=60)
+    monkeypatch.setattr(cache, "_answer_cache", answer_cache)
+    monkeypatch.setattr(vectorstore, "_manifest_mtime", lambda: vectorstore.os.stat(tmp_path / "manifest").st_mtime_ns)
+    monkeypatch.setattr(vectorstore, "_corpus_version", None)
+    monkeypatch.setattr(Config, "ACTIVE_COLLECTION_CHECK_SECONDS", 0)
+    (tmp_path / "manifest").write_text("1")
+
+    version = vectorstore.corpus_version()
+    answer_cache.store("q", _vector(1, 0, 0), ["doc-1"], "جواب", corpus_version=version)
+    assert answer_cache.lookup(_vector(1, 0, 0), ["doc-1"], version).answer == "جواب"
+    assert answer_cache.lookup(_vector(1, 0, 0), ["doc-1"], "autre-collection:0") is None
+
+    # Réindexation du corpus : nouvelle version, cache vidé
+    vectorstore.os.utime(tmp_path / "manifest", ns=(0, 0))
+    assert vectorstore.corpus_version() != version
+    assert answer_cache.stats()["entries"] == 0
+
+
+def test_stats_are_logged_periodically(caplog):
+    answer_cache = SemanticAnswerCache(stats_log_interval=2)
+    with caplog.at_level("INFO", logger="src.rag.cache"):
+        answer_cache.lookup(_vector(1, 0, 0), ["doc-1"])
+        assert "taux" not in caplog.text
+        answer_cache.lookup(_vector(1, 0, 0), ["doc-1"])
+    assert "0 succès / 2 échec(s) (taux 0.0%)" in caplog.text
+
+
+def test_repeated_question_skips_llm(monkeypatch):
+    """
+    Une question répétée (ponctuation et espaces près) est servie sans appel au LLM.
+    """
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    monkeypatch.setattr(Config, "RAG_ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 1.0})
+    monkeypatch.setattr(cache, "_answer_cache", SemanticAnswerCache())
+    monkeypatch.setattr(chain, "_llm_instance", FakeListChatModel(responses=["الوضوء شرط لصحة الصلاة."]))
+    monkeypatch.setattr(chain, "_answer_chain", None)
+
+    def run(question):
+        metrics = RagRequestMetrics()
+        with patch.object(chain, "get_filtered_retriever", return_value=FakeRetriever()), \
+             patch.object(chain, "get_embedding_function", return_value=DeterministicFakeEmbedding(size=32)):
+            answer, sources, _ = asyncio.run(chain.generate_contextual_rag_response(question, ["doc-1"], [], metrics=metrics))
+        return answer, sources, metrics
+
+    first_answer, _, first = run("ما حكم الوضوء؟")
+    second_answer, sources, second = run("  ما حكم   الوضوء ")
+
+    assert first.llm_calls == 1 and first.answer_cache_hit is False
+    assert second.llm_calls == 0 and second.answer_cache_hit is True
+    assert second_answer == first_answer
+    assert sources[0].metadata["document_uid"] == "doc-1"
+
+
+def test_reindexed_document_is_not_served_from_cache(monkeypatch):
+    """
+    Une réindexation faite par un worker garde la clé d'index du document mais change sa
+    version : la réponse construite sur les anciens fragments n'est plus servie.
+    """
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    monkeypatch.setattr(Config, "RAG_ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 1.0})
+    monkeypatch.setattr(cache, "_answer_cache", SemanticAnswerCache())
+    monkeypatch.setattr(chain, "_llm_instance", FakeListChatModel(responses=["ancienne réponse", "nouvelle réponse"]))
+    monkeypatch.setattr(chain, "_answer_chain", None)
+
+    def run(index_stamp):
+        metrics = RagRequestMetrics()
+        with patch.object(chain, "get_filtered_retriever", return_value=FakeRetriever()), \
+             patch.object(chain, "get_embedding_function", return_value=DeterministicFakeEmbedding(size=32)):
+            answer, _, _ = asyncio.run(chain.generate_contextual_rag_response(
+                "ما حكم الوضوء؟", ["doc-1"], [], metrics=metrics, index_stamp=index_stamp
+            ))
+        return answer, metrics
+
+    assert run("1")[0] == "ancienne réponse"
+    assert run("1")[1].answer_cache_hit is True
+    answer, metrics = run("2")
+    assert metrics.answer_cache_hit is False and answer == "nouvelle réponse"
+
+
+def test_new_question_is_embedded_once(monkeypatch):
+    """
+    La clé du cache de réponses et la recherche vectorielle partagent l'embedding de la
+    question : une question nouvelle n'est calculée qu'une fois par le modèle.
+    """
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.rag.embeddings import CachedEmbeddings
+
+    class CountingEmbeddings(DeterministicFakeEmbedding):
+        calls: int = 0
+        texts: list = []
+
+        def embed_query(self, text):
+            self.calls += 1
+            self.texts = self.texts + [text]
+            return super().embed_query(text)
+
+    model = CountingEmbeddings(size=32)
+    embeddings = CachedEmbeddings(model, model_name="modele-test")
+
+    class EmbeddingRetriever:
+        def invoke(self, query):
+            embeddings.embed_query(query)
+            return FakeRetriever().invoke(query)
+
+    monkeypatch.setattr(Config, "RAG_ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 1.0})
+    monkeypatch.setattr(cache, "_answer_cache", SemanticAnswerCache())
+    monkeypatch.setattr(chain, "_llm_instance", FakeListChatModel(responses=["الوضوء شرط لصحة الصلاة."]))
+    monkeypatch.setattr(chain, "_answer_chain", None)
+
+    with patch.object(chain, "get_filtered_retriever", return_value=EmbeddingRetriever()), \
+         patch.object(chain, "get_embedding_function", return_value=embeddings):
+        asyncio.run(chain.generate_contextual_rag_response("ما حكم الوضوء؟", ["doc-1"], [], metrics=RagRequestMetrics()))
+
+    assert model.calls == 1
+    # Le modèle reçoit la question, pas la clé du cache (casse et ponctuation finale retirées)
+    assert model.texts == ["ما حكم الوضوء؟"]
+    assert embeddings.stats()["misses"] == 1 and embeddings.stats()["hits"] == 1
+
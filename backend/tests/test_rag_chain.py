@@ -0,0 +1,181 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag import chain
+from src.rag.chain import simulate_streaming, stream_contextual_rag_response, stream_markdown_chunks
+
+REPONSE = (
+    "الوضوء شرط لصحة الصلاة. فرائضه سبعة عند المالكية! "
+    "منها النية وغسل الوجه. هل تريد التفصيل؟ نعم.\n\n- الدليل: آية الوضوء."
+)
+
+
+class SlowStreamingLLM:
+    """Remplaçant de la chaîne de réponse qui émet ses tokens avec un délai, comme un vrai LLM."""
+
+    def __init__(self, tokens, delay=0.02):
+        self.tokens = tokens
+        self.delay = delay
+        self.finished = False
+
+    async def ainvoke(self, inputs, config=None):
+        return "".join(self.tokens)
+
+    async def astream(self, inputs, config=None):
+        for token in self.tokens:
+            await asyncio.sleep(self.delay)
+            yield token
+        self.finished = True
+
+
+class FakeRetriever:
+    def invoke(self, query):
+        return [Document(page_content="نص فقهي", metadata={"document_uid": "doc-1"})]
+
+
+@pytest.fixture(autouse=True)
+def disable_answer_cache(monkeypatch):
+    """Le cache de réponses est testé séparément (tests/test_rag_cache.py)."""
+    monkeypatch.setattr(Config, "RAG_ANSWER_CACHE_ENABLED", False)
+
+
+@pytest.fixture(autouse=True)
+def disable_hybrid_search(monkeypatch):
+    """La recherche hybride est testée séparément (tests/test_rag_lexical.py)."""
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", False)
+
+
+@pytest.fixture(autouse=True)
+def disable_corpus_search(monkeypatch):
+    """La recherche fédérée dans le corpus est testée séparément (tests/test_rag_federation.py)."""
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 1.0})
+
+
+def _tokens(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+async def _collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+async def _async_tokens(tokens):
+    for token in tokens:
+        yield token
+
+
+def test_stream_markdown_chunks_matches_simulate_streaming():
+    """
+    Les chunks produits à partir d'un flux de tokens ont les mêmes frontières
+    que ceux produits à partir de la réponse complète.
+    """
+    for size in (1, 2, 5, 17):
+        streamed = asyncio.run(_collect(stream_markdown_chunks(_async_tokens(_tokens(REPONSE, size)), chunk_size=20)))
+        assert streamed == list(simulate_streaming(REPONSE, chunk_size=20))
+
+
+def test_arabic_punctuation_and_line_ends_are_sentence_boundaries():
+    """
+    Une réponse sans ponctuation latine (؟ ۔ et fins de ligne) est transmise phrase par
+    phrase pendant la génération, avec les mêmes frontières que simulate_streaming.
+    """
+    reponse = "ما حكم الوضوء؟ هو شرط لصحة الصلاة۔ فرائضه سبعة\n- النية\n- غسل الوجه\nوالله أعلم"
+    tokens = _tokens(reponse, 4)
+    emitted_at = []
+
+    async def tokens_with_position():
+        for position, token in enumerate(tokens):
+            emitted_at.append(position)
+            yield token
+
+    async def consume():
+        return [(chunk, emitted_at[-1]) async for chunk in stream_markdown_chunks(tokens_with_position(), chunk_size=20)]
+
+    received = asyncio.run(consume())
+    assert [chunk for chunk, _ in received] == list(simulate_streaming(reponse, chunk_size=20))
+    assert len(received) > 2
+    # Le premier chunk part bien avant le dernier token
+    assert received[0][1] < len(tokens) // 2
+
+
+def test_first_chunk_arrives_before_generation_finishes(monkeypatch):
+    """
+    Le premier chunk doit être transmis pendant que le LLM génère encore.
+    """
+    monkeypatch.setattr(Config, "RAG_STREAMING_MODE", "tokens")
+    llm = SlowStreamingLLM(_tokens(REPONSE))
+
+    async def consume():
+        received = []
+        finished_when_first_chunk = None
+        async for chunk in stream_contextual_rag_response("ما حكم الوضوء؟", ["doc-1"], []):
+            if finished_when_first_chunk is None:
+                finished_when_first_chunk = llm.finished
+            received.append(chunk)
+        return received, finished_when_first_chunk
+
+    with patch.object(chain, "get_answer_chain", return_value=llm), \
+         patch.object(chain, "get_filtered_retriever", return_value=FakeRetriever()):
+        received, finished_when_first_chunk = asyncio.run(consume())
+
+    assert finished_when_first_chunk is False
+    assert llm.finished is True
+    assert received == list(simulate_streaming(REPONSE, chunk_size=Config.RAG_STREAM_CHUNK_SIZE))
+
+
+def test_needs_question_rewrite_policies():
+    """
+    La reformulation est ignorée sans historique ou pour une question autonome.
+    """
+    historique = [("ما حكم الوضوء؟", "الوضوء واجب للصلاة.")]
+
+    assert chain.needs_question_rewrite("ما هي فرائض الوضوء عند المالكية؟", [], "always") is False
+    assert chain.needs_question_rewrite("ما هي فرائض الوضوء عند المالكية؟", historique, "never") is False
+    assert chain.needs_question_rewrite("ما هي فرائض الوضوء عند المالكية؟", historique, "always") is True
+    assert chain.needs_question_rewrite("ما هي فرائض الوضوء عند المالكية؟", historique, "heuristic") is False
+    assert chain.needs_question_rewrite("وما الدليل عليه من السنة؟", historique, "heuristic") is True
+    assert chain.needs_question_rewrite("ولماذا؟", historique, "heuristic") is True
+
+
+def test_metrics_count_llm_calls(monkeypatch):
+    """
+    Les métriques indiquent le nombre d'appels au LLM utilisés pour chaque réponse.
+    """
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.rag.metrics import RagRequestMetrics
+
+    monkeypatch.setattr(chain, "_llm_instance", FakeListChatModel(responses=["سؤال مستقل", "جواب"]))
+    monkeypatch.setattr(chain, "_condense_question_chain", None)
+    monkeypatch.setattr(chain, "_answer_chain", None)
+    historique = [("ما حكم الوضوء؟", "الوضوء واجب للصلاة.")]
+
+    def run(question):
+        metrics = RagRequestMetrics()
+        with patch.object(chain, "get_filtered_retriever", return_value=FakeRetriever()):
+            asyncio.run(chain.generate_contextual_rag_response(question, ["doc-1"], historique, metrics=metrics))
+        return metrics
+
+    autonome = run("ما هي فرائض الوضوء عند المالكية؟")
+    assert autonome.llm_calls == 1
+    assert autonome.question_rewritten is False
+
+    relance = run("وما الدليل عليه من السنة؟")
+    assert relance.llm_calls == 2
+    assert relance.question_rewritten is True
+    assert relance.retrieved_documents == 1
+
+
+def test_trim_history_to_token_budget_keeps_most_recent_turns():
+    """
+    Le budget de tokens conserve les échanges les plus récents, dans l'ordre.
+    """
+    historique = [(f"سؤال {i}", "جواب " * 30) for i in range(5)]
+    budget_deux_echanges = 2 * (chain.estimer_tokens("سؤال 0") + chain.estimer_tokens("جواب " * 30))
+
+    assert chain.trim_history_to_token_budget(historique, budget_deux_echanges) == historique[-2:]
+    assert chain.trim_history_to_token_budget(historique, 0) == []
+    assert chain.trim_history_to_token_budget(historique, 10**6) == historique
@@ -0,0 +1,146 @@
+import json
+import re
+
+import chromadb
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.bench_arabic_normalization import PASSAGES
+from src.rag.dedup import NearDuplicateIndex
+from src.rag.incremental import indexer_incremental
+from src.rag.utils import DIACRITIQUES
+
+
+def _sans_diacritiques(text):
+    return re.sub(f"[{DIACRITIQUES}]", "", text)
+
+
+def test_near_duplicates_are_linked_to_the_first_chunk():
+    """
+    Une variante d'édition (vocalisation, un mot changé) est écartée au profit du premier
+    fragment ; un passage différent est conservé ; le bilan compte les octets économisés.
+    """
+    matn = " ".join(PASSAGES[:4])
+    variante = _sans_diacritiques(matn).replace("والفور", "والموالاة")
+    index = NearDuplicateIndex(threshold=0.8)
+
+    assert index.add("matn", matn) is None
+    assert index.add("sharh", variante) == "matn"
+    assert index.add("zakat", PASSAGES[8]) is None
+
+    assert index.report.seen == 3 and index.report.dropped == 1
+    assert index.report.bytes_saved == len(variante.encode("utf-8"))
+    assert index.report.links == {"sharh": "matn"}
+
+
+def test_incremental_indexing_skips_duplicates_and_restores_them(tmp_path):
+    """
+    Le même passage dans deux fichiers n'est indexé qu'une fois ; si le fichier
+    du fragment conservé disparaît, le doublon est indexé à la place.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    (source / "a_matn.txt").write_text(PASSAGES[0], encoding="utf-8")
+    (source / "b_sharh.txt").write_text(_sans_diacritiques(PASSAGES[0]), encoding="utf-8")
+    (source / "c_zakat.txt").write_text(PASSAGES[8], encoding="utf-8")
+    manifest = str(tmp_path / "manifest.json")
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("dedup-test")
+    except Exception:
+        pass
+    collection = client.create_collection("dedup-test")
+
+    def run():
+        return indexer_incremental(str(source), manifest, collection=collection,
+                                   embedding_factory=lambda: DeterministicFakeEmbedding(size=8), workers=1)
+
+    first = run()
+    assert first.duplicate_chunks == 1 and first.duplicate_bytes > 0
+    assert collection.count() == 2
+
+    (source / "a_matn.txt").unlink()
+    second = run()
+    assert second.changed_files == 1 and second.duplicate_chunks == 0
+    assert collection.count() == 2
+    sources = {metadata["source"] for metadata in collection.get()["metadatas"]}
+    assert any(path.endswith("b_sharh.txt") for path in sources)
+
+
+def test_new_file_is_compared_with_unchanged_indexed_files(tmp_path):
+    """
+    Un fichier ajouté lors d'une exécution ultérieure est comparé aux fragments déjà
+    indexés (signatures enregistrées, ou recalculées depuis la collection sans elles) :
+    le résultat ne dépend pas de l'historique des exécutions.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    (source / "a_matn.txt").write_text(PASSAGES[0], encoding="utf-8")
+    manifest = str(tmp_path / "manifest.json")
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("dedup-history-test")
+    except Exception:
+        pass
+    collection = client.create_collection("dedup-history-test")
+
+    def run():
+        return indexer_incremental(str(source), manifest, collection=collection,
+                                   embedding_factory=lambda: DeterministicFakeEmbedding(size=8), workers=1)
+
+    run()
+    assert (tmp_path / "manifest.minhash.npz").exists()
+    (source / "b_sharh.txt").write_text(_sans_diacritiques(PASSAGES[0]), encoding="utf-8")
+    second = run()
+    assert second.changed_files == 1 and second.duplicate_chunks == 1
+    assert collection.count() == 1
+
+    # Sans signatures enregistrées (index antérieur), elles sont recalculées depuis la collection
+    (tmp_path / "manifest.minhash.npz").unlink()
+    (source / "c_sharh.txt").write_text(PASSAGES[0], encoding="utf-8")
+    assert run().duplicate_chunks == 1
+    assert collection.count() == 1
+
+
+def test_unchanged_run_leaves_signatures_untouched(tmp_path, monkeypatch):
+    """
+    Une exécution sans fichier modifié ne lit ni ne réécrit les signatures ; une
+    suppression seule retire ses signatures du fichier sans reconstruire l'index.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    (source / "a_matn.txt").write_text(PASSAGES[0], encoding="utf-8")
+    (source / "b_matn.txt").write_text(PASSAGES[1], encoding="utf-8")
+    manifest = str(tmp_path / "manifest.json")
+    signatures = tmp_path / "manifest.minhash.npz"
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("dedup-noop-test")
+    except Exception:
+        pass
+    collection = client.create_collection("dedup-noop-test")
+
+    def run():
+        return indexer_incremental(str(source), manifest, collection=collection,
+                                   embedding_factory=lambda: DeterministicFakeEmbedding(size=8), workers=1)
+
+    run()
+    written = signatures.stat().st_mtime_ns
+    calls = []
+    monkeypatch.setattr(NearDuplicateIndex, "load", lambda self, path: calls.append("load") or {})
+    monkeypatch.setattr(NearDuplicateIndex, "save", lambda self, path, keys: calls.append("save") or 0)
+
+    assert run().unchanged_files == 2
+    assert calls == []
+    assert signatures.stat().st_mtime_ns == written
+
+    monkeypatch.undo()
+    (source / "b_matn.txt").unlink()
+    assert run().removed_files == 1
+    with open(manifest, encoding="utf-8") as f:
+        kept = [chunk_id for entry in json.load(f)["files"].values() for chunk_id in entry["chunk_ids"]]
+    with np.load(signatures) as data:
+        assert kept and data["keys"].tolist() == kept
@@ -0,0 +1,87 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.embeddings import CachedEmbeddings, NormalizedEmbeddings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Modèle factice qui compte les requêtes réellement calculées."""
+    calls: int = 0
+    texts: list = []
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.texts = self.texts + [text]
+        return super().embed_query(text)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+
+def test_query_embeddings_are_cached_by_normalized_text():
+    """
+    Deux graphies d'une même question (diacritiques, tatweel, espaces, ponctuation finale)
+    ne calculent qu'un embedding.
+    """
+    model = CountingEmbeddings(size=16)
+    embeddings = CachedEmbeddings(model, model_name="modele-a", max_entries=2)
+
+    first = embeddings.embed_query("ما حكم الصَّلاة")
+    second = embeddings.embed_query("ما  حكم الصـــلاة؟ ")
+
+    assert second == first
+    assert model.calls == 1
+    assert embeddings.stats()["hits"] == 1
+
+    embeddings.embed_query("سؤال ثان")
+    embeddings.embed_query("سؤال ثالث")
+    embeddings.embed_query("ما حكم الصلاة")  # évincé par le LRU
+    assert model.calls == 4
+
+
+def test_redis_tier_is_shared_per_model():
+    """
+    Le niveau Redis est partagé entre instances mais séparé par nom de modèle.
+    """
+    redis_client = FakeRedis()
+    model = CountingEmbeddings(size=16)
+    CachedEmbeddings(model, model_name="modele-a", redis_client=redis_client).embed_query("ما حكم الوضوء")
+
+    other_process = CachedEmbeddings(model, model_name="modele-a", redis_client=redis_client)
+    other_process.embed_query("ما حكم الوضوء")
+    assert model.calls == 1
+    assert other_process.stats()["redis_hits"] == 1
+
+    CachedEmbeddings(model, model_name="modele-b", redis_client=redis_client).embed_query("ما حكم الوضوء")
+    assert model.calls == 2
+
+
+def test_documents_and_queries_share_the_index_normalization():
+    """
+    Un fragment vocalisé et la même question tapée sans diacritiques ont le même embedding.
+    """
+    embeddings = NormalizedEmbeddings(DeterministicFakeEmbedding(size=16))
+
+    [document] = embeddings.embed_documents(["فَرَائِضُ الوُضُوءِ سَبْعَةٌ"])
+    assert embeddings.embed_query("فرائض الوضوء سبعه") == document
+
+
+def test_model_receives_the_index_normalization_not_the_cache_key():
+    """
+    La clé du cache (casse, ponctuation finale) ne change pas le texte envoyé au modèle :
+    il reçoit la normalisation d'index, comme les fragments.
+    """
+    model = CountingEmbeddings(size=16)
+    embeddings = CachedEmbeddings(NormalizedEmbeddings(model), model_name="modele-a")
+
+    embeddings.embed_query("Quelle est la règle du Wudu ?")
+    embeddings.embed_query("ما حكم الصَّلاة؟")
+
+    assert model.texts == ["Quelle est la règle du Wudu ?", "ما حكم الصلاه؟"]
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.config import Config
+from src.rag import executors, ingestion, lexical, vectorstore
+from src.rag.executors import get_ingestion_executor, get_interactive_executor, run_ingestion
+from src.rag.ingestion import indexer_fichier_uploade
+from src.rag.lexical import LexicalIndex
+from src.rag.partitions import get_partition
+from src.rag.vectorstore import COLLECTION_NAME
+from tests.helpers import write_text_pdf
+
+
+def test_ingestion_does_not_delay_the_event_loop(tmp_path, monkeypatch):
+    """
+    Pendant l'ingestion réelle d'un PDF de plusieurs pages (extraction, découpage, embeddings,
+    écriture dans ChromaDB), une sonde asyncio.sleep périodique mesure le retard de la boucle :
+    le pire retard reste sous Config.RAG_MAX_LOOP_LAG_MS.
+    """
+    path = str(tmp_path / "chroma")
+    monkeypatch.setattr(Config, "VECTOR_PARTITION_MODE", "document")
+    monkeypatch.setattr(Config, "CHROMA_SERVER_HOST", "")
+    monkeypatch.setattr(vectorstore, "CHROMA_DB_PATH", path)
+    monkeypatch.setattr(vectorstore.marquer_ecriture, "__defaults__", (path,))
+    monkeypatch.setattr(vectorstore._writes_mtime, "__defaults__", (path,))
+    monkeypatch.setattr(vectorstore, "_manifest_mtime", lambda: 0)
+    monkeypatch.setattr(vectorstore, "active_collection_name", lambda: COLLECTION_NAME)
+    monkeypatch.setattr(vectorstore, "_chroma_client", None)
+    monkeypatch.setattr(vectorstore, "_vectorstore", None)
+    monkeypatch.setattr(vectorstore, "_writes_seen", None)
+    monkeypatch.setattr(vectorstore, "_corpus_version", None)
+    monkeypatch.setattr(vectorstore, "get_embedding_function", lambda: DeterministicFakeEmbedding(size=32))
+    monkeypatch.setattr(lexical, "_lexical_index", LexicalIndex(str(tmp_path / "lexical.sqlite3")))
+    threads = []
+    add_documents = ingestion.add_documents_to_vectorstore
+
+    def recorded_add_documents(documents, document_uid=None, start_index=0):
+        threads.append(threading.current_thread().name)
+        add_documents(documents, document_uid=document_uid, start_index=start_index)
+
+    monkeypatch.setattr(ingestion, "add_documents_to_vectorstore", recorded_add_documents)
+    source_file = tmp_path / "fiqh.pdf"
+    write_text_pdf(source_file, pages=Config.PDF_PARALLEL_MIN_PAGES * 2)
+    interval = 0.01
+
+    async def upload():
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(run_ingestion(indexer_fichier_uploade, str(source_file), "doc-1", "fiqh.pdf"))
+        lags = []
+        while not task.done():
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(loop.time() - start - interval)
+        return await task, lags
+
+    try:
+        indexed, lags = asyncio.run(upload())
+        assert indexed > 0 and get_partition(vectorstore.get_chroma_client(), "doc-1").count() == indexed
+    finally:
+        vectorstore._recharger_client()
+
+    assert threads and all(name.startswith("rag-ingestion") for name in threads)
+    assert len(lags) >= 10  # La sonde a tourné pendant toute l'ingestion
+    assert max(lags) * 1000 < Config.RAG_MAX_LOOP_LAG_MS, f"retard maximal de la boucle : {max(lags) * 1000:.0f} ms"
+
+
+def test_pools_are_separate_and_bounded(monkeypatch):
+    """
+    Les pools interactif et d'ingestion sont distincts et limités par la configuration.
+    """
+    monkeypatch.setattr(executors, "_interactive_executor", None)
+    monkeypatch.setattr(executors, "_ingestion_executor", None)
+
+    assert get_interactive_executor() is not get_ingestion_executor()
+    assert get_interactive_executor()._max_workers == Config.RAG_INTERACTIVE_WORKERS
+    assert get_ingestion_executor()._max_workers == Config.RAG_INGESTION_WORKERS
+    executors.shutdown_executors()
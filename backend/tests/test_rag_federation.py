@@ -0,0 +1,101 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag import chain
+from src.rag.federation import SOURCE_METADATA_KEY, fusion_sources, quotas_sources
+from src.rag.lexical import LexicalIndex
+from src.rag.metrics import RagRequestMetrics
+
+
+def _docs(prefix, count, document_uid=None):
+    metadata = {"document_uid": document_uid} if document_uid else {"source": "mukhtasar_khalil.txt"}
+    return [Document(page_content=f"{prefix} {i}", metadata=dict(metadata), id=f"{prefix}_{i}") for i in range(count)]
+
+
+def test_quotas_follow_configured_shares():
+    assert quotas_sources(7, {"uploads": 0.6, "corpus": 0.4}) == {"uploads": 4, "corpus": 3}
+    assert quotas_sources(7, {"uploads": 1.0, "corpus": 0}) == {"uploads": 7, "corpus": 0}
+
+
+def test_merge_respects_quotas_and_tags_sources():
+    """
+    Chaque source fournit au plus son quota ; les fragments sont classés par score normalisé
+    (un fragment trouvé par une seule des deux recherches du corpus ne compte que pour moitié)
+    et marqués de leur source.
+    """
+    uploads = _docs("u", 5, "doc-1")
+    corpus = _docs("c", 5)
+    merged = fusion_sources(
+        {"uploads": [uploads], "corpus": [corpus, [corpus[2]]]}, k=5, shares={"uploads": 0.6, "corpus": 0.4},
+    )
+
+    assert [doc.id for doc in merged] == ["u_0", "c_2", "u_1", "u_2", "c_0"]
+    assert [doc.metadata[SOURCE_METADATA_KEY] for doc in merged] == ["uploads", "corpus", "uploads", "uploads", "corpus"]
+    assert merged[0].metadata["document_uid"] == "doc-1"
+
+
+def test_unused_quota_goes_to_the_other_source():
+    merged = fusion_sources({"uploads": [_docs("u", 5, "doc-1")], "corpus": [_docs("c", 1)]}, k=5,
+                            shares={"uploads": 0.6, "corpus": 0.4})
+    assert [doc.id for doc in merged] == ["u_0", "c_0", "u_1", "u_2", "u_3"]
+
+
+def test_bm25_corpus_search_ignores_uploads(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.upsert(["corpus_0", "a_0", "orphelin_0"], [
+        Document(page_content="فرائض الوضوء سبعة.", metadata={"source": "mukhtasar_khalil.txt", "corpus": True}),
+        Document(page_content="فرائض الوضوء عند الشافعية ستة.", metadata={"document_uid": "a"}),
+        # Ni document ni marque du corpus : absent aussi de la recherche vectorielle du corpus
+        Document(page_content="فرائض الوضوء.", metadata={"source": "ancien.txt"}),
+    ])
+    assert [doc.id for doc in index.search_corpus("فرائض الوضوء", k=5)] == ["corpus_0"]
+
+
+class SlowRetriever:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def invoke(self, query):
+        time.sleep(0.3)
+        return self.documents
+
+
+@pytest.fixture
+def federated(monkeypatch):
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(Config, "RAG_RERANK_ENABLED", False)
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 0.6, "corpus": 0.4})
+
+
+def test_corpus_and_uploads_are_searched_concurrently(federated):
+    """
+    Le corpus et les documents de la conversation sont interrogés en parallèle :
+    la fusion n'ajoute pas la durée d'une recherche à l'autre.
+    """
+    metrics = RagRequestMetrics()
+    with patch.object(chain, "get_filtered_retriever", return_value=SlowRetriever(_docs("u", 7, "doc-1"))), \
+         patch.object(chain, "get_corpus_retriever", return_value=SlowRetriever(_docs("c", 7))):
+        start = time.perf_counter()
+        inputs, sources = asyncio.run(chain._retrieve_context("فرائض الوضوء", ["doc-1"], metrics))
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.55
+    assert len(sources) == chain.RETRIEVER_K
+    assert sum(doc.metadata[SOURCE_METADATA_KEY] == "corpus" for doc in sources) == 3
+    assert metrics.timings_ms["recherche_vecteurs"] >= 300 and metrics.timings_ms["recherche_corpus_vecteurs"] >= 300
+    assert "c 0" in inputs["context"]
+
+
+def test_without_active_documents_only_the_corpus_is_searched(federated):
+    metrics = RagRequestMetrics()
+    with patch.object(chain, "get_filtered_retriever") as uploads_retriever, \
+         patch.object(chain, "get_corpus_retriever", return_value=SlowRetriever(_docs("c", 10))):
+        _, sources = asyncio.run(chain._retrieve_context("فرائض الوضوء", [], metrics))
+
+    uploads_retriever.assert_not_called()
+    assert [doc.id for doc in sources] == [f"c_{i}" for i in range(chain.RETRIEVER_K)]
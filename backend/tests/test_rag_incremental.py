@@ -0,0 +1,266 @@
+import json
+import os
+
+import chromadb
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.config import Config
+from src.rag import incremental
+from src.rag.incremental import INDEX_VERSION, IndexManifest, indexer_incremental, marquer_corpus
+from src.rag.lexical import LexicalIndex
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Modèle factice qui compte les textes réellement calculés."""
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_incremental_indexing_only_touches_changed_files(tmp_path):
+    """
+    Une relance sans modification ne calcule aucun embedding ; un fichier modifié
+    n'est recalculé que pour ses fragments nouveaux ; un fichier supprimé perd ses vecteurs.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    _write(source / "taharah.txt", "باب الطهارة\n\nفرائض الوضوء سبعة.")
+    _write(source / "salat.txt", "باب الصلاة\n\nأوقات الصلاة خمسة.")
+    manifest = str(tmp_path / "manifest.json")
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("incremental-test")
+    except Exception:
+        pass
+    collection = client.create_collection("incremental-test")
+    model = CountingEmbeddings(size=8)
+
+    def run():
+        return indexer_incremental(str(source), manifest, collection=collection,
+                                   embedding_factory=lambda: model, workers=1)
+
+    first = run()
+    assert first.changed_files == 2
+    initial_count = collection.count()
+    embedded = model.texts
+
+    second = run()
+    assert second.unchanged_files == 2 and second.changed_files == 0
+    assert model.texts == embedded
+
+    # Même contenu, date de modification différente : l'empreinte évite le recalcul
+    os.utime(source / "salat.txt", ns=(0, 0))
+    assert run().changed_files == 0
+
+    _write(source / "taharah.txt", "باب الطهارة\n\nنواقض الوضوء.")
+    third = run()
+    assert third.changed_files == 1
+    assert third.deleted_chunks == third.indexed_chunks
+    assert model.texts == embedded + third.indexed_chunks
+    assert collection.count() == initial_count
+
+    os.remove(source / "salat.txt")
+    fourth = run()
+    assert fourth.removed_files == 1
+    assert collection.count() == initial_count - fourth.deleted_chunks
+    assert all("salat" not in metadata["source"] for metadata in collection.get()["metadatas"])
+
+
+def test_interrupted_run_resumes_after_the_last_finished_file(tmp_path, monkeypatch):
+    """
+    Le manifeste est enregistré après chaque fichier : une exécution interrompue
+    ne recalcule à la reprise que les fichiers qu'elle n'avait pas terminés.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    _write(source / "a_taharah.txt", "باب الطهارة\n\nفرائض الوضوء سبعة.")
+    _write(source / "b_salat.txt", "باب الصلاة\n\nأوقات الصلاة خمسة.")
+    manifest = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(Config, "INDEX_EMBED_BATCH_SIZE", 1)
+    monkeypatch.setattr(Config, "INDEX_WRITE_BATCH_SIZE", 1)
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("incremental-resume-test")
+    except Exception:
+        pass
+    collection = client.create_collection("incremental-resume-test")
+
+    class CrashingEmbeddings(CountingEmbeddings):
+        def embed_documents(self, texts):
+            if any("المغرب" in text for text in texts):
+                raise RuntimeError("processus arrêté")
+            return super().embed_documents(texts)
+
+    def run(model):
+        return indexer_incremental(str(source), manifest, collection=collection,
+                                   embedding_factory=lambda: model, workers=1)
+
+    run(CountingEmbeddings(size=8))
+    _write(source / "a_taharah.txt", "باب الطهارة\n\nنواقض الوضوء.")
+    _write(source / "b_salat.txt", "باب الصلاة\n\nوقت المغرب.")
+    with pytest.raises(RuntimeError):
+        run(CrashingEmbeddings(size=8))
+    # a_taharah.txt, terminé avant l'interruption, est enregistré avec son nouveau contenu
+    assert incremental.hash_fichier(str(source / "a_taharah.txt")) == IndexManifest(manifest).files["a_taharah.txt"]["hash"]
+
+    model = CountingEmbeddings(size=8)
+    report = run(model)
+    assert report.unchanged_files == 1 and report.changed_files == 1
+    assert model.texts == report.indexed_chunks
+
+
+def test_failed_file_leaves_no_chunks_outside_the_manifest(tmp_path, monkeypatch):
+    """Les fragments déjà écrits d'un fichier dont la lecture échoue en cours de route sont retirés."""
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    _write(source / "taharah.txt", "باب الطهارة\n\nفرائض الوضوء سبعة.")
+    manifest = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(Config, "INDEX_EMBED_BATCH_SIZE", 1)
+    monkeypatch.setattr(Config, "INDEX_WRITE_BATCH_SIZE", 1)
+    split_windows = incremental.iter_split_windows
+
+    def failing_windows(path):
+        yield from split_windows(path)
+        raise ValueError("page illisible")
+
+    monkeypatch.setattr(incremental, "iter_split_windows", failing_windows)
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("incremental-failure-test")
+    except Exception:
+        pass
+    collection = client.create_collection("incremental-failure-test")
+
+    report = indexer_incremental(str(source), manifest, collection=collection,
+                                 embedding_factory=lambda: CountingEmbeddings(size=8), workers=1)
+
+    assert report.changed_files == 0 and report.indexed_chunks > 0
+    assert report.deleted_chunks == report.indexed_chunks
+    assert collection.count() == 0
+    assert IndexManifest(manifest).files == {}
+
+
+def test_index_version_change_reindexes_everything(tmp_path):
+    """
+    Un manifeste produit par une version antérieure du traitement des textes
+    fait recalculer tous les fragments et retire les anciens vecteurs.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    _write(source / "zakat.txt", "باب الزكاة\n\nالنصاب عشرون دينارا.")
+    manifest = str(tmp_path / "manifest.json")
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("incremental-version-test")
+    except Exception:
+        pass
+    collection = client.create_collection("incremental-version-test")
+    model = CountingEmbeddings(size=8)
+
+    def run():
+        return indexer_incremental(str(source), manifest, collection=collection,
+                                   embedding_factory=lambda: model, workers=1)
+
+    first = run()
+    with open(manifest, encoding="utf-8") as f:
+        data = json.load(f)
+    data["index_version"] = INDEX_VERSION - 1
+    old_id = "ancien-fragment"
+    collection.add(ids=[old_id], embeddings=[[0.0] * 8], documents=["نص قديم"])
+    data["files"]["zakat.txt"]["chunk_ids"].append(old_id)
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    second = run()
+    assert second.changed_files == 1
+    assert second.deleted_chunks == 1
+    assert collection.count() == first.indexed_chunks
+    assert run().changed_files == 0
+
+
+def test_first_run_removes_vectors_indexed_before_the_manifest(tmp_path):
+    """
+    Sans manifeste, l'index peut contenir le corpus indexé avec les anciens IDs
+    ("unknown_<i>") : ils sont supprimés une fois les fragments réindexés sous leurs
+    IDs de contenu, les fragments des documents uploadés sont conservés.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    _write(source / "taharah.txt", "باب الطهارة\n\nفرائض الوضوء سبعة.")
+    manifest = str(tmp_path / "manifest.json")
+    lexical_index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("legacy-ids-test")
+    except Exception:
+        pass
+    collection = client.create_collection("legacy-ids-test")
+    legacy_ids = [f"unknown_{i}" for i in range(5)]
+    collection.add(ids=legacy_ids + ["doc-1_0"], embeddings=[[0.1] * 8] * 6,
+                   documents=["فرائض الوضوء سبعة."] * 6,
+                   metadatas=[{"source": "taharah.txt"}] * 5 + [{"document_uid": "doc-1", "source": "fiqh.txt"}])
+    lexical_index.upsert(legacy_ids, [Document(page_content="فرائض الوضوء سبعة.", metadata={})] * 5)
+
+    model = CountingEmbeddings(size=8)
+    report = indexer_incremental(str(source), manifest, collection=collection, embedding_factory=lambda: model,
+                                 workers=1, lexical_index=lexical_index)
+
+    remaining = set(collection.get(include=[])["ids"])
+    assert remaining.isdisjoint(legacy_ids) and "doc-1_0" in remaining
+    assert len(remaining) == report.indexed_chunks + 1
+    assert report.deleted_chunks == len(legacy_ids)
+    assert lexical_index.count() == report.indexed_chunks
+    # Manifeste enregistré : l'exécution suivante est incrémentale
+    assert indexer_incremental(str(source), manifest, collection=collection, embedding_factory=lambda: model,
+                               workers=1, lexical_index=lexical_index).changed_files == 0
+
+
+def test_corpus_chunks_are_marked_for_federated_search(tmp_path):
+    """
+    Les fragments du corpus portent la marque "corpus" dans ChromaDB et dans l'index lexical ;
+    un index antérieur est marqué à partir du manifeste, sans recalcul des embeddings.
+    """
+    source = tmp_path / "fiqh_docs"
+    source.mkdir()
+    _write(source / "taharah.txt", "باب الطهارة\n\nفرائض الوضوء سبعة.")
+    manifest = str(tmp_path / "manifest.json")
+    lexical_index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("corpus-marker-test")
+    except Exception:
+        pass
+    collection = client.create_collection("corpus-marker-test")
+    model = CountingEmbeddings(size=8)
+    indexer_incremental(str(source), manifest, collection=collection, embedding_factory=lambda: model, workers=1,
+                        lexical_index=lexical_index)
+
+    ids = collection.get(include=[])["ids"]
+    assert ids and collection.get(where={"corpus": True}, include=[])["ids"] == ids
+    assert lexical_index.count(corpus_only=True) == len(ids)
+
+    # Index antérieur : fragments sans marque, et un fragment hors manifeste
+    collection.update(ids=ids, metadatas=[{"corpus": False}] * len(ids))
+    lexical_index.upsert(ids + ["orphelin_0"], [
+        Document(page_content="فرائض الوضوء سبعة.", metadata={}) for _ in range(len(ids) + 1)
+    ])
+    embedded = model.texts
+    assert marquer_corpus(collection, IndexManifest(manifest), lexical_index, batch_size=1) == len(ids)
+    assert sorted(collection.get(where={"corpus": True}, include=[])["ids"]) == sorted(ids)
+    assert sorted(doc.id for doc in lexical_index.search_corpus("الوضوء", k=10)) == sorted(ids)
+    assert lexical_index.search_corpus("الوضوء", k=10)[0].metadata["corpus"] is True
+    assert model.texts == embedded
@@ -0,0 +1,98 @@
+import asyncio
+import sqlite3
+import time
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag import chain
+from src.rag.lexical import LexicalIndex, fusion_rrf, raciner_leger, tokens_lexicaux
+from src.rag.metrics import RagRequestMetrics
+
+
+def _doc(text, document_uid, chunk_id=None):
+    return Document(page_content=text, metadata={"document_uid": document_uid, "source": "fiqh.txt"}, id=chunk_id)
+
+
+def test_lexical_terms_ignore_diacritics_articles_and_suffixes():
+    """
+    Un mot vocalisé avec article et conjonction donne le même terme que sa forme nue.
+    """
+    assert tokens_lexicaux("وَالصَّلَاةُ") == tokens_lexicaux("صلاة")
+    assert tokens_lexicaux("الطهارة") == tokens_lexicaux("طهارة")
+    assert tokens_lexicaux("ما حكم الوضوء في السفر؟") == [raciner_leger("حكم"), "وضوء", "سفر"]
+
+
+def test_bm25_search_is_filtered_by_document(tmp_path):
+    """
+    La recherche BM25 ne retourne que les fragments des documents demandés, meilleur score en premier.
+    """
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.upsert(["a_0", "a_1", "b_0"], [
+        _doc("فَرَائِضُ الوُضُوءِ سَبْعَةٌ: النِّيَّةُ وَغَسْلُ الوَجْهِ.", "a"),
+        _doc("أوقات الصلاة خمسة.", "a"),
+        _doc("فرائض الوضوء عند الشافعية ستة.", "b"),
+    ])
+
+    results = index.search("فرائض الوضوء", ["a"], k=5)
+    assert [doc.id for doc in results] == ["a_0"]
+    assert results[0].metadata["document_uid"] == "a"
+    assert {doc.id for doc in index.search("فرائض الوضوء", ["a", "b"], k=5)} == {"a_0", "b_0"}
+    assert index.search("فرائض الوضوء", [], k=5) == []
+
+    # Remplacement puis suppression d'un fragment
+    index.upsert(["a_0"], [_doc("باب التيمم.", "a")])
+    assert index.search("فرائض الوضوء", ["a"], k=5) == []
+    index.delete(["a_0", "a_1"])
+    assert index.count() == 1
+
+
+def test_rrf_favours_fragments_found_by_both_searches():
+    vector = [_doc("1", "a", "a_1"), _doc("2", "a", "a_2"), _doc("3", "a", "a_3")]
+    lexical = [_doc("3", "a", "a_3"), _doc("4", "a", "a_4")]
+
+    fused = fusion_rrf([vector, lexical], k=3)
+
+    assert [doc.id for doc in fused] == ["a_3", "a_1", "a_2"]
+
+
+def test_hybrid_search_runs_both_searches_concurrently(tmp_path, monkeypatch):
+    """
+    Les recherches vectorielle et BM25 sont lancées en parallèle et leurs durées sont mesurées séparément.
+    """
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", True)
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 1.0})
+
+    class SlowRetriever:
+        def invoke(self, query):
+            time.sleep(0.3)
+            return [_doc("أوقات الصلاة خمسة.", "a", "a_1")]
+
+    class SlowLexicalIndex:
+        def search(self, query, document_uids, k):
+            time.sleep(0.3)
+            return [_doc("فرائض الوضوء سبعة.", "a", "a_0")]
+
+    metrics = RagRequestMetrics()
+    with patch.object(chain, "get_filtered_retriever", return_value=SlowRetriever()), \
+         patch.object(chain, "get_lexical_index", return_value=SlowLexicalIndex()):
+        start = time.perf_counter()
+        _, sources = asyncio.run(chain._retrieve_context("فرائض الوضوء", ["a"], metrics))
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.55
+    assert {doc.id for doc in sources} == {"a_0", "a_1"}
+    assert metrics.timings_ms["recherche_vecteurs"] >= 300 and metrics.timings_ms["recherche_bm25"] >= 300
+
+
+def test_index_created_before_federated_search_gets_corpus_column(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, document_uid TEXT, "
+                       "content TEXT NOT NULL, metadata TEXT NOT NULL, tokens TEXT NOT NULL)")
+    connection.close()
+
+    index = LexicalIndex(path)
+    index.upsert(["corpus_0"], [Document(page_content="فرائض الوضوء سبعة.", metadata={"corpus": True})])
+    assert index.count(corpus_only=True) == 1
@@ -0,0 +1,72 @@
+from pypdf import PdfWriter
+
+from src.rag.loader import (
+    charger_documents,
+    charger_fichier,
+    detecter_type,
+    iter_documents,
+    iter_split_windows,
+    split_documents,
+)
+from tests.helpers import write_text_pdf
+
+
+def _write_pdf(path, pages=2):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_type_detection_prefers_magic_bytes(tmp_path):
+    """
+    Les signatures binaires priment sur l'extension ; les formats texte sont reconnus par l'extension.
+    """
+    _write_pdf(tmp_path / "livre.txt")
+    (tmp_path / "image.txt").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+    (tmp_path / "notes.txt").write_text("باب الطهارة", encoding="utf-8")
+    (tmp_path / "table.csv").write_text("مسألة,حكم\nالوضوء,واجب\n", encoding="utf-8")
+    (tmp_path / "archive.zip").write_bytes(b"PK\x03\x04" + b"\x00" * 64)
+
+    assert detecter_type(str(tmp_path / "livre.txt")) == "pdf"
+    assert detecter_type(str(tmp_path / "image.txt")) is None
+    assert detecter_type(str(tmp_path / "notes.txt")) == "txt"
+    assert detecter_type(str(tmp_path / "table.csv")) == "csv"
+    assert detecter_type(str(tmp_path / "archive.zip")) is None
+
+
+def test_iter_documents_streams_a_single_file(tmp_path):
+    """
+    Un fichier est chargé directement, document par document (une page par document pour un PDF).
+    """
+    _write_pdf(tmp_path / "livre.pdf", pages=3)
+    (tmp_path / "notes.txt").write_text("باب الطهارة", encoding="utf-8")
+
+    pages = iter_documents(str(tmp_path / "livre.pdf"))
+    assert next(pages).metadata["page"] == 0
+    assert len(list(pages)) == 2
+
+    notes = list(iter_documents(str(tmp_path / "notes.txt")))
+    assert len(notes) == 1 and notes[0].metadata["source"].endswith("notes.txt")
+
+    assert len(charger_documents(str(tmp_path))) == 4
+
+
+def test_split_windows_match_full_split_and_stream_pages(tmp_path):
+    """
+    Le découpage par fenêtres produit les mêmes fragments que le découpage complet,
+    sans charger plus d'une fenêtre de pages à la fois.
+    """
+    path = str(tmp_path / "compendium.pdf")
+    write_text_pdf(path, pages=7, lines_per_page=30)
+
+    windows = iter_split_windows(path, pages_per_window=3)
+    first = next(windows)
+    assert {chunk.metadata["page"] for chunk in first} == {0, 1, 2}
+
+    chunks = first + [chunk for window in windows for chunk in window]
+    assert [chunk.page_content for chunk in chunks] == [
+        chunk.page_content for chunk in split_documents(charger_fichier(path))
+    ]
+    assert chunks[-1].metadata["page"] == 6
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+
+import chromadb
+import numpy as np
+import pytest
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag.lexical import LexicalIndex
+from src.rag.maintenance import (
+    CompactionBusyError, basculer_index, compacter_index, ecrire_collection_active, finaliser_compaction, repliquer,
+    requetes_perturbees, vacuum_incremental, verrou_index,
+)
+from src.rag.partitions import ecrire_partition, get_partition, partition_name, supprimer_partitions
+from src.rag.vectorstore import COLLECTION_NAME, active_collection_name
+
+
+def _add_chunks(collection, document_uids, per_document=5):
+    ids = [f"{uid}_{i}" for uid in document_uids for i in range(per_document)]
+    collection.add(
+        ids=ids,
+        embeddings=[[float(n % 7), float(n % 3), 1.0] for n in range(len(ids))],
+        documents=[f"فرائض الوضوء {chunk_id}" for chunk_id in ids],
+        metadatas=[{"document_uid": chunk_id.split("_")[0]} for chunk_id in ids],
+    )
+    return ids
+
+
+def test_active_collection_defaults_to_main_collection(tmp_path):
+    assert active_collection_name(str(tmp_path)) == COLLECTION_NAME
+    ecrire_collection_active(str(tmp_path), "fiqh_maliki_20260101000000")
+    assert active_collection_name(str(tmp_path)) == "fiqh_maliki_20260101000000"
+
+
+def test_compaction_keeps_live_chunks_and_swaps_collection(tmp_path):
+    """
+    La compaction copie les fragments vivants (sans les supprimés) dans une nouvelle
+    collection, bascule la collection active puis supprime l'ancienne et son segment.
+    """
+    persist_directory = str(tmp_path / "chroma")
+    client = chromadb.PersistentClient(path=persist_directory, settings=Settings(anonymized_telemetry=False))
+    old = client.create_collection(COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+    _add_chunks(old, ["a", "b", "c", "d"])
+    old.delete(where={"document_uid": {"$in": ["a", "b"]}})
+    old.query(query_embeddings=[[1.0, 1.0, 1.0]], n_results=3)  # Segment HNSW chargé et persisté
+    live_ids = set(old.get(include=[])["ids"])
+    lexical_index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+
+    report = compacter_index(client, persist_directory, lexical_index, grace_seconds=0)
+
+    new_name = active_collection_name(persist_directory)
+    assert new_name == report.collection_after != COLLECTION_NAME
+    assert list(client.list_collections()) == [new_name]
+    new = client.get_collection(new_name)
+    assert set(new.get(include=[])["ids"]) == live_ids
+    assert new.metadata == {"hnsw:space": "cosine"}
+    hit = new.query(query_embeddings=[[1.0, 1.0, 1.0]], n_results=1, where={"document_uid": "c"})
+    assert hit["ids"][0] and hit["ids"][0][0].startswith("c_")
+    assert report.before.chunks == report.after.chunks == len(live_ids)
+    assert report.after.sqlite_free_bytes == 0
+
+    segments = {row[0] for row in sqlite3.connect(os.path.join(persist_directory, "chroma.sqlite3"))
+                .execute("SELECT id FROM segments")}
+    assert {name for name in os.listdir(persist_directory)
+            if os.path.isdir(os.path.join(persist_directory, name))} <= segments
+
+
+def test_writes_during_grace_period_are_kept(tmp_path):
+    """
+    Pendant le délai de grâce, les processus ayant rechargé écrivent dans la nouvelle collection :
+    la finalisation ne reporte que les écritures reçues par l'ancienne depuis la bascule.
+    """
+    persist_directory = str(tmp_path / "chroma")
+    client = chromadb.PersistentClient(path=persist_directory, settings=Settings(anonymized_telemetry=False))
+    old = client.create_collection(COLLECTION_NAME)
+    _add_chunks(old, ["a", "b", "d"], per_document=1)
+
+    report = basculer_index(client, persist_directory)
+    new = client.get_collection(active_collection_name(persist_directory))
+    # Processus rechargés : ajout de "c", suppression de "a" dans la nouvelle collection
+    _add_chunks(new, ["c"], per_document=1)
+    new.delete(ids=["a_0"])
+    # Processus pas encore rechargé : ajout de "e", suppression de "d" dans l'ancienne
+    _add_chunks(old, ["e"], per_document=1)
+    old.delete(ids=["d_0"])
+
+    assert finaliser_compaction(report.collection_before, client, persist_directory, vacuum=False) == 2
+
+    assert sorted(new.get(include=[])["ids"]) == ["b_0", "c_0", "e_0"]
+    assert list(client.list_collections()) == [new.name]
+    assert not any(name.endswith(".retired.json") for name in os.listdir(persist_directory))
+
+
+def test_compaction_cleans_partitions_in_document_mode(tmp_path, monkeypatch):
+    """
+    En mode "document", la compaction récupère l'espace des partitions supprimées (segments et
+    pages SQLite) et supprime les partitions restées vides depuis la bascule ; une partition
+    remplie pendant le délai de grâce est conservée.
+    """
+    monkeypatch.setattr(Config, "VECTOR_PARTITION_MODE", "document")
+    persist_directory = str(tmp_path / "chroma")
+    client = chromadb.PersistentClient(path=persist_directory, settings=Settings(anonymized_telemetry=False))
+    _add_chunks(client.create_collection(COLLECTION_NAME), ["corpus"])
+    for document_uid in ("a", "b"):
+        documents = [Document(page_content=f"{document_uid} {i}", metadata={"document_uid": document_uid})
+                     for i in range(50)]
+        ecrire_partition(client, document_uid, [f"{document_uid}_{i}" for i in range(50)],
+                         [[float(i), 1.0, float(i % 3)] for i in range(50)], documents)
+        get_partition(client, document_uid).query(query_embeddings=[[1.0, 1.0, 1.0]], n_results=3)
+    for document_uid in ("empty", "late"):
+        get_partition(client, document_uid, create=True)
+
+    # Suppression par un autre processus, dans lequel les segments de la partition ne sont pas chargés
+    SharedSystemClient.clear_system_cache()
+    client = chromadb.PersistentClient(path=persist_directory, settings=Settings(anonymized_telemetry=False))
+    assert supprimer_partitions(client, ["b"]) == 50
+
+    report = basculer_index(client, persist_directory)
+    assert report.empty_partitions == sorted([partition_name("empty"), partition_name("late")])
+    ecrire_partition(client, "late", ["late_0"], [[1.0, 0.0, 0.0]], [Document(page_content="late")])
+    finaliser_compaction(report.collection_before, client, persist_directory,
+                         lexical_index=LexicalIndex(str(tmp_path / "lexical.sqlite3")))
+
+    assert sorted(client.list_collections()) == sorted(
+        [report.collection_after, partition_name("a"), partition_name("late")]
+    )
+    hit = get_partition(client, "a").query(query_embeddings=[[1.0, 1.0, 1.0]], n_results=1)
+    assert hit["ids"][0] and hit["ids"][0][0].startswith("a_")
+    chroma_sqlite = os.path.join(persist_directory, "chroma.sqlite3")
+    segments = {row[0] for row in sqlite3.connect(chroma_sqlite).execute("SELECT id FROM segments")}
+    assert {name for name in os.listdir(persist_directory)
+            if os.path.isdir(os.path.join(persist_directory, name))} <= segments
+    assert sqlite3.connect(chroma_sqlite).execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert not any(name.endswith(".json") for name in os.listdir(persist_directory))
+
+
+def test_replication_applies_additions_and_deletions():
+    client = chromadb.EphemeralClient()
+    for name in ("replication-source", "replication-target"):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    source = client.create_collection("replication-source")
+    target = client.create_collection("replication-target")
+    _add_chunks(source, ["a", "b"])
+    repliquer(source, target, batch_size=3)
+
+    # Écritures reçues par la collection active pendant la copie
+    source.delete(where={"document_uid": "a"})
+    _add_chunks(source, ["c"])
+
+    assert repliquer(source, target, batch_size=3) == 10
+    assert set(target.get(include=[])["ids"]) == set(source.get(include=[])["ids"])
+    copied = target.get(ids=["c_0"], include=["embeddings", "documents", "metadatas"])
+    assert copied["metadatas"][0] == {"document_uid": "c"} and len(copied["embeddings"][0]) == 3
+    assert repliquer(source, target) == 0
+
+
+def test_latency_queries_are_not_stored_embeddings():
+    """Les requêtes de mesure ne retrouvent pas exactement leur fragment (distance non nulle)."""
+    stored = np.random.default_rng(1).standard_normal((4, 16))
+    queries = np.array(requetes_perturbees(stored, noise=0.3))
+
+    assert not np.allclose(queries, stored)
+    assert np.allclose(np.linalg.norm(queries, axis=1), np.linalg.norm(stored, axis=1), rtol=1e-5)
+    distances = np.linalg.norm(queries - stored, axis=1) / np.linalg.norm(stored, axis=1)
+    assert np.all((distances > 0.2) & (distances < 0.4))
+
+
+def test_incremental_vacuum_releases_free_pages(tmp_path):
+    path = str(tmp_path / "base.sqlite3")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE t (x TEXT)")
+        connection.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,) for _ in range(2000)])
+    with connection:
+        connection.execute("DELETE FROM t")
+    connection.close()
+    size = os.path.getsize(path)
+
+    # Première passe : conversion en auto_vacuum incrémental
+    assert vacuum_incremental(path, step_pages=50) > size // 2
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,) for _ in range(500)])
+    with connection:
+        connection.execute("DELETE FROM t")
+    assert connection.execute("PRAGMA freelist_count").fetchone()[0] > 0
+    connection.close()
+
+    assert vacuum_incremental(path, step_pages=50) > 0
+    assert sqlite3.connect(path).execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_compaction_is_refused_while_indexing(tmp_path):
+    with verrou_index(str(tmp_path)):
+        with pytest.raises(CompactionBusyError):
+            with verrou_index(str(tmp_path), exclusive=True):
+                pass
+    with verrou_index(str(tmp_path), exclusive=True):
+        pass
+
+
+def test_active_collection_is_reread_on_an_interval(monkeypatch):
+    """Les recherches ne relisent le fichier de collection active qu'une fois par intervalle ; les écritures toujours."""
+    from src.config import Config
+    from src.rag import vectorstore
+
+    reads = []
+    monkeypatch.setattr(vectorstore, "active_collection_name", lambda: reads.append(1) or COLLECTION_NAME)
+    monkeypatch.setattr(Config, "ACTIVE_COLLECTION_CHECK_SECONDS", 3600)
+    monkeypatch.setattr(vectorstore, "_active_collection_checked_at", float("-inf"))
+
+    for _ in range(3):
+        vectorstore._refresh_after_swap()
+    vectorstore._refresh_after_swap(force=True)
+    assert len(reads) == 2
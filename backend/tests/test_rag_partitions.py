@@ -0,0 +1,95 @@
+import threading
+
+import chromadb
+import pytest
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag import partitions
+from src.rag.partitions import (
+    PartitionedRetriever, ecrire_partition, get_partition, migrer_vers_partitions, partition_name,
+    supprimer_partitions,
+)
+
+
+class AxisEmbeddings:
+    """Embeddings de test : la question "q" vise le premier axe."""
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+
+@pytest.fixture
+def client():
+    client = chromadb.EphemeralClient()
+    for name in client.list_collections():
+        client.delete_collection(name)
+    return client
+
+
+def _documents(document_uid, count):
+    return [Document(page_content=f"{document_uid} {i}", metadata={"document_uid": document_uid}) for i in range(count)]
+
+
+def test_partition_name_fits_chroma_limits():
+    name = partition_name("f" * 64)
+    assert 3 <= len(name) <= 63 and name == partition_name("f" * 64) != partition_name("e" * 64)
+
+
+def test_retriever_queries_only_active_partitions(client):
+    """
+    Seules les partitions des documents actifs sont interrogées ; les résultats sont
+    fusionnés par distance, et un document non partitionné est cherché dans la collection partagée.
+    """
+    ecrire_partition(client, "a", ["a_0", "a_1"], [[0.9, 0.1, 0.0], [0.2, 0.8, 0.0]], _documents("a", 2))
+    ecrire_partition(client, "b", ["b_0"], [[0.95, 0.0, 0.05]], _documents("b", 1))
+    ecrire_partition(client, "c", ["c_0"], [[1.0, 0.0, 0.0]], _documents("c", 1))
+    shared = client.create_collection("fiqh_maliki")
+    shared.add(ids=["legacy_0", "corpus_0"], embeddings=[[0.5, 0.5, 0.0], [1.0, 0.0, 0.0]],
+               documents=["legacy 0", "corpus 0"], metadatas=[{"document_uid": "legacy"}, {"source": "corpus"}])
+
+    retriever = PartitionedRetriever(client=client, embeddings=AxisEmbeddings(), document_uids=("a", "b", "legacy"),
+                                     k=3, shared_collection=shared)
+
+    assert [doc.id for doc in retriever.invoke("q")] == ["b_0", "a_0", "legacy_0"]
+    assert PartitionedRetriever(client=client, embeddings=AxisEmbeddings(), document_uids=(), k=3).invoke("q") == []
+
+
+def test_partitions_are_queried_concurrently(client, monkeypatch):
+    """Les trois partitions sont interrogées en même temps, pas l'une après l'autre."""
+    for document_uid in ("a", "b", "c"):
+        ecrire_partition(client, document_uid, [f"{document_uid}_0"], [[1.0, 0.0, 0.0]], _documents(document_uid, 1))
+    query = partitions._query
+    # Ne s'ouvre que si les trois recherches sont en cours simultanément
+    barrier = threading.Barrier(3, timeout=5)
+
+    def concurrent_query(*args, **kwargs):
+        barrier.wait()
+        return query(*args, **kwargs)
+
+    monkeypatch.setattr(partitions, "_query", concurrent_query)
+    monkeypatch.setattr(Config, "VECTOR_PARTITION_SEARCH_WORKERS", 4)
+    retriever = PartitionedRetriever(client=client, embeddings=AxisEmbeddings(), document_uids=("a", "b", "c"), k=3)
+
+    assert {doc.id for doc in retriever.invoke("q")} == {"a_0", "b_0", "c_0"}
+
+
+def test_migration_moves_uploads_out_of_shared_collection(client):
+    shared = client.create_collection("fiqh_maliki")
+    shared.add(ids=["u_0", "u_1", "corpus_0"], embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+               documents=["u 0", "u 1", "corpus 0"],
+               metadatas=[{"document_uid": "u"}, {"document_uid": "u"}, {"source": "corpus"}])
+
+    assert migrer_vers_partitions(client, shared, batch_size=1) == {"u": 2}
+
+    assert shared.get(include=[])["ids"] == ["corpus_0"]
+    partition = get_partition(client, "u")
+    moved = partition.get(ids=["u_1"], include=["embeddings", "documents", "metadatas"])
+    assert partition.count() == 2 and partition.metadata == {"document_uid": "u"}
+    assert moved["documents"] == ["u 1"] and list(moved["embeddings"][0]) == [0.0, 1.0, 0.0]
+
+
+def test_deleting_partitions(client):
+    ecrire_partition(client, "a", ["a_0", "a_1"], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], _documents("a", 2))
+    assert supprimer_partitions(client, ["a", "absent"]) == 2
+    assert get_partition(client, "a") is None
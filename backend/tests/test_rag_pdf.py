@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from langchain_community.document_loaders import PyPDFLoader
+
+from src.rag import pdf
+from src.rag.pdf import ParallelPyPDFLoader, shutdown_pdf_executor
+from tests.helpers import write_text_pdf
+
+
+def test_parallel_extraction_matches_pypdf_loader(tmp_path):
+    """
+    L'extraction répartie sur plusieurs processus donne les mêmes pages, dans le même
+    ordre et avec les mêmes métadonnées que PyPDFLoader, et mesure chaque page.
+    """
+    path = str(tmp_path / "mudawwana.pdf")
+    write_text_pdf(path, pages=9, lines_per_page=10)
+
+    loader = ParallelPyPDFLoader(path, workers=2, pages_per_shard=2, min_pages=0)
+    try:
+        pages = list(loader.lazy_load())
+    finally:
+        shutdown_pdf_executor()
+    expected = PyPDFLoader(path).load()
+
+    assert [page.page_content for page in pages] == [page.page_content for page in expected]
+    assert [page.metadata for page in pages] == [page.metadata for page in expected]
+    assert sorted(loader.page_seconds) == list(range(9))
+
+
+def test_daemon_process_extracts_through_billiard_pool(tmp_path, monkeypatch):
+    """
+    Dans un processus démon (worker Celery prefork, qui indexe les uploads),
+    l'extraction reste parallèle, sur le pool billiard.
+    """
+    path = str(tmp_path / "upload.pdf")
+    write_text_pdf(path, pages=6, lines_per_page=10)
+    monkeypatch.setattr(pdf.multiprocessing, "current_process", lambda: SimpleNamespace(daemon=True))
+
+    try:
+        pages = list(ParallelPyPDFLoader(path, workers=2, pages_per_shard=2, min_pages=0).lazy_load())
+        assert pdf._pdf_daemon_pool is not None and pdf._pdf_executor is None
+    finally:
+        shutdown_pdf_executor()
+    assert [page.page_content for page in pages] == [page.page_content for page in PyPDFLoader(path).load()]
+
+
+def test_sequential_extraction_opens_the_pdf_once(tmp_path, monkeypatch):
+    """Sans pool (petit PDF), toutes les plages sont lues avec le même lecteur."""
+    path = str(tmp_path / "court.pdf")
+    write_text_pdf(path, pages=6, lines_per_page=10)
+    opened = []
+    reader = pdf.pypdf.PdfReader
+    monkeypatch.setattr(pdf.pypdf, "PdfReader", lambda *args, **kwargs: opened.append(args) or reader(*args, **kwargs))
+
+    pages = list(ParallelPyPDFLoader(path, workers=2, pages_per_shard=2, min_pages=100).lazy_load())
+
+    assert len(pages) == 6
+    assert len(opened) == 1
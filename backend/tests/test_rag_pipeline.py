@@ -0,0 +1,77 @@
+import chromadb
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.pipeline import index_documents
+
+
+def fake_embeddings():
+    """Fabrique picklable utilisée par les processus du pool."""
+    return DeterministicFakeEmbedding(size=8)
+
+
+class FailingEmbeddings(DeterministicFakeEmbedding):
+    """Simule un arrêt brutal après un certain nombre de lots."""
+    remaining_batches: int = 2
+
+    def embed_documents(self, texts):
+        if self.remaining_batches == 0:
+            raise RuntimeError("arrêt simulé")
+        self.remaining_batches -= 1
+        return super().embed_documents(texts)
+
+
+def _chunks(count):
+    docs = [Document(page_content=f"فقرة فقهية رقم {i}", metadata={"source": "fiqh.txt"}) for i in range(count)]
+    return docs, [f"fiqh.txt_{i}" for i in range(count)]
+
+
+def _collection(name):
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    return client.create_collection(name)
+
+
+def test_interrupted_indexing_resumes_without_starting_over():
+    """
+    Après un arrêt en cours d'indexation, une relance n'indexe que les fragments manquants.
+    """
+    collection = _collection("pipeline-reprise")
+    docs, ids = _chunks(10)
+
+    with pytest.raises(RuntimeError):
+        index_documents(
+            docs, ids, collection=collection, embedding_factory=lambda: FailingEmbeddings(size=8),
+            embed_batch_size=3, write_batch_size=3, workers=1
+        )
+    assert collection.count() == 6
+
+    report = index_documents(
+        docs, ids, collection=collection, embedding_factory=fake_embeddings,
+        embed_batch_size=3, write_batch_size=3, workers=1
+    )
+    assert report.skipped == 6
+    assert report.indexed == 4
+    assert collection.count() == 10
+
+
+def test_process_pool_indexes_all_chunks():
+    """
+    Avec un pool de processus, tous les fragments sont indexés avec leurs métadonnées.
+    """
+    collection = _collection("pipeline-pool")
+    docs, ids = _chunks(25)
+
+    report = index_documents(
+        docs, ids, collection=collection, embedding_factory=fake_embeddings,
+        embed_batch_size=4, write_batch_size=10, workers=2
+    )
+
+    assert report.indexed == 25
+    stored = collection.get(ids=["fiqh.txt_24"])
+    assert stored["documents"] == ["فقرة فقهية رقم 24"]
+    assert stored["metadatas"] == [{"source": "fiqh.txt"}]
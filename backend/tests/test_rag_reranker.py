@@ -0,0 +1,104 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag import chain, reranker
+from src.rag.metrics import RagRequestMetrics
+from src.rag.reranker import CrossEncoderReranker
+
+PASSAGES = [
+    "أوقات الصلاة خمسة.",
+    "فرائض الوضوء سبعة: النية وغسل الوجه.",
+    "زكاة الفطر صاع من غالب قوت البلد.",
+    "نواقض الوضوء أحداث وأسباب.",
+    "التيمم بالصعيد الطاهر.",
+]
+
+
+def overlap_scorer(pairs):
+    """Cross-encoder factice : nombre de mots de la question présents dans le fragment."""
+    return [len(set(question.split()) & set(text.split())) for question, text in pairs]
+
+
+class FakeRetriever:
+    def invoke(self, query):
+        return [Document(page_content=text, metadata={"document_uid": "doc-1"}) for text in PASSAGES]
+
+
+@pytest.fixture(autouse=True)
+def rerank_enabled(monkeypatch):
+    monkeypatch.setattr(Config, "RAG_RERANK_ENABLED", True)
+    monkeypatch.setattr(Config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(Config, "RAG_RERANK_TOP_N", 2)
+    monkeypatch.setattr(Config, "RAG_SOURCE_QUOTAS", {"uploads": 1.0})
+
+
+def test_reranker_keeps_the_best_fragments():
+    documents = FakeRetriever().invoke("")
+    ranked = CrossEncoderReranker(overlap_scorer, batch_size=2).rank("فرائض الوضوء سبعة", documents, top_n=2)
+
+    assert [doc.page_content for doc in ranked] == [PASSAGES[1], PASSAGES[3]]
+
+
+def test_reranker_stops_at_the_deadline():
+    documents = FakeRetriever().invoke("")
+    assert CrossEncoderReranker(overlap_scorer).rank("الوضوء", documents, 2, deadline=time.monotonic() - 1) is None
+
+
+def test_batches_are_sized_to_fit_the_remaining_budget():
+    """Un lot ne peut pas être interrompu : il ne contient que les paires qui tiennent avant l'échéance."""
+    batch_sizes = []
+
+    def timed_scorer(pairs):
+        batch_sizes.append(len(pairs))
+        time.sleep(0.05 * len(pairs))
+        return overlap_scorer(pairs)
+
+    documents = FakeRetriever().invoke("")
+    start = time.monotonic()
+    ranked = CrossEncoderReranker(timed_scorer, batch_size=8).rank(
+        "الوضوء", documents, 2, deadline=start + 0.18
+    )
+    elapsed = time.monotonic() - start
+
+    assert ranked is None
+    # Une paire pour mesurer la latence, puis un lot limité aux 2 paires qui tiennent encore
+    assert batch_sizes == [1, 2]
+    assert elapsed < 0.25
+
+
+def test_retrieval_keeps_reranked_fragments(monkeypatch):
+    monkeypatch.setattr(reranker, "_reranker", CrossEncoderReranker(overlap_scorer))
+    metrics = RagRequestMetrics()
+    with patch.object(chain, "get_filtered_retriever", return_value=FakeRetriever()):
+        inputs, sources = asyncio.run(chain._retrieve_context("فرائض الوضوء سبعة", ["doc-1"], metrics))
+
+    assert [doc.page_content for doc in sources] == [PASSAGES[1], PASSAGES[3]]
+    assert metrics.reranked is True and "reclassement" in metrics.timings_ms
+    assert PASSAGES[0] not in inputs["context"]
+
+
+def test_retrieval_falls_back_to_search_order_when_over_budget(monkeypatch):
+    """
+    Un reclassement trop lent est abandonné à l'échéance : l'ordre de la recherche est conservé.
+    """
+    monkeypatch.setattr(Config, "RAG_RERANK_BUDGET_MS", 100)
+
+    def slow_scorer(pairs):
+        time.sleep(0.5)
+        return overlap_scorer(pairs)
+
+    monkeypatch.setattr(reranker, "_reranker", CrossEncoderReranker(slow_scorer, batch_size=1))
+    metrics = RagRequestMetrics()
+    with patch.object(chain, "get_filtered_retriever", return_value=FakeRetriever()):
+        start = time.perf_counter()
+        _, sources = asyncio.run(chain._retrieve_context("فرائض الوضوء سبعة", ["doc-1"], metrics))
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.4
+    assert [doc.page_content for doc in sources] == PASSAGES[:chain.RETRIEVER_K]
+    assert metrics.reranked is False
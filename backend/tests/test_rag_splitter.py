@@ -0,0 +1,43 @@
+from src.rag.splitter import ArabicTokenSplitter
+
+
+def count_words(texts):
+    """Compteur factice : un token par mot."""
+    return [len(text.split()) for text in texts]
+
+
+def test_chunks_follow_arabic_sentences_within_token_budget():
+    """
+    Les fragments regroupent des phrases entières (؟ ۔ .) sans dépasser la limite de tokens,
+    et se chevauchent de phrases entières.
+    """
+    sentences = [
+        "ما حكم الوضوء قبل الصلاة؟",
+        "الوضوء شرط في صحة الصلاة۔",
+        "فرائضه سبعة عند المالكية.",
+        "وسننه ثمان.",
+        "ونواقضه أحداث وأسباب.",
+    ]
+    splitter = ArabicTokenSplitter(count_words, chunk_size=8, chunk_overlap=3)
+    chunks = splitter.split_text(" ".join(sentences))
+
+    assert chunks[:3] == sentences[:2] + ["فرائضه سبعة عند المالكية. وسننه ثمان."]
+    # Chevauchement : la dernière phrase courte du fragment précédent est reprise
+    assert chunks[3] == "وسننه ثمان. ونواقضه أحداث وأسباب."
+    assert all(len(chunk.split()) <= 8 for chunk in chunks)
+
+
+def test_long_sentences_fall_back_to_clauses_then_words():
+    """
+    Une phrase trop longue est coupée aux virgules arabes, puis aux mots si nécessaire.
+    """
+    clauses = "النية، وغسل الوجه، وغسل اليدين إلى المرفقين، ومسح الرأس، وغسل الرجلين"
+    words = " ".join(["كلمة"] * 25)
+    splitter = ArabicTokenSplitter(count_words, chunk_size=6, chunk_overlap=0)
+
+    chunks = splitter.split_text(clauses)
+    assert chunks[0] == "النية، وغسل الوجه،"
+    assert all(len(chunk.split()) <= 6 for chunk in chunks)
+
+    chunks = splitter.split_text(words)
+    assert [len(chunk.split()) for chunk in chunks] == [6, 6, 6, 6, 1]
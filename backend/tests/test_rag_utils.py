@@ -1,6 +1,6 @@
 import pytest
 from unittest.mock import patch, mock_open
-from src.rag.utils import pretraiter_texte_arabe, ArabicTextLoader
+from src.rag.utils import normaliser_texte_arabe, pretraiter_texte_arabe, ArabicTextLoader
 from langchain.schema import Document
 
 def test_pretraiter_texte_arabe():
@@ -48,4 +48,21 @@ def test_arabic_text_loader_error(mock_file):
         loader.load()
     
     assert "Erreur lors de la lecture du fichier" in str(excinfo.value)
-    assert "missing_file.txt" in str(excinfo.value)
\ No newline at end of file
+    assert "missing_file.txt" in str(excinfo.value)
+
+def test_normaliser_texte_arabe_pour_index():
+    """
+    Teste la normalisation d'index : diacritiques, tatweel, alif, alif maqsura et ta marbuta.
+    """
+    assert normaliser_texte_arabe("إِلَى الصَّـــلاةِ  الْمَكْتُوبَةِ") == "الي الصلاه المكتوبه"
+    assert normaliser_texte_arabe("أحكام آل") == "احكام ال"
+    # Les formes de présentation sont ramenées aux lettres de base
+    assert normaliser_texte_arabe("\ufefb") == "لا"
+
+@patch("builtins.open", new_callable=mock_open, read_data="فَرَائِضُ الوُضُوءِ")
+def test_arabic_text_loader_keeps_logical_order(mock_file):
+    """
+    Le chargeur n'applique pas la mise en forme d'affichage (reshape, ordre visuel).
+    """
+    document = ArabicTextLoader("test_file.txt").load()[0]
+    assert document.page_content == "فَرَائِضُ الوُضُوءِ"
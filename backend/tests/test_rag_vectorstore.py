@@ -0,0 +1,88 @@
+import multiprocessing
+
+import chromadb
+from chromadb.config import Settings
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.rag import vectorstore
+from src.rag.lexical import LexicalIndex
+from src.rag.vectorstore import COLLECTION_NAME, delete_documents_from_vectorstore, marquer_ecriture
+
+
+def _ecrire_dans_un_autre_processus(path):
+    # Worker Celery : son propre client embarqué sur la même base
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    client.get_collection(COLLECTION_NAME).add(
+        ids=["upload_0"], embeddings=[[0.0, 1.0, 0.0]], metadatas=[{"document_uid": "upload"}],
+    )
+    marquer_ecriture(path)
+
+
+def test_deleting_documents_removes_all_their_chunks(tmp_path):
+    """
+    Tous les fragments des documents supprimés quittent la collection et l'index lexical,
+    par requêtes filtrées successives ; les autres documents sont conservés.
+    """
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("delete-test")
+    except Exception:
+        pass
+    collection = client.create_collection("delete-test")
+    lexical_index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+
+    ids, texts, metadatas = [], [], []
+    for document_uid in ("a", "b", "c"):
+        for i in range(4):
+            ids.append(f"{document_uid}_{i}")
+            texts.append(f"فرائض الوضوء {i}")
+            metadatas.append({"document_uid": document_uid, "source": "fiqh.txt"})
+    collection.add(ids=ids, documents=texts, metadatas=metadatas,
+                   embeddings=[[float(i), 1.0, 0.0] for i in range(len(ids))])
+    lexical_index.upsert(ids, [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
+    assert collection.count() == 12
+
+    deleted = delete_documents_from_vectorstore(["a", "b", "absent"], collection=collection,
+                                                lexical_index=lexical_index, batch_size=2)
+
+    assert deleted == 8
+    assert collection.count() == 4 and lexical_index.count() == 4
+    assert set(collection.get(include=[])["ids"]) == {f"c_{i}" for i in range(4)}
+    assert delete_documents_from_vectorstore([], collection=collection) == 0
+
+
+def test_writes_from_another_process_become_searchable(tmp_path, monkeypatch):
+    """
+    Un document indexé par un autre processus (worker) devient interrogeable dans l'API
+    sans redémarrage : le client embarqué est rechargé après l'écriture signalée.
+    """
+    path = str(tmp_path / "chroma")
+    monkeypatch.setattr(vectorstore, "CHROMA_DB_PATH", path)
+    monkeypatch.setattr(vectorstore, "active_collection_name", lambda: COLLECTION_NAME)
+    monkeypatch.setattr(vectorstore, "_manifest_mtime", lambda: 0)
+    monkeypatch.setattr(vectorstore._writes_mtime, "__defaults__", (path,))
+    monkeypatch.setattr(vectorstore, "_chroma_client", None)
+    monkeypatch.setattr(vectorstore, "_vectorstore", None)
+    monkeypatch.setattr(vectorstore, "_writes_seen", None)
+    monkeypatch.setattr(vectorstore, "_corpus_version", None)
+    monkeypatch.setattr(Config, "CHROMA_SERVER_HOST", "")
+    monkeypatch.setattr(Config, "ACTIVE_COLLECTION_CHECK_SECONDS", 0)
+
+    vectorstore.get_collection().add(ids=["corpus_0"], embeddings=[[1.0, 0.0, 0.0]], metadatas=[{"source": "fiqh"}])
+    vectorstore._refresh_after_swap()
+    # Segment chargé en mémoire par l'API
+    assert vectorstore.get_collection().query(query_embeddings=[[0.0, 1.0, 0.0]], n_results=1)["ids"] == [["corpus_0"]]
+
+    writer = multiprocessing.get_context("spawn").Process(target=_ecrire_dans_un_autre_processus, args=(path,))
+    writer.start()
+    writer.join(timeout=60)
+    assert writer.exitcode == 0
+
+    try:
+        vectorstore._refresh_after_swap()
+        collection = vectorstore.get_collection()
+        assert collection.count() == 2
+        assert collection.query(query_embeddings=[[0.0, 1.0, 0.0]], n_results=1)["ids"] == [["upload_0"]]
+    finally:
+        vectorstore._recharger_client()
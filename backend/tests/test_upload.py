@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from src.config import Config
+from src.conversations.service import ConversationService
+from src.errors import FileTooLarge
+from src.middleware import UploadSizeLimitMiddleware
+
+
+def _upload(content: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename="fiqh.txt")
+
+
+def test_upload_is_written_in_chunks_with_hash(tmp_path, monkeypatch):
+    """
+    Le fichier est écrit à son emplacement définitif avec sa taille et son empreinte SHA-256.
+    """
+    monkeypatch.setattr(Config, "UPLOAD_CHUNK_SIZE", 7)
+    content = "باب الطهارة وفرائض الوضوء".encode("utf-8") * 10
+    destination = str(tmp_path / "fiqh.txt")
+
+    size, content_hash = asyncio.run(ConversationService().save_upload_file(_upload(content), destination))
+
+    assert size == len(content)
+    assert content_hash == hashlib.sha256(content).hexdigest()
+    assert open(destination, "rb").read() == content
+
+
+def test_oversized_upload_is_rejected_without_leftovers(tmp_path, monkeypatch):
+    """
+    Un fichier trop volumineux est refusé pendant l'écriture et aucun fichier ne reste sur le disque.
+    """
+    monkeypatch.setattr(Config, "UPLOAD_MAX_FILE_SIZE", 100)
+    monkeypatch.setattr(Config, "UPLOAD_CHUNK_SIZE", 16)
+    destination = str(tmp_path / "fiqh.txt")
+
+    with pytest.raises(FileTooLarge):
+        asyncio.run(ConversationService().save_upload_file(_upload(b"x" * 500), destination))
+    assert os.listdir(tmp_path) == []
+
+
+def test_identical_uploads_share_one_stored_file(tmp_path, monkeypatch):
+    """
+    Deux uploads de même contenu sont rangés au même emplacement, nommé par leur empreinte.
+    """
+    monkeypatch.setattr(Config, "UPLOAD_DIR", str(tmp_path))
+    service = ConversationService()
+    content = "باب الطهارة وفرائض الوضوء".encode("utf-8")
+    stored = []
+    for name in ("a.txt", "b.txt"):
+        size, content_hash = asyncio.run(service.save_upload_file(_upload(content), str(tmp_path / name)))
+        stored.append(service.store_blob(str(tmp_path / name), content_hash, "fiqh.TXT"))
+
+    assert stored[0] == stored[1] == os.path.join("blobs", content_hash[:2], f"{content_hash}.txt")
+    assert open(tmp_path / stored[0], "rb").read() == content
+    assert sorted(os.listdir(tmp_path)) == ["blobs"]
+
+
+def test_middleware_rejects_oversized_request_bodies():
+    """
+    Les corps trop volumineux sont refusés (413), avec ou sans en-tête Content-Length.
+    """
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_size=1000)
+
+    @app.post("/conversations/{uid}/upload")
+    async def upload(uid: str, files: list[UploadFile] = File(...)):
+        return {"count": len(files)}
+
+    client = TestClient(app)
+    small = client.post("/conversations/1/upload", files={"files": ("a.txt", b"x" * 100)})
+    assert small.status_code == 200
+
+    declared = client.post("/conversations/1/upload", files={"files": ("a.txt", b"x" * 5000)})
+    assert declared.status_code == 413
+
+    def chunked_body():
+        for _ in range(50):
+            yield b"x" * 100
+
+    streamed = client.post(
+        "/conversations/1/upload", content=chunked_body(),
+        headers={"content-type": "multipart/form-data; boundary=limite"}
+    )
+    assert streamed.status_code == 413